@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 人群频率预过滤, 在所有模块之前运行
+                   build: 由 1000G / gnomAD (vcf 的 INFO AF, 或 chrom pos ref alt af 表格) 构建每个基因组版本一份的等长记录索引
+                          (<gedition>.afidx, 按 chrom/pos/等位基因排序, 每条记录 18 字节), 来源文件变化时自动重建
+                   filter: 以内存映射方式读取索引, 每个家系 vcf 只读一遍, 按各模块的频率阈值同时输出过滤后的 vcf
+                           任一 alt 满足阈值即保留, 索引中没有的变异视为罕见
+      To run : python3 afprefilter.py build|filter [options]
+      e.g.:
+            python3 afprefilter.py -x afindex -g hg19 -s 1000g:ALL.sites.vcf.gz -s gnomAD:gnomad.sites.vcf.gz build
+            python3 afprefilter.py -x afindex -g hg19 -s 1000g:ALL.sites.vcf.gz filter -o odir/prefilter -t CMsiteOnly_Case:0.01:0.01 -t FARVAT:0.05:1 -i F1.vcf.gz\033[0m
+'''
+
+import os
+import sys
+import re
+import gzip
+import json
+import mmap
+import zlib
+import heapq
+import fcntl
+import struct
+import tempfile
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from annocache import annovar_key
+from shardjob import dependence_ends
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+## chrom编号, 位置, 等位基因crc32, 1000g AF, gnomAD AF (缺失为 -1) ##
+RECORD = struct.Struct('<HIIff')
+POPULATIONS = ('1000g','gnomAD')
+
+def open_text(file):
+    return gzip.open(file,'rt') if file.endswith('.gz') else open(file)
+
+def norm_chrom(chrom):
+    return chrom[3:] if chrom.lower().startswith('chr') else chrom
+
+def allele_key(chrom,pos,ref,alt):
+    chrom,pos,ref,alt = annovar_key(norm_chrom(chrom),pos,ref,alt)
+    return chrom,pos,zlib.crc32('{0}>{1}'.format(ref,alt).encode())
+
+def read_source(file):
+    """yield (chrom,pos,ref,alt,af) from a sites vcf (INFO AF) or a chrom/pos/ref/alt/af table"""
+    with open_text(file) as IN:
+        for line in IN:
+            if line.startswith('#'):
+                continue
+            items = line.rstrip('\n').split('\t')
+            if len(items) >= 8 and '=' in items[7]:
+                af = re.search(r'(?:^|;)AF=([^;]+)',items[7])
+                if not af:
+                    continue
+                for alt,value in zip(items[4].split(','),af.group(1).split(',')):
+                    try:
+                        yield items[0],items[1],items[3],alt,float(value)
+                    except ValueError:
+                        continue
+            elif len(items) >= 5:
+                try:
+                    yield items[0],items[1],items[2],items[3],float(items[4])
+                except ValueError:
+                    continue
+
+def source_signature(sources):
+    return {name:[path,os.path.getsize(path),int(os.path.getmtime(path))] for name,path in sources.items()}
+
+def sorted_runs(sources,chroms,tmpdir,chunk=5000000):
+    """external sort: yield file names of sorted runs of packed records"""
+    buffer = []
+    def flush():
+        buffer.sort()
+        run = tempfile.NamedTemporaryFile(dir=tmpdir,suffix='.run',delete=False)
+        with run:
+            for record in buffer:
+                run.write(RECORD.pack(*record))
+        del buffer[:]
+        return run.name
+    for index,population in enumerate(POPULATIONS):
+        if population not in sources:
+            continue
+        for chrom,pos,ref,alt,af in read_source(sources[population]):
+            chrom,pos,crc = allele_key(chrom,pos,ref,alt)
+            code = chroms.setdefault(chrom,len(chroms))
+            afs = [-1.0,-1.0]
+            afs[index] = af
+            buffer.append((code,pos,crc,afs[0],afs[1]))
+            if len(buffer) >= chunk:
+                yield flush()
+    if buffer:
+        yield flush()
+
+def read_run(file):
+    with open(file,'rb') as IN:
+        while True:
+            block = IN.read(RECORD.size * 65536)
+            if not block:
+                break
+            for record in RECORD.iter_unpack(block):
+                yield record
+
+def build_index(indexdir,gedition,sources):
+    """build <gedition>.afidx unless its sources are unchanged; return index file"""
+    if not os.path.exists(indexdir):
+        os.makedirs(indexdir)
+    index = os.path.join(indexdir,'{0}.afidx'.format(gedition))
+    meta = index + '.json'
+    with open(index + '.lock','w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        signature = source_signature(sources)
+        if os.path.isfile(meta) and os.path.isfile(index):
+            with open(meta) as IN:
+                if json.load(IN)['sources'] == signature:
+                    return index
+        chroms,offsets = OrderedDict(),{}
+        runs = list(sorted_runs(sources,chroms,indexdir))
+        names = {code:chrom for chrom,code in chroms.items()}
+        count,last = 0,None
+        with open(index + '.tmp','wb') as OUT:
+            for record in heapq.merge(*[read_run(i) for i in runs]):
+                if last and last[:3] == record[:3]:
+                    last = last[:3] + (max(last[3],record[3]),max(last[4],record[4]))
+                    continue
+                if last:
+                    OUT.write(RECORD.pack(*last))
+                    count += 1
+                    offsets.setdefault(names[last[0]],[count - 1,count])[1] = count
+                last = record
+            if last:
+                OUT.write(RECORD.pack(*last))
+                count += 1
+                offsets.setdefault(names[last[0]],[count - 1,count])[1] = count
+        for run in runs:
+            os.remove(run)
+        os.rename(index + '.tmp',index)
+        with open(meta,'w') as OUT:
+            json.dump({'sources':signature,'chroms':chroms,'offsets':offsets,'records':count},OUT)
+    return index
+
+class AFIndex(object):
+    """memory-mapped binary search over the sorted records"""
+    def __init__(self,index):
+        with open(index + '.json') as IN:
+            meta = json.load(IN)
+        self.chroms = meta['chroms']
+        self.offsets = meta['offsets']
+        self.handle = open(index,'rb')
+        self.data = mmap.mmap(self.handle.fileno(),0,access=mmap.ACCESS_READ) if meta['records'] else b''
+
+    def lookup(self,chrom,pos,ref,alt):
+        """(af1000g,afgnomAD), -1 when absent"""
+        chrom,pos,crc = allele_key(chrom,pos,ref,alt)
+        if chrom not in self.offsets:
+            return -1.0,-1.0
+        low,high = self.offsets[chrom]
+        code = self.chroms[chrom]
+        target = (code,pos,crc)
+        while low < high:
+            mid = (low + high) // 2
+            if RECORD.unpack_from(self.data,mid * RECORD.size)[:3] < target:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.offsets[chrom][1]:
+            record = RECORD.unpack_from(self.data,low * RECORD.size)
+            if record[:3] == target:
+                return record[3],record[4]
+        return -1.0,-1.0
+
+def passes(afs,thresholds):
+    return all(af < 0 or limit is None or af <= limit for af,limit in zip(afs,thresholds))
+
+def filter_vcf(afindex,vcf,outputs):
+    """outputs: {output vcf:(max 1000g AF, max gnomAD AF)}; single pass over vcf"""
+    handles = {i:open(i,'w') for i in outputs}
+    kept = {i:0 for i in outputs}
+    with open_text(vcf) as IN:
+        for line in IN:
+            if line.startswith('#'):
+                for handle in handles.values():
+                    handle.write(line)
+                continue
+            items = line.split('\t',5)
+            afs = [afindex.lookup(items[0],items[1],items[3],alt) for alt in items[4].split(',')]
+            for output,thresholds in outputs.items():
+                if any(passes(i,thresholds) for i in afs):
+                    handles[output].write(line)
+                    kept[output] += 1
+    for handle in handles.values():
+        handle.close()
+    return kept
+
+def prefilter_dataset(vcf2peddataset,thresholds,outdir):
+    """write outdir/<module>.vcf2peddataset per module; return ({module:dataset},[vcf])"""
+    with open(vcf2peddataset) as IN:
+        lines = IN.readlines()
+    vcfs = []
+    for line in lines:
+        for item in line.split():
+            if item.endswith(('.vcf','.vcf.gz')) and item not in vcfs:
+                vcfs.append(item)
+    datasets = {}
+    for module in thresholds:
+        filtered = {vcf:filtered_vcf(outdir,module,vcf,index) for index,vcf in enumerate(vcfs)}
+        datasets[module] = os.path.join(outdir,'{0}.vcf2peddataset'.format(module))
+        with open(datasets[module],'w') as OUT:
+            for line in lines:
+                OUT.write(re.sub(r'\S+',lambda m: filtered.get(m.group(0),m.group(0)),line))
+    return datasets,vcfs
+
+def filtered_vcf(outdir,module,vcf,index):
+    return os.path.join(outdir,module,'{0}.{1}.vcf'.format(index,re.sub(r'\.vcf(\.gz)?$','',os.path.basename(vcf))))
+
+def prefilter_dependence(depfile,prefilter_job):
+    """append prefilter -> first steps of a module"""
+    sources = dependence_ends(depfile)[0]
+    with open(depfile,'a') as OUT:
+        for source in sources:
+            OUT.write('{0}\t{1}\n'.format(prefilter_job,source))
+
+def parse_threshold(value):
+    """Module:max1000g:maxgnomAD, '-' for no limit"""
+    items = value.split(':')
+    limits = [None if i in ('','-') else float(i) for i in (items[1:] + ['-','-'])[:2]]
+    return items[0],tuple(limits)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-x','--indexdir',help="index directory",dest='indexdir',type=str,required=True)
+    parser.add_argument('-g','--gedition',help="genome edition, e.g. hg19",dest='gedition',type=str,required=True)
+    parser.add_argument('-s','--source',help="population:file, population is 1000g or gnomAD",dest='source',type=str,action='append',required=True)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('build',help='build the allele frequency index')
+    filter_parser = subparsers.add_parser('filter',help='filter vcf files for every module threshold')
+    filter_parser.add_argument('-i','--input',help="vcf files",dest='input',type=str,nargs='+',required=True)
+    filter_parser.add_argument('-t','--threshold',help="Module:max1000g:maxgnomAD, '-' for no limit",dest='threshold',type=str,action='append',required=True)
+    filter_parser.add_argument('-o','--outdir',help="output directory",dest='outdir',type=str,required=True)
+    argv = vars(parser.parse_args())
+
+    sources = dict(i.split(':',1) for i in argv['source'])
+    unknown = set(sources) - set(POPULATIONS)
+    if unknown:
+        sys.stderr.write('\033[1;31;40mafprefilter - ERROR - unknown population {0}\033[0m\n'.format(', '.join(sorted(unknown))))
+        exit(1)
+    index = build_index(argv['indexdir'],argv['gedition'],sources)
+    if argv['command'] == 'filter':
+        afindex = AFIndex(index)
+        thresholds = OrderedDict(parse_threshold(i) for i in argv['threshold'])
+        for module in thresholds:
+            if not os.path.exists(os.path.join(argv['outdir'],module)):
+                os.makedirs(os.path.join(argv['outdir'],module))
+        for number,vcf in enumerate(argv['input']):
+            outputs = {filtered_vcf(argv['outdir'],module,vcf,number):limits for module,limits in thresholds.items()}
+            kept = filter_vcf(afindex,vcf,outputs)
+            print ('{0}\t{1}'.format(vcf,'\t'.join('{0}: {1}'.format(i,kept[i]) for i in outputs)))
+
+if __name__ == '__main__':
+    main()
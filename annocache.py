@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: InterVar 注释缓存 (SQLite), 键为 (基因组版本, 数据库版本, chrom, pos, ref, alt, vcf记录摘要), chrom 去掉 chr 前缀, pos/ref/alt 使用 ANNOVAR 坐标
+                   缓存完整的注释行 (含 Otherinfo, 即 ANNOVAR 由 vcf 记录生成的 zygosity/QUAL/depth 及 vcf 各列), 命中时原样补回,
+                   因此只有同一条 vcf 记录 (同一家系在不同批次或重跑中) 才会命中
+                   split: 只读缓存, 把 vcf 拆分为缓存未命中的 vcf (交给 Intervar_run) 和命中的注释行
+                   merge: 不访问缓存, 读取 Intervar_run 的输出 (<prefix>.<build>_multianno.txt.intervar), 按 vcf 记录顺序补回命中的注释行, 新注释写入 <name>.new.tsv
+                   load: 所有 merge 结束后把新注释载入缓存并更新命中记录的使用时间, 缓存超过 -n 条时按最近使用时间淘汰; 缓存文件只由本步骤写入
+                   purge: 删除本基因组版本下其他数据库版本的注释 (不同数据库版本的项目可共用缓存文件, 不会自动删除)
+                   数据库版本由 database_intervar/database_locat 下文件的名称, 大小和修改时间计算
+                   缓存文件使用默认的回滚日志 (不使用 WAL), 应放在本地磁盘; 集群节点上的 split/merge 不写缓存
+      To run : python3 annocache.py split|merge|load|purge [options]
+      e.g.:
+            python3 annocache.py -c cache.sqlite -g hg19 -d database_intervar database_locat -n 50000000 split -o odir/annocache -i F1.vcf.gz F2.vcf.gz
+            python3 annocache.py -c cache.sqlite -g hg19 -d database_intervar database_locat -n 50000000 merge -s Intervar_run.sh
+            python3 annocache.py -c cache.sqlite -g hg19 -d database_intervar database_locat -n 50000000 load -o odir/annocache\033[0m
+'''
+
+import os
+import sys
+import re
+import gzip
+import time
+import hashlib
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import read_dependence
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+def open_text(file,mode='rt'):
+    return gzip.open(file,mode) if file.endswith('.gz') else open(file,mode)
+
+def database_version(paths):
+    """name/size/mtime digest of the annotation database directories"""
+    md5 = hashlib.md5()
+    for path in paths:
+        for root,dirs,files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                st = os.stat(os.path.join(root,name))
+                md5.update('{0}:{1}:{2}'.format(os.path.relpath(os.path.join(root,name),path),st.st_size,int(st.st_mtime)).encode())
+    return md5.hexdigest()
+
+def normal_chrom(chrom):
+    """chr1 / 1 -> 1, chrM / M -> MT: ANNOVAR output may drop the chr prefix of the vcf"""
+    chrom = re.sub(r'^chr','',chrom,flags=re.IGNORECASE)
+    return 'MT' if chrom.upper() == 'M' else chrom
+
+def annovar_key(chrom,pos,ref,alt):
+    """VCF allele -> ANNOVAR (chrom,start,ref,alt), as convert2annovar.pl does"""
+    pos = int(pos)
+    while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+        ref,alt = ref[:-1],alt[:-1]
+    while ref and alt and ref[0] == alt[0]:
+        ref,alt,pos = ref[1:],alt[1:],pos + 1
+    if not ref:
+        pos -= 1
+    return normal_chrom(chrom),pos,ref or '-',alt or '-'
+
+def result_key(items):
+    """(chrom,start,ref,alt) of an ANNOVAR/InterVar output row"""
+    return normal_chrom(items[0]),int(items[1]),items[3],items[4]
+
+def record_digest(record):
+    """digest of the vcf record fields an annotation row was generated from"""
+    return hashlib.md5('\t'.join(record).encode()).hexdigest()
+
+class AnnotationCache(object):
+    def __init__(self,dbfile,gedition,dbversion,maxrows=50000000,readonly=False):
+        self.gedition = gedition
+        self.dbversion = dbversion
+        self.maxrows = maxrows
+        if readonly:
+            ## 集群节点上只读打开, 不创建也不写入缓存文件 ##
+            self.conn = sqlite3.connect('file:{0}?mode=ro'.format(os.path.abspath(dbfile)),uri=True,timeout=600) if os.path.isfile(dbfile) else None
+            return
+        self.conn = sqlite3.connect(dbfile,timeout=600)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS anno (gedition TEXT, dbversion TEXT, chrom TEXT, pos INTEGER, ref TEXT, alt TEXT, record TEXT, row TEXT, atime REAL, PRIMARY KEY (gedition,dbversion,chrom,pos,ref,alt,record))')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS anno_atime ON anno (atime)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS header (gedition TEXT, dbversion TEXT, header TEXT, PRIMARY KEY (gedition,dbversion))')
+
+    def invalidate(self):
+        """drop annotations of other database versions of this genome edition"""
+        with self.conn:
+            removed = self.conn.execute('DELETE FROM anno WHERE gedition = ? AND dbversion != ?',(self.gedition,self.dbversion)).rowcount
+            self.conn.execute('DELETE FROM header WHERE gedition = ? AND dbversion != ?',(self.gedition,self.dbversion))
+        return removed
+
+    def header(self):
+        if not self.conn:
+            return None
+        row = self.conn.execute('SELECT header FROM header WHERE gedition = ? AND dbversion = ?',(self.gedition,self.dbversion)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self,keys):
+        """{key:row} for cached keys (chrom,pos,ref,alt,record)"""
+        found = {}
+        if not self.conn:
+            return found
+        for key in keys:
+            row = self.conn.execute('SELECT row FROM anno WHERE gedition = ? AND dbversion = ? AND chrom = ? AND pos = ? AND ref = ? AND alt = ? AND record = ?',(self.gedition,self.dbversion) + key).fetchone()
+            if row:
+                found[key] = row[0]
+        return found
+
+    def touch(self,keys):
+        """refresh the access time of keys"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany('UPDATE anno SET atime = ? WHERE gedition = ? AND dbversion = ? AND chrom = ? AND pos = ? AND ref = ? AND alt = ? AND record = ?',[(now,self.gedition,self.dbversion) + key for key in keys])
+
+    def store(self,header,rows):
+        """rows: [(key,row)]"""
+        now = time.time()
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO header VALUES (?,?,?)',(self.gedition,self.dbversion,header))
+            self.conn.executemany('INSERT OR REPLACE INTO anno VALUES (?,?,?,?,?,?,?,?,?)',[(self.gedition,self.dbversion) + key + (row,now) for key,row in rows])
+
+    def evict(self):
+        """evict least recently used rows beyond maxrows"""
+        with self.conn:
+            total = self.conn.execute('SELECT COUNT(*) FROM anno').fetchone()[0]
+            if total > self.maxrows:
+                self.conn.execute('DELETE FROM anno WHERE rowid IN (SELECT rowid FROM anno ORDER BY atime LIMIT ?)',(total - self.maxrows,))
+        return max(0,total - self.maxrows)
+
+def cache_files(outdir,vcf,index):
+    """miss vcf, hits and new annotations of the index-th vcf"""
+    name = re.sub(r'\.vcf(\.gz)?$','',os.path.basename(vcf))
+    return tuple(os.path.join(outdir,'{0}.{1}.{2}'.format(index,name,i)) for i in ('miss.vcf','hits.tsv','new.tsv'))
+
+def cache_dataset(vcf2peddataset,outdir):
+    """write outdir/vcf2peddataset pointing at the miss vcf of every vcf; return (dataset,[vcf])"""
+    with open(vcf2peddataset) as IN:
+        lines = IN.readlines()
+    vcfs = []
+    for line in lines:
+        for item in line.split():
+            if item.endswith(('.vcf','.vcf.gz')) and item not in vcfs:
+                vcfs.append(item)
+    miss = {vcf:cache_files(outdir,vcf,index)[0] for index,vcf in enumerate(vcfs)}
+    dataset = os.path.join(outdir,'vcf2peddataset')
+    with open(dataset,'w') as OUT:
+        for line in lines:
+            OUT.write(re.sub(r'\S+',lambda m: miss.get(m.group(0),m.group(0)),line))
+    return dataset,vcfs
+
+def record_keys(record):
+    """cache keys of every alt allele of a vcf record"""
+    digest = record_digest(record)
+    return [annovar_key(record[0],record[1],record[3],alt) + (digest,) for alt in record[4].split(',')]
+
+def split_vcf(dbfile,gedition,dbversion,vcf,miss,hits,chunk=10000):
+    """write records with any uncached alt allele to miss; for cached records write
+       index (record number in vcf) and key columns plus the cached row to hits
+    """
+    cache = AnnotationCache(dbfile,gedition,dbversion,readonly=True)
+    nhit = nmiss = index = 0
+    with open_text(vcf) as IN, open(miss,'w') as MISS, open(hits,'w') as HITS:
+        def flush(records,first):
+            nhit = nmiss = 0
+            found = cache.lookup([key for r in records for key in record_keys(r)])
+            for index,r in enumerate(records,first):
+                rkeys = record_keys(r)
+                if all(key in found for key in rkeys):
+                    for key in rkeys:
+                        HITS.write('{0}\t{1}\t{2}\n'.format(index,'\t'.join(str(i) for i in key),found[key]))
+                    nhit += 1
+                else:
+                    MISS.write('\t'.join(r) + '\n')
+                    nmiss += 1
+            return nhit,nmiss
+        records = []
+        for line in IN:
+            if line.startswith('#'):
+                MISS.write(line)
+                continue
+            records.append(line.rstrip('\n').split('\t'))
+            if len(records) >= chunk:
+                counts = flush(records,index)
+                nhit,nmiss,index,records = nhit + counts[0],nmiss + counts[1],index + len(records),[]
+        counts = flush(records,index)
+    return vcf,nhit + counts[0],nmiss + counts[1]
+
+def intervar_io(shell):
+    """parse input vcf and output file of an Intervar_run shell (Intervar.py -i <vcf> -o <prefix> -b <build>)"""
+    with open(shell) as IN:
+        text = IN.read()
+    vcf = re.search(r'(?:^|\s)(?:-i|--input)[ =](\S+)',text)
+    prefix = re.search(r'(?:^|\s)(?:-o|--output)[ =](\S+)',text)
+    build = re.search(r'(?:^|\s)(?:-b|--buildver)[ =](\S+)',text)
+    if not vcf or not prefix:
+        return None,None
+    return vcf.group(1),'{0}.{1}_multianno.txt.intervar'.format(prefix.group(1),build.group(1) if build else 'hg19')
+
+def read_hits(hits):
+    """[(index,key,row)] of a hits file"""
+    found = []
+    if os.path.isfile(hits):
+        with open(hits) as IN:
+            for line in IN:
+                items = line.rstrip('\n').split('\t',6)
+                found.append((int(items[0]),(items[1],int(items[2]),items[3],items[4],items[5]),items[6]))
+    return found
+
+def merge_rows(miss,hits,IN):
+    """merge the cached hits into the rows of IN (result without header) in vcf record order;
+       return ([row],[(key,row)] new annotations,number of hit rows)
+    """
+    hits = read_hits(hits)
+    hitindex = set(i[0] for i in hits)
+    ## 未命中记录在原 vcf 中的序号: 依次为不属于命中记录的序号 ##
+    keys,index = {},-1
+    with open(miss) as MISSIN:
+        for line in MISSIN:
+            if line.startswith('#'):
+                continue
+            index += 1
+            while index in hitindex:
+                index += 1
+            for key in record_keys(line.rstrip('\n').split('\t')):
+                keys.setdefault(key[:4],[]).append((index,key))
+    rows,new,last = [],[],-1
+    for line in IN:
+        items = line.rstrip('\n').split('\t')
+        if len(items) < 5:
+            continue
+        match = keys.get(result_key(items))
+        if match:
+            last,key = match.pop(0) if len(match) > 1 else match[0]
+            new.append((key,line.rstrip('\n')))
+        rows.append((last,line.rstrip('\n')))
+    rows.extend((index,row) for index,key,row in hits)
+    ## 按记录序号稳定排序, 同一记录的多个 alt 保持原顺序 ##
+    rows.sort(key=lambda i: i[0])
+    return [i[1] for i in rows],new,len(hits)
+
+def merge_result(shell):
+    """merge the cached hits of one Intervar_run input back into its output and write its new annotations"""
+    vcf,result = intervar_io(shell)
+    if not vcf or not vcf.endswith('.miss.vcf') or not os.path.isfile(result):
+        return 0
+    hits,newfile = vcf[:-len('.miss.vcf')] + '.hits.tsv',vcf[:-len('.miss.vcf')] + '.new.tsv'
+    ## 重跑本步骤而 Intervar_run 未重跑时不重复合并 ##
+    merged = result + '.cachemerged'
+    if os.path.isfile(merged) and os.path.getmtime(merged) >= os.path.getmtime(result):
+        return 0
+    with open(result) as IN:
+        header = IN.readline().rstrip('\n')
+        rows,new,nhit = merge_rows(vcf,hits,IN)
+    with open(result + '.tmp','w') as OUT:
+        OUT.write(header + '\n')
+        for row in rows:
+            OUT.write(row + '\n')
+    with open(newfile,'w') as OUT:
+        OUT.write(header + '\n')
+        for key,row in new:
+            OUT.write('{0}\t{1}\n'.format('\t'.join(str(i) for i in key),row))
+    os.replace(result + '.tmp',result)
+    open(merged,'w').close()
+    return nhit
+
+def load_results(dbfile,gedition,dbversion,outdir,maxrows):
+    """load every new annotation file of outdir into the cache and refresh the hits; the only writer of the cache"""
+    cache = AnnotationCache(dbfile,gedition,dbversion,maxrows)
+    nnew = nhit = 0
+    for file in sorted(os.listdir(outdir)):
+        path = os.path.join(outdir,file)
+        if file.endswith('.new.tsv'):
+            with open(path) as IN:
+                header = IN.readline().rstrip('\n')
+                rows = []
+                for line in IN:
+                    items = line.rstrip('\n').split('\t',5)
+                    rows.append(((items[0],int(items[1]),items[2],items[3],items[4]),items[5]))
+            cache.store(header,rows)
+            nnew += len(rows)
+        elif file.endswith('.hits.tsv'):
+            keys = [key for index,key,row in read_hits(path)]
+            cache.touch(keys)
+            nhit += len(keys)
+    return nnew,nhit,cache.evict()
+
+def splice_dependence(depfile,split_job,cachecmd,outdir,memory='1G'):
+    """rewrite a module dependence file: split -> first steps, Intervar_run -> merge -> former downstream steps, every merge -> load"""
+    jobs,upstream = read_dependence([depfile])
+    merges = {}
+    for shell in jobs:
+        if 'Intervar_run' in os.path.basename(shell):
+            merges[shell] = os.path.join(outdir,'merge.{0}.{1}'.format(len(merges),os.path.basename(shell)))
+            with open(merges[shell],'w') as OUT:
+                OUT.write('{0} merge -s {1}\n'.format(cachecmd,shell))
+    load = os.path.join(outdir,'load.sh')
+    with open(load,'w') as OUT:
+        OUT.write('{0} load -o {1}\n'.format(cachecmd,outdir))
+    job = lambda shell: '{0}:{1}'.format(shell,jobs.get(shell,memory))
+    with open(depfile,'w') as OUT:
+        for shell in jobs:
+            if not upstream[shell]:
+                OUT.write('{0}\t{1}\n'.format(split_job,job(shell)))
+            for up in sorted(upstream[shell]):
+                OUT.write('{0}\t{1}\n'.format(job(merges.get(up,up)),job(shell)))
+            if shell in merges:
+                OUT.write('{0}\t{1}\n'.format(job(shell),job(merges[shell])))
+                OUT.write('{0}\t{1}\n'.format(job(merges[shell]),job(load)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-c','--cache',help="cache sqlite file",dest='cache',type=str,required=True)
+    parser.add_argument('-g','--gedition',help="genome edition, e.g. hg19",dest='gedition',type=str,required=True)
+    parser.add_argument('-d','--database',help="database_intervar and database_locat directories",dest='database',type=str,nargs='+',required=True)
+    parser.add_argument('-n','--maxrows',help="max cached variants [default: 50000000]",dest='maxrows',type=int,default=50000000)
+    subparsers = parser.add_subparsers(dest='command')
+    split_parser = subparsers.add_parser('split',help='split vcf into cache hits and misses')
+    split_parser.add_argument('-i','--input',help="vcf files",dest='input',type=str,nargs='+',required=True)
+    split_parser.add_argument('-o','--outdir',help="output directory",dest='outdir',type=str,required=True)
+    split_parser.add_argument('-p','--processes',help="parallel processes [default: 4]",dest='processes',type=int,default=4)
+    merge_parser = subparsers.add_parser('merge',help='merge cached hits back into Intervar_run output')
+    merge_parser.add_argument('-s','--shell',help="Intervar_run shell",dest='shell',type=str,required=True)
+    load_parser = subparsers.add_parser('load',help='load new annotations of every merge into the cache')
+    load_parser.add_argument('-o','--outdir',help="split output directory",dest='outdir',type=str,required=True)
+    subparsers.add_parser('purge',help='drop annotations of other database versions')
+    argv = vars(parser.parse_args())
+
+    dbversion = database_version(argv['database'])
+    if argv['command'] == 'split':
+        with ProcessPoolExecutor(max_workers=max(1,argv['processes'])) as pool:
+            futures = []
+            for index,vcf in enumerate(argv['input']):
+                miss,hits,new = cache_files(argv['outdir'],vcf,index)
+                futures.append(pool.submit(split_vcf,argv['cache'],argv['gedition'],dbversion,vcf,miss,hits))
+            for future in futures:
+                print ('{0}\thit: {1}\tmiss: {2}'.format(*future.result()))
+    elif argv['command'] == 'merge':
+        print ('{0}\tmerged hits: {1}'.format(argv['shell'],merge_result(argv['shell'])))
+    elif argv['command'] == 'load':
+        print ('{0}\tnew: {1}\thits: {2}\tevicted: {3}'.format(argv['outdir'],*load_results(argv['cache'],argv['gedition'],dbversion,argv['outdir'],argv['maxrows'])))
+    elif argv['command'] == 'purge':
+        print ('{0}\tpurged: {1}'.format(argv['cache'],AnnotationCache(argv['cache'],argv['gedition'],dbversion,argv['maxrows']).invalidate()))
+    else:
+        parser.print_help()
+        exit(1)
+
+if __name__ == '__main__':
+    main()
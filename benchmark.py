@@ -0,0 +1,465 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 编排层扩展性基准测试 (合成多家系队列 + 桩模块)
+                   cohort: 生成合成 vcf2peddataset/familyhpo, 每个家系一个 vcf.gz (-s 个样本, -v 个变异, 变异取自共享位点池) 与 ped (首个子代患病)
+                   modules: 生成 InterVar/CMsiteOnly_Case/Exomiser/FARVAT/pVAAST/Candigene_integration 桩模块目录 (moduledir/<模块>/bin),
+                            命令行与真实模块相同, 按 vcf2peddataset 输出同样结构的 shell 与 list/<模块>_dependence.txt:
+                            InterVar/CMsiteOnly_Case/Exomiser 按家系, FARVAT/pVAAST 按 22 条染色体, Candigene_integration 整个队列
+                            (读取 list 中其他模块的依赖, 写出其末端步骤到 candigenescreen 的依赖边);
+                            步骤名与 [<模块>_memory] 一致, 每个步骤 sleep -t 秒 (FARVAT/pVAAST 按家系数折算), 内存申请 -m
+                   merge: 合并各模块依赖为 all_dependence.txt, 同时写出 all_dependence.modules
+                   run: 对每个队列规模 (-n, 默认 10 100 1000 10000 个家系) 依次运行并计时以下阶段, 每个阶段为一个子进程, 以 os.wait4 记录墙钟时间与峰值内存:
+                        cohort      生成输入
+                        dependence  六个桩模块生成 shell 与依赖文件
+                        merge       合并依赖图 (记录步骤数与依赖边数)
+                        shard       shardjob.py 按每 100 个家系分片
+                        genostore   genostore.py 构建列式基因型存储
+                        localmonitor/supervisor  两种本机调度器运行整个依赖图 (-t 0 时即为每个步骤的调度开销)
+                        e2e         主流程 multifamily-based.disease.screen.py 以 local 调度完整运行 (模块生成, 依赖合并, 调度), 记录主流程生成的依赖图大小;
+                                    ../lib/PipMethod 不存在时在工作目录写入最小 PipMethod (myconf/generateShell/mkdir) 经 PYTHONPATH 使用
+                        结果写入 -o 目录 benchmark.tsv, -b 给出基线时比较
+                   compare: 比较结果与基线, 耗时或峰值内存超过基线 (1 + --tolerance) 倍且差值超过 1s/50M 的阶段记为 REGRESSION 并以非0退出
+                   基线结果见 benchmark/baseline.tsv (首行注释为运行环境, 每行记录 cpu 数与调度并行数 -p, -p 不超过 cpu 数; 与基线 cpu/-p 不同时 compare 给出 WARNING)
+      To run : python3 benchmark.py cohort|modules|merge|run|compare [options]
+      e.g.:
+            python3 benchmark.py run -o bench -p 1 -b benchmark/baseline.tsv
+            python3 benchmark.py run -o bench -n 10 100 -t Exomiser:0.5 -t InterVar:0.2
+            python3 benchmark.py compare -i bench/benchmark.tsv -b benchmark/baseline.tsv\033[0m
+'''
+
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import random
+import platform
+import subprocess
+import importlib.util
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import read_dependence,format_memory,parse_memory
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+## 桩模块: (运行单位, 每个单位的步骤, 汇总步骤) ##
+MODULES = OrderedDict([
+    ('InterVar',('family',['Intervar_run','family_integrate','add_genotype'],['all_intergrate'])),
+    ('CMsiteOnly_Case',('family',['rarebasic','familyscreen'],['pathogenityscreen','gnomADscreen','stat'])),
+    ('Exomiser',('family',['exomconfig','exomrun','exomfilter'],['stat'])),
+    ('FARVAT',('region',['prepedvcf','snpvcfmerge','farvat'],['stat'])),
+    ('pVAAST',('region',['vcftocdr','pVAAST1'],['pVAAST2','stat'])),
+    ('Candigene_integration',('cohort',[],['candigenescreen','digGenetanno'])),
+])
+## 主流程读取的 [<模块>_memory] 键 ##
+MEMORY_KEYS = OrderedDict([
+    ('InterVar',['Intervar_run','family_integrate','add_genotype','all_intergrate','upload']),
+    ('CMsiteOnly_Case',['rarebasic','familyscreen','pathogenityscreen','gnomADscreen','stat','upload']),
+    ('Exomiser',['exomconfig','exomrun','exomfilter','stat','upload']),
+    ('FARVAT',['prepedvcf','snpvcfmerge','farvat','stat','upload']),
+    ('pVAAST',['vcftocdr','pVAASTConfig','pVAAST1','genefocus','pVAAST2','stat','upload']),
+    ('Candigene_integration',['candigenescreen','gene2entrezid-intervar','digGenetanno','upload']),
+])
+CHROMS = ['chr{0}'.format(i) for i in range(1,23)]
+HPO = ['HP:0001250','HP:0001263','HP:0000252','HP:0001249','HP:0000707','HP:0004322','HP:0002353','HP:0001290']
+STAGES = ['cohort','dependence','merge','shard','genostore','localmonitor','supervisor','e2e']
+HEADER = ['families','samples','variants','jobs','edges','stage','seconds','maxrss','status','cpus','processes']
+
+STUB = '''#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+## benchmark.py 生成的桩模块, 按 stub.json 输出与真实模块结构相同的 shell 与依赖文件 ##
+import os
+import json
+import argparse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-ds',dest='dataset')
+parser.add_argument('-md',dest='module',required=True)
+parser.add_argument('-o',dest='outdir',required=True)
+argv,unknown = parser.parse_known_args()
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),'stub.json')) as IN:
+    spec = json.load(IN)
+families = []
+if argv.dataset:
+    with open(argv.dataset) as IN:
+        families = [line.split()[0] for line in IN if line.strip() and not line.startswith('#')]
+units,cost = families,spec['cost']
+if spec['kind'] == 'region':
+    units,cost = spec['chroms'],spec['cost'] * len(families) / len(spec['chroms'])
+elif spec['kind'] == 'cohort':
+    units = []
+shelldir,listdir = os.path.join(argv.outdir,'shell',argv.module),os.path.join(argv.outdir,'list')
+for directory in (shelldir,listdir):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+def job(name,seconds):
+    shell = os.path.join(shelldir,'{0}.sh'.format(name))
+    with open(shell,'w') as OUT:
+        OUT.write('sleep {0:.3f}\\n'.format(seconds) if seconds > 0 else 'true\\n')
+    return '{0}:{1}'.format(shell,spec['memory'])
+
+def sinks(depfile):
+    ## 上游模块依赖中没有下游的步骤 ##
+    jobs,upstream = [],set()
+    with open(depfile) as IN:
+        for line in IN:
+            chain = line.split()
+            jobs.extend(chain)
+            upstream.update(chain[:-1])
+    return [i for i in dict.fromkeys(jobs) if i not in upstream]
+
+gather = [job(i,spec['cost']) for i in spec['gather']]
+with open(os.path.join(listdir,'{0}_dependence.txt'.format(argv.module)),'w') as OUT:
+    for unit in units:
+        chain = [job('{0}_{1}'.format(unit,i),cost) for i in spec['steps']] + gather[:1]
+        OUT.writelines('{0}\\t{1}\\n'.format(i,j) for i,j in zip(chain,chain[1:]))
+    ## 整合模块在其他模块结束后运行: 其他模块的末端步骤 -> 第一个汇总步骤 ##
+    for module in spec['after']:
+        depfile = os.path.join(listdir,'{0}_dependence.txt'.format(module))
+        if os.path.isfile(depfile):
+            OUT.writelines('{0}\\t{1}\\n'.format(i,gather[0]) for i in sinks(depfile))
+    OUT.writelines('{0}\\t{1}\\n'.format(i,j) for i,j in zip(gather,gather[1:]))
+    if len(gather) == 1 and not units and not spec['after']:
+        OUT.write('{0}\\n'.format(gather[0]))
+for name in ('{0}.list','{0}.final.list'):
+    with open(os.path.join(listdir,name.format(argv.module)),'w') as OUT:
+        OUT.writelines('{0}\\t{1}\\n'.format(argv.module,i) for i in families)
+'''
+
+PIPMETHOD = '''# -*- coding:utf-8 -*-
+## benchmark.py 生成的最小 PipMethod, 仅在 ../lib/PipMethod 不存在时用于 e2e 阶段 ##
+import os
+import subprocess
+import configparser
+
+class myconf(configparser.ConfigParser):
+    """ConfigParser keeping the case of option names"""
+    def optionxform(self,optionstr):
+        return optionstr
+
+def generateShell(shell,content,finish_string=None):
+    with open(shell,'w') as OUT:
+        OUT.write('{0}\\n'.format(content))
+    subprocess.check_call(['sh',shell])
+
+def mkdir(dirs):
+    for directory in dirs:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+'''
+
+CONFIG = '''[sys]
+analysisModules = {modules}
+odir = {odir}
+moduledir = {moduledir}
+monitorOptions = -P benchmark
+vcf2peddataset = {dataset}
+familyhpo = {familyhpo}
+gedition = hg19
+queue = benchmark.q
+scheduler = local
+localMemory = 1T
+localJobs = {processes}
+localRetry = 0
+incremental = false
+
+[software]
+{software}
+
+[database]
+{database}
+
+{memory}
+
+[CMsiteOnly_Case_para]
+1000g = 0.01
+gnomAD = 0.01
+minfamily = 2
+
+[Exomiser_para]
+minfamily = 2
+inheritance = AD
+
+[FARVAT_para]
+rare = 0.01
+common = 0.05
+pvalue = 0.05
+
+[pVAAST_para]
+pVAASTgw = 1
+pVAASTd = 1
+lod = 3
+pvalue = 0.05
+inheritance = AD
+
+[Candigene_integration_para]
+minmethod = 3
+1000g = 0.01
+gnomAD = 0.01
+'''
+SOFTWARE = ['annovar','intervar','bgzip','tabix','monitor','perl','java','exomiser','vcftools','vcfmerge','vcf2cdr','VAAST']
+DATABASE = ['database_intervar','database_locat','exomiser_data','version','1000g','gnomAD','geneinfo','genomefa','gff3','diGenent','gene2ensembl']
+
+def write_cohort(outdir,families,samples,variants,seed=1):
+    """write outdir/{vcf2peddataset,familyhpo,vcf/,ped/}; return (vcf2peddataset,familyhpo)"""
+    rnd = random.Random(seed)
+    for directory in ('vcf','ped'):
+        if not os.path.exists(os.path.join(outdir,directory)):
+            os.makedirs(os.path.join(outdir,directory))
+    ## 共享位点池, 使家系间有共同变异 ##
+    pool = sorted(set((rnd.randrange(len(CHROMS)),rnd.randint(1,50000000)) for i in range(variants * 4)))
+    pool = [(CHROMS[i],pos,rnd.choice('ACGT')) for i,pos in pool]
+    dataset,familyhpo = os.path.join(outdir,'vcf2peddataset'),os.path.join(outdir,'familyhpo')
+    with open(dataset,'w') as DS, open(familyhpo,'w') as HPO_OUT:
+        for f in range(families):
+            family = 'FAM{0:05d}'.format(f + 1)
+            members = ['{0}_S{1}'.format(family,i + 1) for i in range(samples)]
+            ped,vcf = os.path.join(outdir,'ped',family + '.ped'),os.path.join(outdir,'vcf',family + '.vcf.gz')
+            with open(ped,'w') as OUT:
+                for i,sample in enumerate(members):
+                    parents = members[:2] if i >= 2 and samples >= 3 else ['0','0']
+                    affected = i == 2 or samples < 3 and i == 0 or i < 2 and rnd.random() < 0.3
+                    OUT.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\n'.format(family,sample,parents[0],parents[1],2 - i % 2 if i < 2 else rnd.choice((1,2)),2 if affected else 1))
+            with gzip.open(vcf,'wt',compresslevel=1) as OUT:
+                OUT.write('##fileformat=VCFv4.2\n##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+                OUT.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{0}\n'.format('\t'.join(members)))
+                for chrom,pos,ref in (pool[i] for i in sorted(rnd.sample(range(len(pool)),min(variants,len(pool))))):
+                    alt = rnd.choice([i for i in 'ACGT' if i != ref])
+                    genotypes = '\t'.join(rnd.choice(('0/1','0/1','0/1','0/0','0/0','1/1','./.')) for i in members)
+                    OUT.write('{0}\t{1}\t.\t{2}\t{3}\t50\tPASS\t.\tGT\t{4}\n'.format(chrom,pos,ref,alt,genotypes))
+            DS.write('{0}\t{1}\t{2}\n'.format(family,vcf,ped))
+            HPO_OUT.write('{0}\t{1}\n'.format(family,','.join(rnd.sample(HPO,2))))
+    return dataset,familyhpo
+
+def write_modules(moduledir,costs=None,memory='1G'):
+    """stub module trees under moduledir; costs: {module:seconds per step}"""
+    for module,(kind,steps,gather) in MODULES.items():
+        bindir = os.path.join(moduledir,module,'bin')
+        if not os.path.exists(bindir):
+            os.makedirs(bindir)
+        with open(os.path.join(bindir,'stub.json'),'w') as OUT:
+            json.dump({'kind':kind,'steps':steps,'gather':gather,'after':[i for i in MODULES if i != module] if kind == 'cohort' else [],'chroms':CHROMS,'cost':(costs or {}).get(module,0.0),'memory':memory},OUT)
+        with open(os.path.join(bindir,'{0}.ini'.format(module)),'w') as OUT:
+            OUT.write('[software]\n\n[database]\n\n[memory]\n{0}\n\n[genomeedition]\n\n[para]\n'.format(''.join('{0} = {1}\n'.format(i,memory) for i in steps + gather)))
+        with open(os.path.join(bindir,'{0}_pipeline.py'.format(module) if module == 'InterVar' else '{0}.pipeline.py'.format(module)),'w') as OUT:
+            OUT.write(STUB)
+
+def module_command(python3,moduledir,module,dataset,familyhpo,odir):
+    """stub module command line as the pipeline writes it"""
+    script = '{0}_pipeline.py'.format(module) if module == 'InterVar' else '{0}.pipeline.py'.format(module)
+    if module == 'Candigene_integration':
+        inputs = '-mm {0}/list/allmethods.list -iv {0}/list/InterVar.final.list'.format(odir)
+    else:
+        inputs = '-ds {0}{1}'.format(dataset,' -fhpo {0} -ih AD'.format(familyhpo) if module == 'Exomiser' else '')
+    return '{0} {1}/{2}/bin/{3} {4} -conf {1}/{2}/bin/{2}.ini -moption "taskmonitor -q benchmark.q" -md {2} -o {5}'.format(python3,moduledir,module,script,inputs,odir)
+
+def merge_dependence(depfiles,output):
+    """write output and <output>.modules from <Module>_dependence.txt files; return (jobs,edges)"""
+    with open(output,'w') as OUT, open('{0}.modules'.format(os.path.splitext(output)[0]),'w') as MODULES_OUT:
+        for depfile in depfiles:
+            with open(depfile) as IN:
+                content = IN.read()
+            OUT.write(content)
+            module = os.path.basename(depfile)[:-len('_dependence.txt')]
+            MODULES_OUT.writelines('{0}\t{1}\n'.format(i.rsplit(':',1)[0],module) for i in OrderedDict.fromkeys(content.split()))
+    jobs,upstream = read_dependence([output])
+    return len(jobs),sum(len(i) for i in upstream.values())
+
+def measure(command,log,env=None):
+    """(seconds,peak rss bytes,exit status) of command run as a child process"""
+    start = time.time()
+    with open(log,'w') as OUT:
+        process = subprocess.Popen(command,stdout=OUT,stderr=subprocess.STDOUT,env=env)
+        pid,status,usage = os.wait4(process.pid,0)
+    return time.time() - start,usage.ru_maxrss * 1024,os.waitstatus_to_exitcode(status)
+
+def pipmethod_available():
+    sys.path.append(os.path.join(Bin,'..','lib'))
+    return importlib.util.find_spec('PipMethod') is not None
+
+def write_pipmethod(libdir):
+    """minimal PipMethod (myconf/generateShell/mkdir) for running the pipeline without ../lib"""
+    if not os.path.exists(libdir):
+        os.makedirs(libdir)
+    with open(os.path.join(libdir,'PipMethod.py'),'w') as OUT:
+        OUT.write(PIPMETHOD)
+    return libdir
+
+def write_config(config,odir,moduledir,dataset,familyhpo,processes,memory):
+    with open(config,'w') as OUT:
+        OUT.write(CONFIG.format(modules=','.join(MODULES),odir=odir,moduledir=moduledir,dataset=dataset,familyhpo=familyhpo,processes=processes,
+                                software='\n'.join('{0} = /usr/bin/{0}'.format(i) for i in SOFTWARE) + '\npython3 = {0}'.format(sys.executable),
+                                database='\n'.join('{0} = {1}/database/{0}'.format(i,os.path.dirname(odir)) for i in DATABASE),
+                                memory='\n\n'.join('[{0}_memory]\n{1}'.format(module,''.join('{0} = {1}\n'.format(i,memory) for i in keys)) for module,keys in MEMORY_KEYS.items())))
+
+def run_size(workdir,families,samples,variants,costs,memory,processes,stages):
+    """run the stages for one cohort size; yield result rows"""
+    python3 = sys.executable
+    cohortdir,moduledir,odir,logdir = [os.path.join(workdir,i) for i in ('cohort','moduledir','odir','logs')]
+    for directory in (cohortdir,odir,logdir):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+    dataset,familyhpo = os.path.join(cohortdir,'vcf2peddataset'),os.path.join(cohortdir,'familyhpo')
+    dependence = os.path.join(odir,'list','all_dependence.txt')
+    write_modules(moduledir,costs,memory)
+    commands = OrderedDict([
+        ('cohort',[python3,os.path.join(Bin,'benchmark.py'),'cohort','-o',cohortdir,'-n',str(families),'-s',str(samples),'-v',str(variants)]),
+        ('dependence',['sh','-c',' && '.join(module_command(python3,moduledir,i,dataset,familyhpo,odir) for i in MODULES)]),
+        ('merge',[python3,os.path.join(Bin,'benchmark.py'),'merge','-o',dependence,'-i'] + [os.path.join(odir,'list','{0}_dependence.txt'.format(i)) for i in MODULES]),
+        ('shard',[python3,os.path.join(Bin,'shardjob.py'),'split','-ds',dataset,'-fhpo',familyhpo,'-n','100','-o',os.path.join(workdir,'shard')]),
+        ('genostore',[python3,os.path.join(Bin,'genostore.py'),'-x',os.path.join(workdir,'genotype'),'build','-ds',dataset]),
+        ('localmonitor',[python3,os.path.join(Bin,'localmonitor.py'),'-i',dependence,'-m','1T','-p',str(processes),'-r','0']),
+        ('supervisor',[python3,os.path.join(Bin,'supervisor.py'),'-o',os.path.join(workdir,'supervisor'),'run','-i',dependence,'-M','{0}.modules'.format(os.path.splitext(dependence)[0]),'-m','1T','-p',str(processes),'-r','0']),
+        ('e2e',[python3,os.path.join(Bin,'multifamily-based.disease.screen.py'),'-c',os.path.join(workdir,'e2e.ini')]),
+    ])
+    jobs,edges = '.','.'
+    for stage,command in commands.items():
+        ## cohort/dependence/merge 是其他阶段的输入, 总是运行 ##
+        if stage not in stages and stage not in ('cohort','dependence','merge'):
+            continue
+        env = None
+        if stage == 'e2e':
+            ## 没有 ../lib/PipMethod 时以最小 PipMethod 运行主流程 ##
+            if not pipmethod_available():
+                env = dict(os.environ,PYTHONPATH=os.pathsep.join([write_pipmethod(os.path.join(workdir,'lib'))] + [i for i in [os.environ.get('PYTHONPATH')] if i]))
+            write_config(os.path.join(workdir,'e2e.ini'),os.path.join(workdir,'e2e'),moduledir,dataset,familyhpo,processes,memory)
+        if stage == 'supervisor' and os.path.exists(os.path.join(workdir,'supervisor')):
+            shutil.rmtree(os.path.join(workdir,'supervisor'))
+        seconds,maxrss,status = measure(command,os.path.join(logdir,'{0}.log'.format(stage)),env)
+        if stage == 'merge' and status == 0:
+            jobs,upstream = read_dependence([dependence])
+            jobs,edges = len(jobs),sum(len(i) for i in upstream.values())
+        if stage == 'e2e' and os.path.isfile(os.path.join(workdir,'e2e','list','all_dependence.txt')):
+            ## 主流程生成的依赖图 ##
+            jobs,upstream = read_dependence([os.path.join(workdir,'e2e','list','all_dependence.txt')])
+            jobs,edges = len(jobs),sum(len(i) for i in upstream.values())
+        if stage in stages:
+            yield [families,samples,variants,jobs,edges,stage,'{0:.3f}'.format(seconds),maxrss,status,os.cpu_count() or 1,processes]
+        if status != 0:
+            sys.stderr.write('\033[1;31;40mbenchmark - WARNING - {0} families: {1} exited with status {2}, see {3}/{1}.log\033[0m\n'.format(families,stage,status,logdir))
+
+def read_results(file):
+    """{(families,stage):row dict}"""
+    results = OrderedDict()
+    with open(file) as IN:
+        for line in IN:
+            if line.startswith('#') or not line.strip():
+                continue
+            row = dict(zip(HEADER,line.rstrip('\n').split('\t')))
+            if row['families'] != 'families':
+                results[(int(row['families']),row['stage'])] = row
+    return results
+
+def compare(results,baseline,tolerance=0.5):
+    """print results against baseline; return number of regressions"""
+    regressions = 0
+    print ('families\tstage\tseconds\tbaseline\tmaxrss\tbaseline\tjobs\tbaseline\tverdict')
+    for key,row in results.items():
+        base = baseline.get(key)
+        if base and (row.get('cpus'),row.get('processes')) != (base.get('cpus'),base.get('processes')):
+            sys.stderr.write('\033[1;31;40mbenchmark - WARNING - {0} families {1}: {2} cpus/{3} processes, baseline {4} cpus/{5} processes\033[0m\n'.format(key[0],key[1],row.get('cpus'),row.get('processes'),base.get('cpus','.'),base.get('processes','.')))
+        if not base or row['status'] != '0' or base['status'] != '0':
+            print ('{0}\t{1}\t{2}\t.\t{3}\t.\t{4}\t.\t{5}'.format(key[0],key[1],row['seconds'],row['maxrss'],row['jobs'],'new' if not base else row['status']))
+            continue
+        seconds,baseSeconds = float(row['seconds']),float(base['seconds'])
+        maxrss,baseMaxrss = int(row['maxrss']),int(base['maxrss'])
+        slower = seconds > baseSeconds * (1 + tolerance) and seconds - baseSeconds > 1
+        larger = maxrss > baseMaxrss * (1 + tolerance) and maxrss - baseMaxrss > 50 * 1024 ** 2
+        regressions += slower or larger
+        print ('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}'.format(key[0],key[1],row['seconds'],base['seconds'],format_memory(maxrss),format_memory(baseMaxrss),row['jobs'],base['jobs'],'REGRESSION' if slower or larger else 'ok'))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    subparsers = parser.add_subparsers(dest='command')
+    cohort_parser = subparsers.add_parser('cohort',help='synthetic vcf2peddataset/familyhpo')
+    cohort_parser.add_argument('-o','--outdir',help="output directory",dest='outdir',type=str,required=True)
+    cohort_parser.add_argument('-n','--families',help="families [default: 10]",dest='families',type=int,default=10)
+    cohort_parser.add_argument('-s','--samples',help="samples per family [default: 3]",dest='samples',type=int,default=3)
+    cohort_parser.add_argument('-v','--variants',help="variants per family [default: 200]",dest='variants',type=int,default=200)
+    cohort_parser.add_argument('-r','--seed',help="random seed [default: 1]",dest='seed',type=int,default=1)
+    modules_parser = subparsers.add_parser('modules',help='stub module trees')
+    modules_parser.add_argument('-o','--moduledir',help="module directory",dest='moduledir',type=str,required=True)
+    modules_parser.add_argument('-t','--cost',help="Module:seconds per step, e.g. Exomiser:0.5 [default: 0]",dest='cost',type=str,action='append',default=[])
+    modules_parser.add_argument('-m','--memory',help="memory request per step [default: 1G]",dest='memory',type=str,default='1G')
+    merge_parser = subparsers.add_parser('merge',help='merge module dependence files')
+    merge_parser.add_argument('-i','--input',help="<Module>_dependence.txt files",dest='input',type=str,nargs='+',required=True)
+    merge_parser.add_argument('-o','--output',help="all_dependence.txt",dest='output',type=str,required=True)
+    run_parser = subparsers.add_parser('run',help='run the benchmark')
+    run_parser.add_argument('-o','--outdir',help="output directory",dest='outdir',type=str,required=True)
+    run_parser.add_argument('-n','--families',help="cohort sizes [default: 10 100 1000 10000]",dest='families',type=int,nargs='+',default=[10,100,1000,10000])
+    run_parser.add_argument('-s','--samples',help="samples per family [default: 3]",dest='samples',type=int,default=3)
+    run_parser.add_argument('-v','--variants',help="variants per family [default: 200]",dest='variants',type=int,default=200)
+    run_parser.add_argument('-t','--cost',help="Module:seconds per step, e.g. Exomiser:0.5 [default: 0]",dest='cost',type=str,action='append',default=[])
+    run_parser.add_argument('-m','--memory',help="memory request per step [default: 1G]",dest='memory',type=str,default='1G')
+    run_parser.add_argument('-p','--processes',help="parallel jobs of the schedulers, at most the cpu count [default: cpu count]",dest='processes',type=int,default=os.cpu_count() or 1)
+    run_parser.add_argument('-S','--stages',help="stages [default: all], cohort/dependence/merge always run as inputs of the others",dest='stages',type=str,nargs='+',choices=STAGES,default=STAGES)
+    run_parser.add_argument('-b','--baseline',help="baseline benchmark.tsv to compare with",dest='baseline',type=str)
+    run_parser.add_argument('-k','--keep',help="keep the work directory of every cohort size",dest='keep',action='store_true')
+    compare_parser = subparsers.add_parser('compare',help='compare results with a baseline')
+    compare_parser.add_argument('-i','--input',help="benchmark.tsv",dest='input',type=str,required=True)
+    compare_parser.add_argument('-b','--baseline',help="baseline benchmark.tsv",dest='baseline',type=str,required=True)
+    for i in (run_parser,compare_parser):
+        i.add_argument('--tolerance',help="allowed slowdown/growth ratio [default: 0.5]",dest='tolerance',type=float,default=0.5)
+    argv = vars(parser.parse_args())
+
+    costs = {}
+    for item in argv.get('cost') or []:
+        module,seconds = item.split(':')
+        if module not in MODULES:
+            sys.stderr.write('\033[1;31;40mbenchmark - ERROR - unknown module {0}, choose from {1}\033[0m\n'.format(module,','.join(MODULES)))
+            exit(1)
+        costs[module] = float(seconds)
+    if argv['command'] == 'cohort':
+        print ('\n'.join(write_cohort(os.path.abspath(argv['outdir']),argv['families'],argv['samples'],argv['variants'],argv['seed'])))
+    elif argv['command'] == 'modules':
+        parse_memory(argv['memory'])
+        write_modules(os.path.abspath(argv['moduledir']),costs,argv['memory'])
+    elif argv['command'] == 'merge':
+        jobs,edges = merge_dependence(argv['input'],argv['output'])
+        print ('{0}\t{1} jobs\t{2} edges'.format(argv['output'],jobs,edges))
+    elif argv['command'] == 'run':
+        ## 并行数不超过 cpu 数, 否则计时反映的是 cpu 争用 ##
+        cpus = os.cpu_count() or 1
+        if argv['processes'] > cpus:
+            sys.stderr.write('\033[1;31;40mbenchmark - WARNING - -p {0} exceeds {1} cpus, use -p {1}\033[0m\n'.format(argv['processes'],cpus))
+        argv['processes'] = min(max(1,argv['processes']),cpus)
+        outdir = os.path.abspath(argv['outdir'])
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        result = os.path.join(outdir,'benchmark.tsv')
+        with open(result,'w') as OUT:
+            OUT.write('# {0} python {1}, {2} cpus, {3}, processes {4}, cost {5}, memory {6}, PipMethod {7}\n'.format(time.strftime('%Y-%m-%d'),platform.python_version(),os.cpu_count(),platform.platform(),argv['processes'],','.join('{0}:{1}'.format(i,j) for i,j in costs.items()) or 0,argv['memory'],'../lib' if pipmethod_available() else 'minimal'))
+            OUT.write('\t'.join(HEADER) + '\n')
+            for families in argv['families']:
+                workdir = os.path.join(outdir,str(families))
+                for row in run_size(workdir,families,argv['samples'],argv['variants'],costs,argv['memory'],argv['processes'],argv['stages']):
+                    OUT.write('\t'.join(str(i) for i in row) + '\n')
+                    OUT.flush()
+                    print ('\t'.join(str(i) for i in row))
+                if not argv['keep']:
+                    shutil.rmtree(workdir)
+        print ('\033[1;34;47mbenchmark: results in {0}\033[0m'.format(result))
+        if argv['baseline'] and compare(read_results(result),read_results(argv['baseline']),argv['tolerance']):
+            exit(1)
+    elif argv['command'] == 'compare':
+        if compare(read_results(argv['input']),read_results(argv['baseline']),argv['tolerance']):
+            exit(1)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 模块级增量运行缓存. 每个模块的指纹由以下内容计算:
+                   vcf2peddataset/familyhpo 内容(及其中列出文件的大小和修改时间), 生成的模块ini ([memory] 除外), moduledir下的模块代码, 上游模块指纹
+                   指纹与上次完成的运行一致且 *.final.list 存在的模块会被跳过; 上游模块变化时指纹随之改变, 下游模块全部重跑
+                   模块完成后首次被检查时记录自身及上游 *.final.list 的摘要, 之后这些结果被改动也会使缓存失效
+      To run : python3 buildcache.py [options]
+      options: -d cache directory, e.g. odir/cache [required]
+      e.g.:
+            python3 buildcache.py -d odir/cache\033[0m
+'''
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+## 超过该大小的文件只记录大小和修改时间 ##
+BIGFILE = 16 * 1024 * 1024
+
+def file_digest(file):
+    if not os.path.isfile(file):
+        return ''
+    md5 = hashlib.md5()
+    with open(file,'rb') as IN:
+        for block in iter(lambda: IN.read(1 << 20),b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def stat_digest(file):
+    st = os.stat(file)
+    return '{0}:{1}:{2}'.format(file,st.st_size,int(st.st_mtime))
+
+def input_digest(file):
+    """content of a list file such as vcf2peddataset plus size/mtime of every file path it references"""
+    md5 = hashlib.md5(file_digest(file).encode())
+    with open(file) as IN:
+        for line in IN:
+            for item in line.split():
+                if os.path.isfile(item):
+                    md5.update(stat_digest(item).encode())
+    return md5.hexdigest()
+
+def ini_digest(ini):
+    """rendered module ini without its [memory] section, memory requests do not change results"""
+    if not os.path.isfile(ini):
+        return ''
+    md5,section = hashlib.md5(),None
+    with open(ini) as IN:
+        for line in IN:
+            if line.strip().startswith('['):
+                section = line.strip()
+            if section != '[memory]':
+                md5.update(line.encode())
+    return md5.hexdigest()
+
+def tree_digest(path):
+    md5 = hashlib.md5()
+    for root,dirs,files in os.walk(path):
+        dirs[:] = sorted(i for i in dirs if i != '__pycache__')
+        for name in sorted(files):
+            if name.endswith(('.pyc','.pyo')):
+                continue
+            file = os.path.join(root,name)
+            md5.update(os.path.relpath(file,path).encode())
+            if os.path.getsize(file) > BIGFILE:
+                md5.update(stat_digest(file).encode())
+            else:
+                md5.update(file_digest(file).encode())
+    return md5.hexdigest()
+
+def module_fingerprint(inputs,ini,codedir,upstream):
+    """inputs: list files (vcf2peddataset, familyhpo), ini: rendered module ini,
+       codedir: moduledir/<module>, upstream: [fingerprint of upstream modules]
+    """
+    md5 = hashlib.md5()
+    for file in inputs:
+        md5.update(input_digest(file).encode())
+    md5.update(ini_digest(ini).encode())
+    md5.update(tree_digest(codedir).encode())
+    for fp in upstream:
+        md5.update(fp.encode())
+    return md5.hexdigest()
+
+class BuildCache(object):
+    """one json record per module under cachedir"""
+    def __init__(self,cachedir):
+        self.cachedir = cachedir
+        if not os.path.exists(cachedir):
+            os.makedirs(cachedir)
+
+    def record_file(self,module):
+        return os.path.join(self.cachedir,'{0}.fingerprint.json'.format(module))
+
+    def load(self,module):
+        try:
+            with open(self.record_file(module)) as IN:
+                return json.load(IN)
+        except (IOError,ValueError):
+            return None
+
+    def save(self,module,record):
+        tmp = self.record_file(module) + '.tmp'
+        with open(tmp,'w') as OUT:
+            json.dump(record,OUT,indent=1,sort_keys=True)
+        os.rename(tmp,self.record_file(module))
+
+    def uptodate(self,module,fingerprint,finallist,upstreamlists):
+        """True if module finished with the same fingerprint and its results are unchanged"""
+        record = self.load(module)
+        if not record or record['fingerprint'] != fingerprint or not os.path.isfile(finallist):
+            return False
+        lists = [finallist] + list(upstreamlists)
+        if 'lists' not in record:
+            ## 首次检查: 结果须在提交之后产生, 然后封存结果摘要 ##
+            if os.path.getmtime(finallist) < record['submitted']:
+                return False
+            record['lists'] = {i:file_digest(i) for i in lists}
+            self.save(module,record)
+            return True
+        return all(record['lists'].get(i) == file_digest(i) for i in lists)
+
+    def submit(self,module,fingerprint):
+        self.save(module,{'module':module,'fingerprint':fingerprint,'submitted':time.time()})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-d','--cachedir',help="cache directory, e.g. odir/cache",dest='cachedir',type=str,required=True)
+    argv = vars(parser.parse_args())
+
+    cache = BuildCache(argv['cachedir'])
+    for file in sorted(os.listdir(cache.cachedir)):
+        if file.endswith('.fingerprint.json'):
+            record = cache.load(file[:-len('.fingerprint.json')])
+            if record:
+                print ('{0}\t{1}\t{2}\t{3}'.format(record['module'],record['fingerprint'],time.strftime('%Y-%m-%d %H:%M:%S',time.localtime(record['submitted'])),'completed' if 'lists' in record else 'submitted'))
+
+if __name__ == '__main__':
+    main()
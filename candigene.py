@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 候选基因整合 (进程内实现, 替代 Candigene_integration 模块的 candigenescreen 步骤)
+                   读取 allmethods.list 中各方法的 *.final.list, 有 Chr/Start/Ref/Alt 列的方法按位点支持, 否则按基因支持, 以哈希表保存 (结果列表较小); 任一方法结果缺失时报错退出
+                   流式读取 InterVar 列表, 按位点/基因连接统计支持方法数, 过滤 minmethod 及 1000g/gnomAD 频率, 按支持方法数分桶写出,
+                   输出按支持方法数从高到低排列, 内存只与各方法结果大小有关; 可用不同 -n 反复运行快速重新排序
+      To run : python3 candigene.py [options]
+      options: -mm allmethods.list [required]
+               -iv InterVar final list [required]
+               -n minmethod [default: 2]
+               -k 1000g max frequency [default: 0.01]
+               -a gnomAD max frequency [default: 0.01]
+               -o output [required]
+      e.g.:
+            python3 candigene.py -mm odir/list/allmethods.list -iv odir/list/InterVar.final.list -n 2 -o odir/list/Candigene_integration.final.list\033[0m
+'''
+
+import os
+import sys
+import tempfile
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from annocache import annovar_key
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+GENE_COLUMNS = ('Gene','Gene.refGene','Ref.Gene','GeneName','Gene_Name','Symbol','gene')
+VARIANT_COLUMNS = (('Chr','CHROM','Chrom','chr'),('Start','POS','Pos','start'),('Ref','REF','ref'),('Alt','ALT','alt'))
+
+def find_column(columns,names):
+    for name in names:
+        if name in columns:
+            return columns.index(name)
+    return None
+
+def frequency_column(columns,population):
+    """first 1000g*/gnomAD* column, preferring the all-population one"""
+    found = [i for i,name in enumerate(columns) if name.lower().startswith(population.lower())]
+    preferred = [i for i in found if 'all' in columns[i].lower()]
+    return (preferred or found or [None])[0]
+
+def read_header(handle):
+    """header line of a list file (leading '#' allowed) and its columns"""
+    header = handle.readline()
+    return header,header.rstrip('\n').lstrip('#').split('\t')
+
+def variant_index(columns):
+    """column index of chrom/pos/ref/alt and whether they are VCF (POS) rather than ANNOVAR (Start) coordinates"""
+    index = [find_column(columns,i) for i in VARIANT_COLUMNS]
+    if None in index:
+        return None,False
+    return index,columns[index[1]] == 'POS'
+
+def variant_key(items,index,vcfstyle):
+    chrom,pos,ref,alt = (items[i] for i in index)
+    chrom = chrom[3:] if chrom.lower().startswith('chr') else chrom
+    if vcfstyle:
+        return annovar_key(chrom,pos,ref,alt)
+    return chrom,int(pos),ref,alt
+
+def method_support(file):
+    """return (variant keys or None, gene set) of one method result"""
+    variants,genes = set(),set()
+    with open(file) as IN:
+        header,columns = read_header(IN)
+        gene = find_column(columns,GENE_COLUMNS)
+        index,vcfstyle = variant_index(columns)
+        if gene is None:
+            gene = 0
+        for line in IN:
+            items = line.rstrip('\n').split('\t')
+            if len(items) <= gene:
+                continue
+            for name in items[gene].replace(';',',').split(','):
+                if name and name != '.':
+                    genes.add(name)
+            if index and len(items) > max(index):
+                variants.add(variant_key(items,index,vcfstyle))
+    return (variants if index else None),genes
+
+def read_methods(allmethods):
+    """[(method,variants,genes)]; every method result must exist, a missing one would silently drop candidates under minmethod"""
+    methods,missing = [],[]
+    with open(allmethods) as IN:
+        for line in IN:
+            if not line.strip() or line.startswith('#'):
+                continue
+            name,file = line.split()[:2]
+            if os.path.isfile(file):
+                methods.append((name,) + method_support(file))
+            else:
+                missing.append('{0}\t{1}'.format(name,file))
+    if missing:
+        sys.stderr.write('\033[1;31;40mcandigene - ERROR - {0} method results missing:\n{1}\033[0m\n'.format(len(missing),'\n'.join(missing)))
+        exit(1)
+    return methods
+
+def frequency(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+def integrate(allmethods,intervar,output,minmethod=2,max1000g=0.01,maxgnomAD=0.01):
+    """write candidates of intervar supported by >= minmethod methods, most supported first; return counts per support"""
+    methods = read_methods(allmethods)
+    buckets = {}
+    tmpdir = os.path.dirname(os.path.abspath(output))
+    with open(intervar) as IN:
+        header,columns = read_header(IN)
+        gene = find_column(columns,GENE_COLUMNS)
+        gene = 0 if gene is None else gene
+        index,vcfstyle = variant_index(columns)
+        kg,gnomad = frequency_column(columns,'1000g'),frequency_column(columns,'gnomAD')
+        for line in IN:
+            items = line.rstrip('\n').split('\t')
+            if len(items) <= gene:
+                continue
+            if kg is not None and len(items) > kg and frequency(items[kg]) > max1000g:
+                continue
+            if gnomad is not None and len(items) > gnomad and frequency(items[gnomad]) > maxgnomAD:
+                continue
+            genes = set(items[gene].replace(';',',').split(','))
+            key = variant_key(items,index,vcfstyle) if index and len(items) > max(index) else None
+            support = [name for name,variants,supported in methods if (key in variants if variants is not None and key else genes & supported)]
+            if len(support) < minmethod:
+                continue
+            if len(support) not in buckets:
+                buckets[len(support)] = tempfile.TemporaryFile('w+',dir=tmpdir)
+            buckets[len(support)].write('{0}\t{1}\t{2}\n'.format(line.rstrip('\n'),len(support),','.join(support)))
+    counts = {}
+    with open(output + '.tmp','w') as OUT:
+        OUT.write('{0}\tMethodCount\tMethods\n'.format(header.rstrip('\n')))
+        for count in sorted(buckets,reverse=True):
+            buckets[count].seek(0)
+            counts[count] = 0
+            for line in buckets[count]:
+                OUT.write(line)
+                counts[count] += 1
+            buckets[count].close()
+    os.rename(output + '.tmp',output)
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-mm','--methods',help="allmethods.list: method<TAB>final list",dest='methods',type=str,required=True)
+    parser.add_argument('-iv','--intervar',help="InterVar final list",dest='intervar',type=str,required=True)
+    parser.add_argument('-n','--minmethod',help="min supporting methods [default: 2]",dest='minmethod',type=int,default=2)
+    parser.add_argument('-k','--1000g',help="1000g max frequency [default: 0.01]",dest='kg',type=float,default=0.01)
+    parser.add_argument('-a','--gnomAD',help="gnomAD max frequency [default: 0.01]",dest='gnomad',type=float,default=0.01)
+    parser.add_argument('-o','--output',help="candidate table",dest='output',type=str,required=True)
+    argv = vars(parser.parse_args())
+
+    for file in (argv['methods'],argv['intervar']):
+        if not os.path.isfile(file):
+            sys.stderr.write('\033[1;31;40mcandigene - ERROR - input: No such file {0}\033[0m\n'.format(file))
+            exit(1)
+    counts = integrate(argv['methods'],argv['intervar'],argv['output'],argv['minmethod'],argv['kg'],argv['gnomad'])
+    for count in sorted(counts,reverse=True):
+        print ('{0} methods\t{1} candidates'.format(count,counts[count]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: Exomiser JVM 批处理工作进程
+                   读取依赖文件中各家系的 exomrun 步骤, 解析其中 "java ... -jar exomiser ... --analysis <家系>.yml" 命令,
+                   同一 java 命令 (同一 jar/数据库/参数) 的家系按顺序每 -n 个分为一组, 每组由一个 JVM 以批处理方式 (--batch 列表文件) 依次分析,
+                   exomiser 数据库每组只加载一次; 各家系 yml 中的输出路径不变, 因此每个家系/项目的结果与逐个运行时相同
+                   组内各家系互不影响: 前置命令失败的家系不进入批处理, 批处理失败时逐个家系单独重新分析, 每个家系的退出状态分别记录, 工作进程本身总是成功退出
+                   依赖文件中每个家系的 exomrun 步骤替换为 工作进程 -> 家系状态步骤 (以该家系的退出状态退出), 即 exomconfig -> 工作进程 -> 家系状态 -> exomfilter,
+                   某个家系失败只跳过该家系的下游; 各组是独立的步骤, 家系的下游只等待所在组, -n 1 时只等待本家系的分析
+                   exomrun 中 java 命令之前/之后的其他命令在工作进程中按家系以子 shell 执行; 无法解析的 exomrun 保持原样
+      To run : python3 exomiserpool.py [options]
+      options: -i dependence files, rewritten in place [required]
+               -s exomrun shells [required]
+               -n families per JVM [default: 1]
+               -b batch option of exomiser cli [default: --batch]
+               -o pool directory [required]
+      e.g.:
+            python3 exomiserpool.py -i odir/list/all_dependence.txt -s odir/shell/Exomiser/*exomrun*.sh -n 4 -o odir/exomiser_pool\033[0m
+'''
+
+import os
+import sys
+import re
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import parse_memory
+from steptrace import split_job
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+ANALYSIS = re.compile(r'\s--analysis(?:=|\s+)(\S+)')
+## java 命令的重定向去掉 (输出进入工作进程日志), 其后以 && / ; 连接的命令保留 ##
+REDIRECT = re.compile(r'\s(?:\d?>>?|&>)\s*\S+')
+CHAIN = re.compile(r'\s*(?:&&|;)\s*')
+
+def exomiser_run(shell):
+    """(java command without --analysis, analysis yml, lines before, lines after) of an exomrun shell, None if not parsable"""
+    with open(shell) as IN:
+        lines = [i.rstrip('\n') for i in IN if i.strip()]
+    runs = [i for i,line in enumerate(lines) if '-jar' in line and ANALYSIS.search(line)]
+    if len(runs) != 1 or '||' in lines[runs[0]] or '|' in lines[runs[0]].replace('||',''):
+        return None
+    line = lines[runs[0]]
+    analysis = ANALYSIS.search(line)
+    command,after = (line[:analysis.start()] + line[analysis.end():]).strip(),lines[runs[0] + 1:]
+    chain = CHAIN.search(command)
+    if chain:
+        after = [command[chain.end():]] + after
+        command = command[:chain.start()]
+    command = REDIRECT.sub('',command).strip()
+    yml = analysis.group(1)
+    if not os.path.isabs(yml):
+        yml = os.path.join(os.path.dirname(os.path.abspath(shell)),yml)
+    return command,yml,lines[:runs[0]],after
+
+def write_worker(workerdir,command,option,runs):
+    """write workerdir/{batch.txt,exomrun.sh} and one status shell per family; runs: [(shell,mem,yml,before,after)]
+       the worker records the exit status of every family in workerdir/status/<index> and exits 0; return (worker,[status shell])
+    """
+    statusdir = os.path.join(workerdir,'status')
+    if not os.path.exists(statusdir):
+        os.makedirs(statusdir)
+    batch = os.path.join(workerdir,'batch.txt')
+    shell = os.path.join(workerdir,'exomrun.sh')
+    status = [os.path.join(statusdir,str(index)) for index in range(len(runs))]
+    with open(shell,'w') as OUT:
+        OUT.write('rm -f {0}\n: > {1}\n'.format(' '.join(status),batch))
+        ## 前置命令失败的家系记录状态, 不进入批处理 ##
+        for index,i in enumerate(runs):
+            OUT.write('(\n{0}\n) && echo {1} >> {2} || echo $? > {3}\n'.format('\n'.join(i[3]) or ':',i[2],batch,status[index]))
+        OUT.write('batchstatus=0\nif [ -s {0} ]; then\n{1} {2} {0}\nbatchstatus=$?\nfi\n'.format(batch,command,option))
+        ## 批处理失败时逐个家系单独分析, 只有出错的家系失败 ##
+        for index,i in enumerate(runs):
+            OUT.write('if [ ! -e {0} ]; then\nif [ $batchstatus -ne 0 ]; then {1} --analysis {2}; fi && (\n{3}\n)\necho $? > {0}\nfi\n'.format(status[index],command,i[2],'\n'.join(i[4]) or ':'))
+        OUT.write('exit 0\n')
+    shells = []
+    for index,i in enumerate(runs):
+        shells.append(os.path.join(workerdir,'{0}.{1}'.format(index,os.path.basename(i[0]))))
+        with open(shells[-1],'w') as OUT:
+            OUT.write('exit $(cat {0} 2>/dev/null || echo 1)\n'.format(status[index]))
+    return shell,shells
+
+def pool_dependence(depfiles,members,size,pooldir,option='--batch',memory='100M'):
+    """replace the exomrun shells in members by pooled workers in every depfile; return {exomrun shell:(worker job,status job)}"""
+    groups,seen = OrderedDict(),set()
+    for depfile in depfiles:
+        with open(depfile) as IN:
+            for line in IN:
+                for item in line.split():
+                    shell,mem = split_job(item)
+                    if shell not in members or shell in seen:
+                        continue
+                    seen.add(shell)
+                    parsed = exomiser_run(shell)
+                    if parsed:
+                        groups.setdefault(parsed[0],[]).append((shell,mem) + parsed[1:])
+                    else:
+                        sys.stderr.write('\033[1;31;40mexomiserpool - WARNING - no exomiser --analysis command in {0}, not pooled\033[0m\n'.format(shell))
+    assign,workers = {},0
+    for command,runs in groups.items():
+        for start in range(0,len(runs),size):
+            chunk = runs[start:start + size]
+            worker,shells = write_worker(os.path.join(pooldir,str(workers)),command,option,chunk)
+            workers += 1
+            job = '{0}:{1}'.format(worker,max((i[1] for i in chunk),key=parse_memory))
+            for i,status in zip(chunk,shells):
+                assign[i[0]] = (job,'{0}:{1}'.format(status,memory))
+    ## exomrun 替换为 "工作进程 家系状态" 两个节点 ##
+    for depfile in depfiles:
+        lines,written = [],set()
+        with open(depfile) as IN:
+            for line in IN:
+                nodes = []
+                for item in line.split():
+                    for node in assign.get(split_job(item)[0],(item,)):
+                        if not nodes or nodes[-1] != node:
+                            nodes.append(node)
+                line = '\t'.join(nodes) + '\n' if nodes else line
+                if line not in written:
+                    written.add(line)
+                    lines.append(line)
+        with open(depfile,'w') as OUT:
+            OUT.writelines(lines)
+    return assign
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-i','--input',help="dependence files, rewritten in place",dest='input',type=str,nargs='+',required=True)
+    parser.add_argument('-s','--shell',help="exomrun shells",dest='shell',type=str,nargs='+',required=True)
+    parser.add_argument('-n','--families',help="families per JVM [default: 1]",dest='families',type=int,default=1)
+    parser.add_argument('-b','--batch',help="batch option of exomiser cli [default: --batch]",dest='batch',type=str,default='--batch')
+    parser.add_argument('-o','--outdir',help="pool directory",dest='outdir',type=str,required=True)
+    argv = vars(parser.parse_args())
+
+    assign = pool_dependence(argv['input'],set(argv['shell']),max(1,argv['families']),argv['outdir'],argv['batch'])
+    for worker in sorted(set(i[0] for i in assign.values())):
+        print ('{0}\t{1} families'.format(worker,len([i for i in assign.values() if i[0] == worker])))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: DisGeNET / gene2ensembl 预编译索引 (替代 gene2entrezid-intervar 和 digGenetanno 对原始文本的逐次扫描)
+                   build: 把 database.diGenent (geneId geneSymbol ... diseaseId diseaseName ... score) 和 database.gene2ensembl
+                          编译为一个二进制文件: 字符串池, 基因表 (Entrez ID, 基因名, Ensembl ID, 疾病关联区间), 疾病关联块,
+                          以及以基因名/Entrez ID/Ensembl ID 为键的开放寻址哈希表; 文件名含两个数据库的 md5, 数据库变化时自动重建
+                   annotate: 内存映射索引, 每个基因 O(1) 查找, 在候选表后追加 EntrezID, Ensembl, DisGeNET 列
+      To run : python3 geneindex.py build|annotate [options]
+      e.g.:
+            python3 geneindex.py -x geneindex -d curated_gene_disease_associations.tsv -e gene2ensembl build
+            python3 geneindex.py -x geneindex -d curated_gene_disease_associations.tsv -e gene2ensembl annotate -i candidate.list -o candidate.anno.list\033[0m
+'''
+
+import os
+import sys
+import gzip
+import json
+import mmap
+import fcntl
+import struct
+import hashlib
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from candigene import GENE_COLUMNS,find_column,read_header
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+MAGIC = b'GIDX0001'
+## magic, 基因数, 关联数, 哈希槽数, 各区块偏移 ##
+HEADER = struct.Struct('<8sIIIQQQQ')
+## Entrez, 基因名, Ensembl 的字符串 (偏移, 长度), 关联起点, 关联数 ##
+GENE = struct.Struct('<IIIIIIII')
+## 疾病ID, 疾病名 (偏移, 长度), score ##
+ASSOC = struct.Struct('<IIIIf')
+## 键 (偏移, 长度), 基因序号 ##
+SLOT = struct.Struct('<III')
+EMPTY = 0xFFFFFFFF
+
+def open_text(file):
+    return gzip.open(file,'rt') if file.endswith('.gz') else open(file)
+
+def fnv1a(data):
+    value = 0x811c9dc5
+    for byte in data:
+        value = ((value ^ byte) * 0x01000193) & 0xFFFFFFFF
+    return value
+
+def checksum(file,cachedir):
+    """md5 of a database file, recomputed only when its size or mtime changes"""
+    st = os.stat(file)
+    record = os.path.join(cachedir,'{0}.md5.json'.format(hashlib.md5(os.path.abspath(file).encode()).hexdigest()))
+    stat = [st.st_size,int(st.st_mtime)]
+    if os.path.isfile(record):
+        with open(record) as IN:
+            saved = json.load(IN)
+        if saved['stat'] == stat:
+            return saved['md5']
+    md5 = hashlib.md5()
+    with open(file,'rb') as IN:
+        for block in iter(lambda: IN.read(1 << 20),b''):
+            md5.update(block)
+    with open(record,'w') as OUT:
+        json.dump({'file':os.path.abspath(file),'stat':stat,'md5':md5.hexdigest()},OUT)
+    return md5.hexdigest()
+
+def read_disgenet(file):
+    """yield (entrez,symbol,diseaseId,diseaseName,score)"""
+    with open_text(file) as IN:
+        header,columns = read_header(IN)
+        index = [find_column(columns,i) for i in (('geneId','GeneID'),('geneSymbol','Symbol'),('diseaseId',),('diseaseName',),('score',))]
+        if None in index[:3]:
+            sys.stderr.write('\033[1;31;40mgeneindex - ERROR - {0} has no geneId/geneSymbol/diseaseId columns\033[0m\n'.format(file))
+            exit(1)
+        for line in IN:
+            items = line.rstrip('\n').split('\t')
+            if len(items) <= max(i for i in index if i is not None):
+                continue
+            score = items[index[4]] if index[4] is not None else '0'
+            try:
+                score = float(score)
+            except ValueError:
+                score = 0.0
+            yield items[index[0]],items[index[1]],items[index[2]],items[index[3]] if index[3] is not None else '',score
+
+def read_gene2ensembl(file,taxid='9606'):
+    """yield (entrez,ensembl gene) of one species"""
+    with open_text(file) as IN:
+        for line in IN:
+            if line.startswith('#'):
+                continue
+            items = line.rstrip('\n').split('\t')
+            if len(items) >= 3 and items[0] == taxid and items[2] != '-':
+                yield items[1],items[2]
+
+class StringPool(object):
+    """interned utf-8 strings"""
+    def __init__(self):
+        self.offsets = {}
+        self.data = bytearray()
+
+    def add(self,text):
+        if text not in self.offsets:
+            raw = text.encode()
+            self.offsets[text] = (len(self.data),len(raw))
+            self.data.extend(raw)
+        return self.offsets[text]
+
+def compile_index(disgenet,gene2ensembl,output):
+    genes = OrderedDict()
+    for entrez,symbol,disease,name,score in read_disgenet(disgenet):
+        gene = genes.setdefault(entrez,{'symbol':symbol,'ensembl':[],'assoc':[]})
+        gene['assoc'].append((score,disease,name))
+    for entrez,ensembl in read_gene2ensembl(gene2ensembl):
+        gene = genes.setdefault(entrez,{'symbol':'','ensembl':[],'assoc':[]})
+        if ensembl not in gene['ensembl']:
+            gene['ensembl'].append(ensembl)
+    pool = StringPool()
+    gene_block,assoc_block,keys = bytearray(),bytearray(),{}
+    nassoc = 0
+    for number,(entrez,gene) in enumerate(genes.items()):
+        gene['assoc'].sort(key=lambda i: -i[0])
+        gene_block.extend(GENE.pack(*(pool.add(entrez) + pool.add(gene['symbol']) + pool.add(','.join(gene['ensembl']))),nassoc,len(gene['assoc'])))
+        for score,disease,name in gene['assoc']:
+            assoc_block.extend(ASSOC.pack(*(pool.add(disease) + pool.add(name)),score))
+        nassoc += len(gene['assoc'])
+        for key in [entrez,gene['symbol']] + gene['ensembl']:
+            if key:
+                keys.setdefault(key,number)
+    nslots = 1
+    while nslots < 2 * len(keys) + 1:
+        nslots <<= 1
+    slots = [None] * nslots
+    for key,number in keys.items():
+        raw = key.encode()
+        slot = fnv1a(raw) & (nslots - 1)
+        while slots[slot] is not None:
+            slot = (slot + 1) & (nslots - 1)
+        slots[slot] = pool.add(key) + (number,)
+    slot_block = bytearray()
+    for slot in slots:
+        slot_block.extend(SLOT.pack(*(slot or (0,0,EMPTY))))
+    gene_offset = HEADER.size
+    assoc_offset = gene_offset + len(gene_block)
+    slot_offset = assoc_offset + len(assoc_block)
+    string_offset = slot_offset + len(slot_block)
+    with open(output + '.tmp','wb') as OUT:
+        OUT.write(HEADER.pack(MAGIC,len(genes),nassoc,nslots,gene_offset,assoc_offset,slot_offset,string_offset))
+        for block in (gene_block,assoc_block,slot_block,pool.data):
+            OUT.write(block)
+    os.rename(output + '.tmp',output)
+
+def build_index(indexdir,disgenet,gene2ensembl):
+    """return the index file for the current database checksums, compiling it if needed"""
+    if not os.path.exists(indexdir):
+        os.makedirs(indexdir)
+    with open(os.path.join(indexdir,'geneindex.lock'),'w') as lock:
+        fcntl.flock(lock,fcntl.LOCK_EX)
+        key = hashlib.md5('{0}\t{1}'.format(checksum(disgenet,indexdir),checksum(gene2ensembl,indexdir)).encode()).hexdigest()
+        index = os.path.join(indexdir,'geneindex.{0}.gidx'.format(key))
+        if not os.path.isfile(index):
+            compile_index(disgenet,gene2ensembl,index)
+            for stale in os.listdir(indexdir):
+                if stale.startswith('geneindex.') and stale.endswith('.gidx') and stale != os.path.basename(index):
+                    os.remove(os.path.join(indexdir,stale))
+    return index
+
+class GeneIndex(object):
+    def __init__(self,index):
+        self.handle = open(index,'rb')
+        self.data = mmap.mmap(self.handle.fileno(),0,access=mmap.ACCESS_READ)
+        magic,self.ngenes,self.nassoc,self.nslots,self.gene_offset,self.assoc_offset,self.slot_offset,self.string_offset = HEADER.unpack_from(self.data,0)
+        if magic != MAGIC:
+            raise ValueError('{0} is not a gene index'.format(index))
+
+    def text(self,offset,length):
+        start = self.string_offset + offset
+        return self.data[start:start + length].decode()
+
+    def find(self,key):
+        """gene number of a symbol / Entrez ID / Ensembl ID, or None"""
+        raw = key.encode()
+        slot = fnv1a(raw) & (self.nslots - 1)
+        while True:
+            offset,length,number = SLOT.unpack_from(self.data,self.slot_offset + slot * SLOT.size)
+            if number == EMPTY:
+                return None
+            if length == len(raw) and self.data[self.string_offset + offset:self.string_offset + offset + length] == raw:
+                return number
+            slot = (slot + 1) & (self.nslots - 1)
+
+    def gene(self,key):
+        """(entrez,symbol,[ensembl],[(diseaseId,diseaseName,score)]) or None"""
+        number = self.find(key)
+        if number is None:
+            return None
+        fields = GENE.unpack_from(self.data,self.gene_offset + number * GENE.size)
+        assoc = []
+        for i in range(fields[6],fields[6] + fields[7]):
+            did,dlen,nid,nlen,score = ASSOC.unpack_from(self.data,self.assoc_offset + i * ASSOC.size)
+            assoc.append((self.text(did,dlen),self.text(nid,nlen),score))
+        ensembl = self.text(fields[4],fields[5])
+        return self.text(fields[0],fields[1]),self.text(fields[2],fields[3]),ensembl.split(',') if ensembl else [],assoc
+
+def annotate(index,input,output,top=10):
+    """append EntrezID, Ensembl and DisGeNET (top diseases by score) columns"""
+    geneindex = GeneIndex(index)
+    with open(input) as IN, open(output + '.tmp','w') as OUT:
+        header,columns = read_header(IN)
+        gene = find_column(columns,GENE_COLUMNS)
+        gene = 0 if gene is None else gene
+        OUT.write('{0}\tEntrezID\tEnsembl\tDisGeNET\n'.format(header.rstrip('\n')))
+        for line in IN:
+            items = line.rstrip('\n').split('\t')
+            entrez,ensembl,diseases = [],[],[]
+            for name in items[gene].replace(';',',').split(',') if len(items) > gene else []:
+                found = geneindex.gene(name) if name else None
+                if found:
+                    entrez.append(found[0])
+                    ensembl.extend(found[2])
+                    diseases.extend('{1}({0}):{2:.3g}'.format(*i) for i in found[3][:top])
+            OUT.write('{0}\t{1}\t{2}\t{3}\n'.format(line.rstrip('\n'),','.join(entrez) or '.',','.join(ensembl) or '.',';'.join(diseases) or '.'))
+    os.rename(output + '.tmp',output)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-x','--indexdir',help="index directory",dest='indexdir',type=str,required=True)
+    parser.add_argument('-d','--diGenent',help="DisGeNET gene-disease associations",dest='disgenet',type=str,required=True)
+    parser.add_argument('-e','--gene2ensembl',help="NCBI gene2ensembl",dest='gene2ensembl',type=str,required=True)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('build',help='compile the index')
+    annotate_parser = subparsers.add_parser('annotate',help='annotate a candidate table')
+    annotate_parser.add_argument('-i','--input',help="candidate table",dest='input',type=str,required=True)
+    annotate_parser.add_argument('-o','--output',help="annotated table",dest='output',type=str,required=True)
+    annotate_parser.add_argument('-n','--top',help="diseases per gene [default: 10]",dest='top',type=int,default=10)
+    argv = vars(parser.parse_args())
+
+    index = build_index(argv['indexdir'],argv['disgenet'],argv['gene2ensembl'])
+    if argv['command'] == 'annotate':
+        annotate(index,argv['input'],argv['output'],argv['top'])
+    else:
+        print (index)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,469 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 共享基因型存储, 由 vcf2peddataset 一次构建, 各模块以内存映射方式读取, 不再各自解析文本 vcf
+                   build: 读取 vcf2peddataset 中的 vcf 与 ped, 多等位位点按 alt 拆分, 多个 vcf 按位置流式归并
+                          (某 vcf 中没有的位点其样本记为缺失; 单倍体 1 记为纯合突变); 每个 vcf 按其自身染色体顺序排序即可 (##contig 声明顺序, 无声明时按出现顺序),
+                          归并顺序为各 vcf ##contig 声明的并集, 其后为无声明 vcf 中新出现的染色体; 染色体顺序与之不一致的 vcf 先按染色体拆分到临时文件再按归并顺序读取,
+                          内存与变异数无关; 输出列式存储目录:
+                          meta.json            样本数/变异数/染色体区块/来源文件签名
+                          samples.tsv          样本序号 家系 样本 父 母 性别 是否患病 (来自 ped, 2 为患病)
+                          chrom.u16 pos.u32    每个变异的染色体编号与位置
+                          allele.u64 alleles.txt  等位基因偏移与 "ref\talt" 字符串
+                          genotypes.bin        每个变异两个位平面 (低位/高位, 每个样本 1 bit): 00 纯合参考, 01 杂合, 10 纯合突变, 11 缺失
+                   segregate: 以整数位运算一次判断家系内所有样本, 输出在不少于 -n 个家系中共分离 (显性: 患者均携带且正常人不携带;
+                              隐性: 患者均纯合突变且正常人非纯合突变) 的变异
+                   export: 导出 vcf 或 0/1/2 基因型表, 可按样本/区段选择
+      To run : python3 genostore.py -x storedir build|segregate|export [options]
+      e.g.:
+            python3 genostore.py -x odir/genotype build -ds vcf2peddataset
+            python3 genostore.py -x odir/genotype segregate -m dominant -n 2 -o odir/list/cosegregation.list
+            python3 genostore.py -x odir/genotype export -f vcf -r 1:10000-20000 -s F1 -o F1.region.vcf\033[0m
+'''
+
+import os
+import sys
+import re
+import gzip
+import json
+import mmap
+import heapq
+import shutil
+import bisect
+from array import array
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+VERSION = 3
+COLUMNS = (('chrom','chrom.u16','H'),('pos','pos.u32','I'),('allele','allele.u64','Q'))
+CONTIG = re.compile(r'##contig=<ID=([^,>]+)')
+GT = ('0/0','0/1','1/1','./.')
+GT_TABLE = ('0','1','2','.')
+
+def open_text(file):
+    return gzip.open(file,'rt') if file.endswith('.gz') else open(file)
+
+def read_dataset(vcf2peddataset):
+    """return ([vcf],{family:ped},{vcf:[family]}) of vcf2peddataset: family vcf ped per line"""
+    vcfs,peds,families = [],OrderedDict(),OrderedDict()
+    with open(vcf2peddataset) as IN:
+        for line in IN:
+            items = line.split()
+            if not items or items[0].startswith('#'):
+                continue
+            for item in items[1:]:
+                if item.endswith(('.vcf','.vcf.gz')):
+                    if item not in vcfs:
+                        vcfs.append(item)
+                    families.setdefault(item,[]).append(items[0])
+                elif item.endswith('.ped'):
+                    peds[items[0]] = item
+    return vcfs,peds,families
+
+def read_ped(peds):
+    """{(family,sample):(family,father,mother,sex,affected)}, the same sample id may occur in several families"""
+    pedigree = {}
+    for family,ped in peds.items():
+        if not os.path.isfile(ped):
+            continue
+        with open(ped) as IN:
+            for line in IN:
+                items = line.split()
+                if len(items) < 6 or items[0].startswith('#'):
+                    continue
+                pedigree[(items[0],items[1])] = (items[0],items[2],items[3],items[4],items[5] == '2')
+    return pedigree
+
+def vcf_samples(vcf):
+    with open_text(vcf) as IN:
+        for line in IN:
+            if line.startswith('#CHROM'):
+                return line.rstrip('\n').split('\t')[9:]
+            if not line.startswith('#'):
+                break
+    return []
+
+def genotype_code(gt,alt):
+    """2-bit code of one sample for alt allele number alt; a haploid call carrying alt is homozygous alt"""
+    alleles = re.split(r'[/|]',gt)
+    if '.' in alleles or not gt:
+        return 3
+    count = alleles.count(str(alt)) * (2 if len(alleles) == 1 else 1)
+    return 2 if count >= 2 else count
+
+def contig_header(vcf):
+    """contig ids of the ##contig header lines in order"""
+    contigs = []
+    with open_text(vcf) as IN:
+        for line in IN:
+            if not line.startswith('#'):
+                break
+            match = CONTIG.match(line)
+            if match:
+                contigs.append(match.group(1))
+    return contigs
+
+def file_contigs(vcf):
+    """contigs of the records of vcf in first-seen order"""
+    contigs = OrderedDict()
+    with open_text(vcf) as IN:
+        for line in IN:
+            if not line.startswith('#'):
+                contigs.setdefault(line[:line.find('\t')],None)
+    return list(contigs)
+
+def spill_contigs(vcf,tmpdir):
+    """write the records of vcf into one temporary file per contig; return {chrom:file}"""
+    if not os.path.exists(tmpdir):
+        os.makedirs(tmpdir)
+    files,handles = OrderedDict(),{}
+    with open_text(vcf) as IN:
+        for line in IN:
+            if line.startswith('#'):
+                continue
+            chrom = line[:line.find('\t')]
+            if chrom not in handles:
+                files[chrom] = os.path.join(tmpdir,'{0}.txt'.format(len(files)))
+                handles[chrom] = open(files[chrom],'w')
+            handles[chrom].write(line)
+    for handle in handles.values():
+        handle.close()
+    return files
+
+def record_lines(vcf,parts=None):
+    """data lines of vcf, or of its per-contig parts in the given order"""
+    for file in parts or [vcf]:
+        with open_text(file) as IN:
+            for line in IN:
+                if not line.startswith('#'):
+                    yield line
+
+def vcf_records(vcf,order,parts=None):
+    """yield ((rank,chrom,pos,ref,alt),[codes]) in file order, one per alt allele; order: {chrom:rank}, new contigs are appended
+       the file must be sorted in its own contig order: every contig in one block with increasing positions, blocks in ##contig order if declared
+       parts: per-contig files of vcf (spill_contigs) to read instead, in the shared order
+    """
+    header = {} if parts else dict((j,i) for i,j in enumerate(contig_header(vcf)))
+    group,last,seen = [],None,set()
+    for line in record_lines(vcf,parts):
+        items = line.rstrip('\n').split('\t')
+        chrom,pos = items[0],int(items[1])
+        if (chrom,pos) != last:
+            if last and chrom == last[0] and pos < last[1] or last and chrom != last[0] and (chrom in seen or chrom in header and last[0] in header and header[chrom] < header[last[0]]):
+                raise ValueError('{0} is not sorted at {1}:{2}'.format(vcf,chrom,pos))
+            for record in sorted(group):
+                yield record
+            group,last = [],(chrom,pos)
+            seen.add(chrom)
+            order.setdefault(chrom,len(order))
+        fields = items[8].split(':') if len(items) > 8 else []
+        index = fields.index('GT') if 'GT' in fields else None
+        gts = [i.split(':')[index] if index is not None and len(i.split(':')) > index else '.' for i in items[9:]]
+        for number,alt in enumerate(items[4].split(','),1):
+            if alt in ('.','*'):
+                continue
+            group.append(((order[chrom],chrom,pos,items[3],alt),[genotype_code(i,number) for i in gts]))
+    for record in sorted(group):
+        yield record
+
+def shared_order(vcfs,tmpdir):
+    """({chrom:rank},{vcf index:[per-contig files]}) for merging vcfs
+       the shared contig order is the union of the ##contig headers (first vcf first), then the new contigs of vcfs
+       without a usable header in first-seen order; a vcf whose contig order disagrees with it is split by contig into tmpdir
+    """
+    order,parts = OrderedDict(),{}
+    headers = [contig_header(vcf) for vcf in vcfs]
+    for header in headers:
+        for chrom in header:
+            order.setdefault(chrom,len(order))
+    for index,vcf in enumerate(vcfs):
+        ranks = [order[i] for i in headers[index]]
+        if ranks and ranks == sorted(ranks):
+            continue
+        contigs = file_contigs(vcf)
+        for chrom in contigs:
+            order.setdefault(chrom,len(order))
+        if [order[i] for i in contigs] != sorted(order[i] for i in contigs):
+            ## 染色体顺序与归并顺序不一致: 按染色体拆分到临时文件, 按归并顺序流式读取 ##
+            files = spill_contigs(vcf,os.path.join(tmpdir,str(index)))
+            parts[index] = [files[i] for i in sorted(files,key=order.get)]
+    return order,parts
+
+def tagged_records(vcf,index,order,parts):
+    last = None
+    for key,codes in vcf_records(vcf,order,parts.get(index)):
+        ## 未在 ##contig 中声明的染色体排在最后, 其后不能再出现已声明的染色体 ##
+        if last and key[:3] < last:
+            raise ValueError('{0}: contig {1} is not declared in its ##contig header'.format(vcf,last[1]))
+        last = key[:3]
+        yield key,index,codes
+
+def planes(codes,base):
+    """(low plane,high plane) integers of codes of samples base.."""
+    low = high = 0
+    for i,code in enumerate(codes):
+        if code & 1:
+            low |= 1 << (base + i)
+        if code & 2:
+            high |= 1 << (base + i)
+    return low,high
+
+def source_signature(vcf2peddataset,vcfs,peds):
+    return [[i,os.path.getsize(i),int(os.path.getmtime(i))] for i in [vcf2peddataset] + vcfs + list(peds.values()) if os.path.isfile(i)]
+
+def build_store(vcf2peddataset,storedir):
+    """build storedir unless its sources are unchanged; return number of variants"""
+    vcfs,peds,families = read_dataset(vcf2peddataset)
+    signature = source_signature(vcf2peddataset,vcfs,peds)
+    meta = os.path.join(storedir,'meta.json')
+    if os.path.isfile(meta):
+        with open(meta) as IN:
+            old = json.load(IN)
+        if old['version'] == VERSION and old['sources'] == signature:
+            return old['variants']
+    if not os.path.exists(storedir):
+        os.makedirs(storedir)
+    pedigree = read_ped(peds)
+    ## 每个 vcf 的样本在存储中连续编号 ##
+    samples,bases = [],[]
+    for vcf in vcfs:
+        bases.append(len(samples))
+        samples.extend((families[vcf],i) for i in vcf_samples(vcf))
+    nbytes = (len(samples) + 7) // 8
+    ## 每个 vcf 的样本位掩码, 某 vcf 中没有的变异其样本记为缺失 (11) ##
+    masks = [((1 << (end - base)) - 1) << base for base,end in zip(bases,bases[1:] + [len(samples)])]
+    everyone = (1 << len(samples)) - 1
+    chroms,blocks = OrderedDict(),OrderedDict()
+    columns = {name:array(code) for name,file,code in COLUMNS}
+    handles = {name:open(os.path.join(storedir,file + '.tmp'),'wb') for name,file,code in COLUMNS}
+    count,offset = 0,0
+    with open(os.path.join(storedir,'genotypes.bin.tmp'),'wb') as GENO, open(os.path.join(storedir,'alleles.txt.tmp'),'w') as ALLELE:
+        tmpdir = os.path.join(storedir,'tmp')
+        order,parts = shared_order(vcfs,tmpdir)
+        merged = heapq.merge(*[tagged_records(vcf,index,order,parts) for index,vcf in enumerate(vcfs)])
+        current,low,high,present = None,0,0,0
+        for key,index,codes in merged:
+            if key != current:
+                if current:
+                    missing = everyone & ~present
+                    count,offset = write_variant(current,low | missing,high | missing,nbytes,chroms,blocks,columns,handles,GENO,ALLELE,count,offset)
+                current,low,high,present = key,0,0,0
+            l,h = planes(codes,bases[index])
+            low,high,present = low | l,high | h,present | masks[index]
+        if current:
+            missing = everyone & ~present
+            count,offset = write_variant(current,low | missing,high | missing,nbytes,chroms,blocks,columns,handles,GENO,ALLELE,count,offset)
+        if os.path.exists(tmpdir):
+            shutil.rmtree(tmpdir)
+    for name,handle in handles.items():
+        columns[name].tofile(handle)
+        handle.close()
+    with open(os.path.join(storedir,'samples.tsv.tmp'),'w') as OUT:
+        OUT.write('#Index\tFamily\tSample\tFather\tMother\tSex\tAffected\n')
+        for i,(vcffamilies,sample) in enumerate(samples):
+            record = [pedigree[(family,sample)] for family in vcffamilies if (family,sample) in pedigree]
+            family,father,mother,sex,affected = record[0] if record else ('.','0','0','0',False)
+            OUT.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\n'.format(i,family,sample,father,mother,sex,int(affected)))
+    for file in [i[1] for i in COLUMNS] + ['genotypes.bin','alleles.txt','samples.tsv']:
+        os.rename(os.path.join(storedir,file + '.tmp'),os.path.join(storedir,file))
+    with open(meta,'w') as OUT:
+        json.dump({'version':VERSION,'sources':signature,'samples':len(samples),'variants':count,'bytes':nbytes,'chroms':list(chroms),'blocks':blocks},OUT)
+    return count
+
+def write_variant(key,low,high,nbytes,chroms,blocks,columns,handles,GENO,ALLELE,count,offset):
+    rank,chrom,pos,ref,alt = key
+    code = chroms.setdefault(chrom,len(chroms))
+    blocks.setdefault(chrom,[count,count])[1] = count + 1
+    columns['chrom'].append(code)
+    columns['pos'].append(pos)
+    columns['allele'].append(offset)
+    text = '{0}\t{1}\n'.format(ref,alt)
+    ALLELE.write(text)
+    GENO.write(low.to_bytes(nbytes,'little') + high.to_bytes(nbytes,'little'))
+    ## 列缓冲定期写出, 内存与变异数无关 ##
+    if len(columns['pos']) >= 1000000:
+        for name,handle in handles.items():
+            columns[name].tofile(handle)
+            del columns[name][:]
+    return count + 1,offset + len(text.encode())
+
+class GenotypeStore(object):
+    """memory-mapped reader of a genotype store directory"""
+    def __init__(self,storedir):
+        with open(os.path.join(storedir,'meta.json')) as IN:
+            meta = json.load(IN)
+        self.nsamples,self.nvariants,self.nbytes = meta['samples'],meta['variants'],meta['bytes']
+        self.chroms,self.blocks = meta['chroms'],meta['blocks']
+        self.handles,self.columns = [],{}
+        for name,file,code in COLUMNS + (('genotypes','genotypes.bin','B'),('alleles','alleles.txt','B')):
+            handle = open(os.path.join(storedir,file),'rb')
+            self.handles.append(handle)
+            data = mmap.mmap(handle.fileno(),0,access=mmap.ACCESS_READ) if os.path.getsize(handle.name) else b''
+            self.columns[name] = memoryview(data).cast(code) if name not in ('genotypes','alleles') else data
+        self.samples = []
+        with open(os.path.join(storedir,'samples.tsv')) as IN:
+            for line in IN:
+                if line.startswith('#'):
+                    continue
+                index,family,sample,father,mother,sex,affected = line.rstrip('\n').split('\t')
+                self.samples.append({'index':int(index),'family':family,'sample':sample,'father':father,'mother':mother,'sex':sex,'affected':affected == '1'})
+
+    def variant(self,i):
+        """(chrom,pos,ref,alt) of variant i"""
+        start = self.columns['allele'][i]
+        end = self.columns['allele'][i + 1] if i + 1 < self.nvariants else len(self.columns['alleles'])
+        ref,alt = self.columns['alleles'][start:end].decode().rstrip('\n').split('\t')
+        return self.chroms[self.columns['chrom'][i]],self.columns['pos'][i],ref,alt
+
+    def planes(self,i):
+        """(low,high) bit planes of variant i as integers, bit j is sample j"""
+        start = i * self.nbytes * 2
+        data = self.columns['genotypes']
+        return int.from_bytes(data[start:start + self.nbytes],'little'),int.from_bytes(data[start + self.nbytes:start + self.nbytes * 2],'little')
+
+    def genotypes(self,i):
+        """[0/1/2/None] of all samples at variant i"""
+        low,high = self.planes(i)
+        codes = [((high >> j) & 1) << 1 | ((low >> j) & 1) for j in range(self.nsamples)]
+        return [None if code == 3 else code for code in codes]
+
+    def mask(self,samples):
+        """bit mask of sample names or indexes"""
+        names = {i['sample']:i['index'] for i in self.samples}
+        value = 0
+        for sample in samples:
+            value |= 1 << (sample if isinstance(sample,int) else names[sample])
+        return value
+
+    def family_masks(self,families=None):
+        """OrderedDict family:(affected mask,unaffected mask)"""
+        masks = OrderedDict()
+        for sample in self.samples:
+            if families and sample['family'] not in families:
+                continue
+            affected,unaffected = masks.get(sample['family'],(0,0))
+            if sample['affected']:
+                affected |= 1 << sample['index']
+            else:
+                unaffected |= 1 << sample['index']
+            masks[sample['family']] = (affected,unaffected)
+        return masks
+
+    def region(self,region=None):
+        """range of variant indexes in 'chrom[:start-end]', all variants when region is None"""
+        if not region:
+            return range(self.nvariants)
+        chrom,_,span = region.partition(':')
+        if chrom not in self.blocks:
+            return range(0)
+        first,last = self.blocks[chrom]
+        if not span:
+            return range(first,last)
+        start,_,end = span.replace(',','').partition('-')
+        positions = self.columns['pos']
+        low = bisect.bisect_left(positions,int(start),first,last)
+        high = bisect.bisect_right(positions,int(end),low,last) if end else last
+        return range(low,high)
+
+    def segregating(self,mode='dominant',minfamily=1,families=None,region=None):
+        """yield (variant index,[families]) co-segregating in >= minfamily families
+           dominant: every affected carries the alt allele and no unaffected carries it
+           recessive: every affected is homozygous alt and no unaffected is
+        """
+        masks = [(family,affected,unaffected) for family,(affected,unaffected) in self.family_masks(families).items() if affected]
+        for i in self.region(region):
+            low,high = self.planes(i)
+            call = (low ^ high) if mode == 'dominant' else (high & ~low)
+            hits = [family for family,affected,unaffected in masks if call & affected == affected and not call & unaffected]
+            if len(hits) >= minfamily:
+                yield i,hits
+
+    def close(self):
+        for name in list(self.columns):
+            if isinstance(self.columns[name],memoryview):
+                self.columns[name].release()
+        self.columns = {}
+        for handle in self.handles:
+            handle.close()
+
+def export(store,output,fmt='vcf',samples=None,region=None,nonref=True):
+    """write selected samples of store as vcf or 0/1/2 table; return number of variants written"""
+    indexes = [i['index'] for i in store.samples] if not samples else [i['index'] for i in store.samples if i['sample'] in samples or i['family'] in samples]
+    mask = store.mask(indexes)
+    codes = GT if fmt == 'vcf' else GT_TABLE
+    count = 0
+    with open(output,'w') as OUT:
+        names = '\t'.join(store.samples[i]['sample'] for i in indexes)
+        if fmt == 'vcf':
+            OUT.write('##fileformat=VCFv4.2\n##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+            OUT.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{0}\n'.format(names))
+        else:
+            OUT.write('#Chr\tPos\tRef\tAlt\t{0}\n'.format(names))
+        for i in store.region(region):
+            low,high = store.planes(i)
+            if nonref and not (low | high) & ~(low & high) & mask:
+                continue
+            ## 位平面转为每个样本一个字符, 避免逐样本移位 ##
+            lows,highs = format(low,'0{0}b'.format(store.nsamples))[::-1],format(high,'0{0}b'.format(store.nsamples))[::-1]
+            gts = '\t'.join(codes[int(highs[j]) * 2 + int(lows[j])] for j in indexes)
+            chrom,pos,ref,alt = store.variant(i)
+            if fmt == 'vcf':
+                OUT.write('{0}\t{1}\t.\t{2}\t{3}\t.\t.\t.\tGT\t{4}\n'.format(chrom,pos,ref,alt,gts))
+            else:
+                OUT.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(chrom,pos,ref,alt,gts))
+            count += 1
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-x','--store',help="genotype store directory",dest='store',type=str,required=True)
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser('build',help='build the store from vcf2peddataset')
+    build_parser.add_argument('-ds','--dataset',help="vcf2peddataset",dest='dataset',type=str,required=True)
+    segregate_parser = subparsers.add_parser('segregate',help='variants co-segregating in families')
+    segregate_parser.add_argument('-m','--mode',help="dominant|recessive [default: dominant]",dest='mode',type=str,choices=['dominant','recessive'],default='dominant')
+    segregate_parser.add_argument('-n','--minfamily',help="min co-segregating families [default: 1]",dest='minfamily',type=int,default=1)
+    segregate_parser.add_argument('-f','--family',help="families [default: all]",dest='family',type=str,nargs='+')
+    segregate_parser.add_argument('-r','--region',help="chrom[:start-end]",dest='region',type=str)
+    segregate_parser.add_argument('-o','--output',help="output list",dest='output',type=str,required=True)
+    export_parser = subparsers.add_parser('export',help='export vcf or genotype table')
+    export_parser.add_argument('-f','--format',help="vcf|table [default: vcf]",dest='format',type=str,choices=['vcf','table'],default='vcf')
+    export_parser.add_argument('-s','--sample',help="samples or families [default: all]",dest='sample',type=str,nargs='+')
+    export_parser.add_argument('-r','--region',help="chrom[:start-end]",dest='region',type=str)
+    export_parser.add_argument('-a','--all',help="also write variants without alt allele in the selected samples",dest='all',action='store_true')
+    export_parser.add_argument('-o','--output',help="output file",dest='output',type=str,required=True)
+    argv = vars(parser.parse_args())
+
+    if argv['command'] == 'build':
+        if not os.path.isfile(argv['dataset']):
+            sys.stderr.write('\033[1;31;40mgenostore - ERROR - input: No such file {0}\033[0m\n'.format(argv['dataset']))
+            exit(1)
+        print ('{0}\t{1} variants'.format(argv['store'],build_store(argv['dataset'],argv['store'])))
+    elif argv['command'] == 'segregate':
+        store = GenotypeStore(argv['store'])
+        count = 0
+        with open(argv['output'],'w') as OUT:
+            OUT.write('#Chr\tPos\tRef\tAlt\tFamilyCount\tFamilies\n')
+            for i,families in store.segregating(argv['mode'],argv['minfamily'],argv['family'],argv['region']):
+                OUT.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\n'.format(*(store.variant(i) + (len(families),','.join(families)))))
+                count += 1
+        store.close()
+        print ('{0}\t{1} co-segregating variants'.format(argv['output'],count))
+    elif argv['command'] == 'export':
+        store = GenotypeStore(argv['store'])
+        print ('{0}\t{1} variants'.format(argv['output'],export(store,argv['output'],argv['format'],argv['sample'],argv['region'],not argv['all'])))
+        store.close()
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
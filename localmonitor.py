@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 本地依赖调度器, 读取 all_dependence.txt 并在本机以进程池运行各步骤, 作为 monitor taskmonitor + 集群队列的替代
+      依赖文件格式: 每行 "上游shell:内存 下游shell:内存", 只有一列时为无依赖步骤, 内存即各模块 *_memory 配置中的值 (如 2G, 500M)
+      调度规则: 上游全部成功的步骤才会被提交; 同时运行的步骤内存之和不超过 -m; 失败步骤重试 -r 次, 仍失败则跳过其下游, 其余独立分支继续运行
+                内存不足失败 (被 SIGKILL 或本次运行写入 shell.e 的内容有内存不足信息) 的步骤以两倍内存申请额外重试一次, 不计入 -r 次数
+      To run : python3 localmonitor.py [options]
+      options: -i dependence file [required]
+               -m memory budget of this machine, e.g. 120G [default: physical memory]
+               -p max parallel jobs [default: cpu count]
+               -r retry times of failed jobs [default: 1]
+      e.g.:
+            python3 localmonitor.py -i odir/list/all_dependence.txt -m 120G -p 32 -r 1\033[0m
+'''
+
+import os
+import sys
+import re
+import time
+import heapq
+import subprocess
+import threading
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+UNITS = {'K':1024,'M':1024**2,'G':1024**3,'T':1024**4}
+
+def parse_memory(mem):
+    """'2G' / '500M' / '1.5g' -> bytes"""
+    mem = str(mem).strip().upper().rstrip('B')
+    if mem and mem[-1] in UNITS:
+        return int(float(mem[:-1]) * UNITS[mem[-1]])
+    return int(float(mem))
+
+def format_memory(size):
+    """bytes -> '2G' style string used by the *_memory config sections"""
+    for unit in ('T','G','M','K'):
+        if size >= UNITS[unit]:
+            value = size / UNITS[unit]
+            return '{0}{1}'.format(int(value) if value == int(value) else round(value,1),unit)
+    return str(int(size))
+
+def physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError,OSError,AttributeError):
+        return UNITS['G'] * 8
+
+def read_dependence(files):
+    """return (jobs,upstream)
+       jobs: {shell:memory string} in file order
+       upstream: {shell:set(upstream shells)}
+    """
+    jobs,upstream = {},{}
+    for file in files:
+        with open(file) as IN:
+            for line in IN:
+                items = line.split()
+                if not items or items[0].startswith('#'):
+                    continue
+                nodes = []
+                for item in items:
+                    shell,mem = item.rsplit(':',1) if ':' in item else (item,'1G')
+                    jobs.setdefault(shell,mem)
+                    upstream.setdefault(shell,set())
+                    nodes.append(shell)
+                for before,after in zip(nodes,nodes[1:]):
+                    upstream[after].add(before)
+    return jobs,upstream
+
+def downstream_of(upstream):
+    """invert an upstream map"""
+    downstream = {i:set() for i in upstream}
+    for shell,ups in upstream.items():
+        for up in ups:
+            downstream[up].add(shell)
+    return downstream
+
+OOM_PATTERN = re.compile(r'OutOfMemoryError|MemoryError|std::bad_alloc|Cannot allocate memory|Out of memory|oom-kill')
+
+def error_size(shell):
+    """current size of shell.e, the offset where the next attempt starts writing"""
+    return os.path.getsize('{0}.e'.format(shell)) if os.path.isfile('{0}.e'.format(shell)) else 0
+
+def is_oom(status,shell=None,offset=0):
+    """killed by SIGKILL (exit status 137 from sh, -9 from subprocess) or an out of memory message in shell.e
+       only the bytes written after offset (by the current attempt) are scanned, at most the last 64KB
+    """
+    if status in (137,-9):
+        return True
+    if shell and os.path.isfile('{0}.e'.format(shell)):
+        with open('{0}.e'.format(shell),'rb') as IN:
+            IN.seek(max(offset,os.path.getsize('{0}.e'.format(shell)) - 65536))
+            return bool(OOM_PATTERN.search(IN.read().decode('utf-8','replace')))
+    return False
+
+def run_shell(shell):
+    """run one step shell, stdout/stderr go to shell.o/shell.e; return exit status"""
+    with open('{0}.o'.format(shell),'a') as out, open('{0}.e'.format(shell),'a') as err:
+        return subprocess.call(['sh',shell],stdout=out,stderr=err,cwd=os.path.dirname(os.path.abspath(shell)))
+
+class LocalMonitor(object):
+    """memory-aware local scheduler over the merged dependence graph"""
+    def __init__(self,jobs,upstream,memory,maxjobs,retry,runner=run_shell):
+        self.jobs = jobs
+        self.upstream = upstream
+        self.downstream = downstream_of(upstream)
+        self.request = {i:parse_memory(jobs[i]) for i in jobs}
+        self.memory = memory
+        self.maxjobs = maxjobs
+        self.retry = retry
+        self.runner = runner
+        self.state = {i:'pending' for i in jobs}
+        self.tries = {i:0 for i in jobs}
+        self.oomretried = set()
+        self.used = 0
+        self.running = 0
+        self.cond = threading.Condition()
+        ## 就绪队列按依赖文件中的顺序, 上游全部完成时加入, 避免每次调度扫描全部步骤 ##
+        self.order = {shell:i for i,shell in enumerate(jobs)}
+        self.waiting = {i:len(upstream[i]) for i in jobs}
+        self.queue = [(self.order[i],i) for i in jobs if not self.waiting[i]]
+
+    def log(self,message):
+        sys.stdout.write('[{0}] {1}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'),message))
+        sys.stdout.flush()
+
+    def ready(self,shell):
+        heapq.heappush(self.queue,(self.order[shell],shell))
+
+    def skip(self,shell):
+        for i in self.downstream[shell]:
+            if self.state[i] == 'pending':
+                self.state[i] = 'skipped'
+                self.log('skip {0}: upstream {1} failed'.format(i,shell))
+                self.skip(i)
+
+    def finish(self,shell,status,offset=0):
+        with self.cond:
+            self.used -= self.request[shell]
+            self.running -= 1
+            if status == 0:
+                self.state[shell] = 'done'
+                self.log('done {0}'.format(shell))
+                for i in self.downstream[shell]:
+                    self.waiting[i] -= 1
+                    if not self.waiting[i] and self.state[i] == 'pending':
+                        self.ready(i)
+            elif shell not in self.oomretried and is_oom(status,shell,offset):
+                ## 内存不足时以两倍内存申请重试一次 (不计入 -r 重试次数) ##
+                self.oomretried.add(shell)
+                self.request[shell] *= 2
+                self.state[shell] = 'pending'
+                self.ready(shell)
+                self.log('retry {0}: out of memory, request {1}'.format(shell,format_memory(self.request[shell])))
+            elif self.tries[shell] < self.retry:
+                self.tries[shell] += 1
+                self.state[shell] = 'pending'
+                self.ready(shell)
+                self.log('retry {0}: exit status {1}'.format(shell,status))
+            else:
+                self.state[shell] = 'failed'
+                self.log('failed {0}: exit status {1}'.format(shell,status))
+                self.skip(shell)
+            self.cond.notify_all()
+
+    def work(self,shell):
+        offset = error_size(shell)
+        try:
+            status = self.runner(shell)
+        except Exception as e:
+            self.log('error {0}: {1}'.format(shell,e))
+            status = -1
+        self.finish(shell,status,offset)
+
+    def run(self):
+        """block until every job is done, failed or skipped; return number of failed jobs"""
+        with self.cond:
+            while True:
+                deferred = []
+                while self.queue and self.running < self.maxjobs:
+                    item = heapq.heappop(self.queue)
+                    shell = item[1]
+                    if self.state[shell] != 'pending':
+                        continue
+                    ## 单个步骤超过总内存时, 仅在空闲时独占运行 ##
+                    if self.used + self.request[shell] > self.memory and self.running:
+                        deferred.append(item)
+                        continue
+                    self.state[shell] = 'running'
+                    self.used += self.request[shell]
+                    self.running += 1
+                    self.log('start {0} ({1})'.format(shell,format_memory(self.request[shell])))
+                    threading.Thread(target=self.work,args=(shell,),daemon=True).start()
+                for item in deferred:
+                    heapq.heappush(self.queue,item)
+                if not self.running:
+                    break
+                self.cond.wait()
+        return len([i for i in self.jobs if self.state[i] in ('failed','skipped')])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-i','--input',help="dependence file(s), e.g. all_dependence.txt",dest='input',type=str,nargs='+',required=True)
+    parser.add_argument('-m','--memory',help="memory budget, e.g. 120G [default: physical memory]",dest='memory',type=str,default=None)
+    parser.add_argument('-p','--processes',help="max parallel jobs [default: cpu count]",dest='processes',type=int,default=os.cpu_count() or 1)
+    parser.add_argument('-r','--retry',help="retry times of failed jobs [default: 1]",dest='retry',type=int,default=1)
+    argv = vars(parser.parse_args())
+
+    memory = parse_memory(argv['memory']) if argv['memory'] else physical_memory()
+    jobs,upstream = read_dependence(argv['input'])
+    monitor = LocalMonitor(jobs,upstream,memory,max(1,argv['processes']),max(0,argv['retry']))
+    failed = monitor.run()
+    if failed:
+        sys.stderr.write('\033[1;31;40mlocalmonitor - ERROR - {0} of {1} jobs failed or skipped\033[0m\n'.format(failed,len(jobs)))
+        exit(1)
+    print ('\033[1;34;47mlocalmonitor: all {0} jobs proceed successfully\033[0m'.format(len(jobs)))
+
+if __name__ == '__main__':
+    main()
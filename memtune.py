@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 按历史运行记录自动设定步骤内存申请 (读取 steptrace.py 的 sqlite 台账)
+                   每个 模块/步骤 取各批次成功运行的峰值内存, 按输入规模缩放: 按家系运行的步骤 (同一批次多个任务) 以 每家系变异数 为规模,
+                   其余步骤以 总变异数 为规模; 两个以上不同规模时线性拟合 (斜率不小于0), 只有一个规模时按比例只放大不缩小,
+                   预测值不低于规模不大于本批次的历史峰值, 也不低于最小的历史峰值; 最近一次内存不足失败之后没有成功运行的步骤至少申请失败时的两倍;
+                   未记录输入规模的批次 (只开启 telemetry 未开启 autoMemory) 不参与预测
+                   申请值 = 预测值 * (1 + margin), 向上取整到 100M; 没有历史记录的步骤使用配置值
+      To run : python3 memtune.py [options]
+      options: -l ledger [required]
+               -ds vcf2peddataset [required]
+               -m module [required]
+               -s memory key, e.g. Intervar_run [required]
+               -g margin [default: 0.2]
+      e.g.:
+            python3 memtune.py -l odir/telemetry/ledger.db -ds vcf2peddataset -m Exomiser -s exomrun\033[0m
+'''
+
+import os
+import sys
+import re
+import json
+import gzip
+import math
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import parse_memory,format_memory,is_oom
+from steptrace import Ledger
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+GRANULARITY = 100 * 1024 ** 2
+
+def count_variants(vcf):
+    with (gzip.open(vcf,'rt') if vcf.endswith('.gz') else open(vcf)) as IN:
+        return sum(1 for line in IN if not line.startswith('#'))
+
+def dataset_scale(vcf2peddataset,cachefile=None):
+    """(variants,families) of vcf2peddataset; variant counts are cached by vcf size/mtime"""
+    cache = {}
+    if cachefile and os.path.isfile(cachefile):
+        with open(cachefile) as IN:
+            cache = json.load(IN)
+    families,variants = set(),0
+    with open(vcf2peddataset) as IN:
+        for line in IN:
+            items = line.split()
+            if not items or items[0].startswith('#'):
+                continue
+            families.add(items[0])
+            for item in items[1:]:
+                if item.endswith(('.vcf','.vcf.gz')) and os.path.isfile(item):
+                    signature = '{0}:{1}:{2}'.format(os.path.abspath(item),os.path.getsize(item),int(os.path.getmtime(item)))
+                    if signature not in cache:
+                        cache[signature] = count_variants(item)
+                    variants += cache[signature]
+    if cachefile:
+        if not os.path.exists(os.path.dirname(os.path.abspath(cachefile))):
+            os.makedirs(os.path.dirname(os.path.abspath(cachefile)))
+        with open(cachefile,'w') as OUT:
+            json.dump(cache,OUT)
+    return variants,len(families)
+
+def match_step(step,key):
+    """ledger step name belongs to a *_memory key, e.g. Intervar_run / F1_Intervar_run"""
+    step,key = step.lower(),key.lower()
+    return step == key or bool(re.search(r'(^|[._-]){0}($|[._-])'.format(re.escape(key)),step))
+
+class MemoryModel(object):
+    """predict the memory request of module/key from the ledger history"""
+    def __init__(self,ledger,variants,families,margin=0.2):
+        self.ledger = ledger if isinstance(ledger,Ledger) else Ledger(ledger)
+        self.variants = variants
+        self.families = max(1,families)
+        self.margin = margin
+
+    def history(self,module,key):
+        """[(scale,peak rss)] of successful runs and [requested bytes] of out of memory failures newer than the last success, oldest first"""
+        rows = self.ledger.db.execute('SELECT steps.run,steps.step,steps.shell,steps.memory,steps.maxrss,steps.status,steps.end,runs.variants,runs.families FROM steps JOIN runs ON steps.run = runs.run WHERE steps.module = ? ORDER BY runs.created,steps.end',(module,))
+        runs,oom,latest = {},[],None
+        for run,step,shell,memory,maxrss,status,end,variants,families in rows:
+            if not match_step(step,key):
+                continue
+            if status == 0:
+                latest = end if latest is None else max(latest,end)
+                if not variants:
+                    continue
+                peak,shells,scale = runs.setdefault(run,[0,set(),(variants,max(1,families))])
+                runs[run][0] = max(peak,maxrss)
+                shells.add(shell)
+            elif is_oom(status) and memory not in ('','.'):
+                oom.append((end,parse_memory(memory)))
+        ## 之后又成功运行过的内存不足记录不再作为下限 (SIGKILL 也可能来自超时或人工终止) ##
+        oom = [j for i,j in oom if latest is None or i > latest]
+        points = []
+        for peak,shells,(variants,families) in runs.values():
+            points.append((variants / families if len(shells) > 1 else variants,peak,len(shells) > 1))
+        return points,oom
+
+    def predict(self,module,key):
+        """predicted peak in bytes, None without history"""
+        points,oom = self.history(module,key)
+        if not points:
+            return None
+        perfamily = points[-1][2]
+        x = self.variants / self.families if perfamily else self.variants
+        points = [(i,j) for i,j,k in points if k == perfamily]
+        xs = set(i for i,j in points)
+        if len(xs) > 1:
+            meanx = sum(i for i,j in points) / len(points)
+            meany = sum(j for i,j in points) / len(points)
+            slope = max(0.0,sum((i - meanx) * (j - meany) for i,j in points) / sum((i - meanx) ** 2 for i,j in points))
+            peak = meany + slope * (x - meanx)
+        else:
+            peak = max(j * max(1.0,x / i) if i else j for i,j in points)
+        ## 拟合的截距可能在较小规模外推到所有历史峰值以下, 预测值不低于最小的历史峰值 ##
+        peak = max([peak,min(j for i,j in points)] + [j for i,j in points if i <= x])
+        if oom:
+            peak = max(peak,oom[-1] * 2)
+        return peak
+
+    def request(self,module,key,configured):
+        """memory string for module ini: prediction plus margin, or the configured value without history"""
+        peak = self.predict(module,key)
+        if peak is None:
+            return configured
+        return format_memory(max(1,int(math.ceil(peak * (1 + self.margin) / GRANULARITY))) * GRANULARITY)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-l','--ledger',help="steptrace sqlite ledger",dest='ledger',type=str,required=True)
+    parser.add_argument('-ds','--dataset',help="vcf2peddataset",dest='dataset',type=str,required=True)
+    parser.add_argument('-m','--module',help="module",dest='module',type=str,required=True)
+    parser.add_argument('-s','--step',help="memory key, e.g. Intervar_run",dest='step',type=str,required=True)
+    parser.add_argument('-g','--margin',help="safety margin [default: 0.2]",dest='margin',type=float,default=0.2)
+    argv = vars(parser.parse_args())
+
+    variants,families = dataset_scale(argv['dataset'])
+    model = MemoryModel(argv['ledger'],variants,families,argv['margin'])
+    print ('{0}/{1}\tvariants: {2}\tfamilies: {3}\trequest: {4}'.format(argv['module'],argv['step'],variants,families,model.request(argv['module'],argv['step'],'.')))
+
+if __name__ == '__main__':
+    main()
@@ -15,10 +15,35 @@
                                     FARVAT:[]
                                     Candigene_integration:[Intervar,CMsiteOnly_Case,Exomiser,pVAAST,FARVAT]
                                    }                    
+      [sys] maxModuleJobs: 同时运行的模块数 (默认全部模块并行, 依赖关系由上述relation决定)
+      [sys] scheduler: taskmonitor (默认, 集群投递) 或 local (localmonitor.py 本机调度, 可选 localMemory/localJobs/localRetry)
+                       或 supervisor (supervisor.py 事件驱动监控, 每个步骤写状态文件, 上游失败时下游立即跳过, 按模块实时输出进度;
+                       可选 supervisorSubmit 阻塞式投递命令如 "qsub -sync y -l vf={memory} {shell}" (默认本机运行), supervisorJobs/supervisorMemory/supervisorRetry,
+                       supervisorFailfast 任一步骤失败即终止全部, supervisorDetach 后台运行, 以 python3 supervisor.py -o odir/supervisor attach 查看进度)
+      [sys] incremental: true 时按模块指纹跳过已完成且输入未变化的模块 (buildcache.py, 缓存目录 [sys] cachedir, 默认 odir/cache)
+      [sys] shardFamilies: 大于0时按每N个家系分片运行 shardModules 中的模块 (默认 InterVar), 分片结果由 gather 步骤合并; shardRerun 可指定仅重跑的分片
+      [FARVAT_para]/[pVAAST_para] regionScatter: chrom 或 window (regionSize, 默认10Mb), 按 gff3/geneinfo 基因边界分区段运行并合并基因水平结果 (regionscatter.py),
+                                           每条记录按 POS 只归入一个区段, 区段外的变异进入 outside_regions 区段;
+                                           多重检验校正选项 (regionscatter.GENOME_WIDE: correction/fdr/bonferroni 等) 开启时不分区段, 运行时提示未分区段的模块及原因
+      [sys] annotationCache: InterVar 注释缓存 sqlite 文件 (应在本地磁盘, 只由运行结束前的 load 步骤写入), 相同的 vcf 记录跨批次复用完整注释行, 仅未命中的变异进入 Intervar_run (annocache.py, annotationCacheRows 为缓存上限)
+      [sys] prefilter: true 时先按 [database] 1000g/gnomAD 频率构建内存映射索引 (afindexdir), 一次读取家系 vcf, 为 CMsiteOnly_Case/FARVAT 输出按各自阈值缩减的 vcf (afprefilter.py)
+      [Candigene_integration_para] engine: native 时由 candigene.py 直接整合各方法结果 (流式连接, 按 minmethod/频率过滤并按支持方法数排序), 不启动 Candigene_integration 模块,
+                                           并由 geneindex.py 以预编译的 DisGeNET/gene2ensembl 索引 ([database] geneindexdir) 注释
+      [sys] telemetry: true 时每个步骤经 steptrace.py 包装运行, 记录起止时间/CPU/峰值内存/读写字节数及退出状态, 运行结束后导入 sqlite 台账
+                       ([sys] telemetryLedger, 默认 odir/telemetry/ledger.db) 并输出 odir/telemetry/<批次>.report.txt (模块汇总, 关键路径, 排队等待, 最耗时步骤)
+      [sys] autoMemory: true 时按台账中各步骤历史峰值内存及输入规模 (变异数, 家系数) 预测内存申请并写入各模块 ini (memtune.py, 余量 autoMemoryMargin 默认 0.2),
+                        同时开启 telemetry; local 调度时内存不足失败的步骤以两倍内存重试一次
+      [sys] genotypeStore: true 时由 vcf2peddataset 一次构建列式基因型存储 odir/genotype (genostore.py, 2-bit 位平面基因型矩阵, 变异表, 家系/患病信息),
+                           作为独立步骤与各模块并行运行, 不是任何模块的前置步骤 (目前没有模块读取); 可用 genostore.py segregate/export 或 GenotypeStore 读取 (genotypeStoreMemory 默认 4G)
+      [Exomiser_para] batchFamilies: 大于0时各家系 exomrun 改由 JVM 批处理分析, 每个 JVM 依次分析 batchFamilies 个家系, 数据库每个 JVM 只加载一次 (exomiserpool.py, batchOption 默认 --batch);
+                                     各家系的失败互不影响, 家系的下游只等待所在批次, 为1时每个家系单独运行
+      批量模式: -c 给出多个配置文件时, 各项目分别生成模块任务, 依赖合并到 -b 目录由一个 monitor 调度, Exomiser 工作进程在各项目家系间共享
       To run : python3 multifamily-based.disease.screen.py [options]
-      options: -c config file [required]
+      options: -c config file(s) [required]
+               -b batch output directory [required with several configs]
       e.g.:
-            python3 multifamily-based.disease.screen.py -c multifamily-based.disease.screen.config.example.ini\033[0m
+            python3 multifamily-based.disease.screen.py -c multifamily-based.disease.screen.config.example.ini
+            python3 multifamily-based.disease.screen.py -c project1.ini project2.ini -b batch\033[0m
 '''
 
 Version = "v1.0.0"
@@ -28,6 +53,9 @@ import os
 import sys
 import re
 import glob
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor,FIRST_COMPLETED,wait
 
 import argparse
 from argparse import RawTextHelpFormatter
@@ -35,6 +63,14 @@ from argparse import RawTextHelpFormatter
 Bin=os.path.abspath(os.path.dirname(__file__))
 sys.path.append(Bin+'/../lib')
 from PipMethod import myconf,generateShell,mkdir
+from buildcache import BuildCache,module_fingerprint
+from shardjob import split_dataset,gather_dependence,dependence_ends
+from regionscatter import gene_blocks,make_regions,scatter_dataset,slice_dependence,genome_wide_options
+from annocache import cache_dataset,splice_dependence
+from afprefilter import prefilter_dataset,prefilter_dependence
+from steptrace import instrument,split_job,step_name,trace_shell
+from memtune import MemoryModel,dataset_scale,match_step
+from exomiserpool import pool_dependence
 
 __author__='zhangshouwei'
 __mail__='shouweizhang@genome.cn'
@@ -56,24 +92,88 @@ def check_path(path,status):
             os.makedirs(path)
 
 def generateShell_exe(shell,cmd,module):
+    """return True if the module shell exits with status 0"""
     with open(shell,'w') as shell_open:
         shell_open.writelines('{}\n'.format(cmd))
     try:
-        os.system(cmd)
+        status = os.system(cmd)
     except:
-        print ('\033[1;31;40mPlease check this {}!Some errors has occured!'.format(module))
-        sys.exit(1)
+        status = -1
+    if status != 0:
+        print ('\033[1;31;40mPlease check this {}!Some errors has occured!\033[0m'.format(module))
+        return False
     else:
         print ('\033[1;34;47m{} proceed successfully\033[0m'.format(module))
         print ('{}\n'.format(cmd))
+        return True
+
+def step_memory(cfg,model,module,key):
+    """[<module>_memory] key, or the request predicted from run history when [sys] autoMemory is on"""
+    configured = cfg.get('{0}_memory'.format(module),key)
+    if model is None:
+        return configured
+    request = model.request(module,key,configured)
+    if request != configured:
+        print ('\033[1;34;47m{0} {1} memory: {2} -> {3}\033[0m'.format(module,key,configured,request))
+    return request
+
+def run_module(commands,module):
+    """commands: [(shell,cmd)], one per shard of the module"""
+    return all([generateShell_exe(shell,cmd,module) for shell,cmd in commands])
+
+def toposort(dependent,modules):
+    """Kahn topological order of modules according to dependent"""
+    indegree = {i:len([j for j in dependent[i] if j in modules]) for i in modules}
+    ready = [i for i in modules if indegree[i] == 0]
+    order = []
+    while ready:
+        i = ready.pop(0)
+        order.append(i)
+        for j in modules:
+            if i in dependent[j]:
+                indegree[j] -= 1
+                if indegree[j] == 0:
+                    ready.append(j)
+    if len(order) != len(modules):
+        sys.stderr.write('\033[1;31;40mmultifamily-based.disease.screen pipeline - ERROR - circular module dependence: {0}\033[0m\n'.format(', '.join(sorted(set(modules)-set(order)))))
+        exit(1)
+    return order
 
-def main():
-    '''参数设定'''
-    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
-    parser.add_argument('-c','--config',help="multifamily-based.disease.screen pipeline configuration file: eg: multifamily-based.disease.screen.config.example.ini.",dest='config',type=str,required=True)
-    argv = vars(parser.parse_args())
+def run_module_dag(tasks,dependent,maxjobs):
+    """tasks: {module:[(shell,cmd)]}
+       every module whose upstream modules have finished is started in a worker pool of maxjobs threads,
+       modules downstream of a failed module are skipped
+    """
+    pending = toposort(dependent,list(tasks))
+    done,failed,running = set(),set(),{}
+    with ThreadPoolExecutor(max_workers=maxjobs) as pool:
+        while pending or running:
+            for module in list(pending):
+                upstream = [j for j in dependent[module] if j in tasks]
+                if any(j in failed for j in upstream):
+                    print ('\033[1;31;40m{} skipped because upstream module failed\033[0m'.format(module))
+                    pending.remove(module)
+                    failed.add(module)
+                elif all(j in done for j in upstream):
+                    pending.remove(module)
+                    running[pool.submit(run_module,tasks[module],module)] = module
+            if not running:
+                continue
+            finished,_ = wait(running,return_when=FIRST_COMPLETED)
+            for future in finished:
+                module = running.pop(future)
+                if future.result():
+                    done.add(module)
+                else:
+                    failed.add(module)
+    if failed:
+        print ('\033[1;31;40mPlease check these modules: {}!\033[0m'.format(', '.join(sorted(failed))))
+        exit(1)
 
-    config = argv['config'].strip()
+def screen(config):
+    """run the module pipelines of one config and write odir/list/all_dependence.txt
+       return the project settings used for submission, None if every module is up to date
+    """
     allmodule = {'InterVar':0,
                 'CMsiteOnly_Case':0,
                 'Exomiser':0,
@@ -130,7 +230,25 @@ def main():
     listdir = os.path.join(odir,'list')
     configdir = os.path.join(odir,'config')
     mkdir([shelldir,processdir,listdir,configdir])
-    dependent_list = []
+    dependent_list = {}
+    tasks = {}
+    native_candigene = None
+
+    ## 步骤级运行记录及按历史记录自动设定内存申请 ##
+    autoMemory = cfg.has_option('sys','autoMemory') and cfg.getboolean('sys','autoMemory')
+    telemetry = autoMemory or (cfg.has_option('sys','telemetry') and cfg.getboolean('sys','telemetry'))
+    tracedir = os.path.join(odir,'telemetry')
+    ledger = cfg.get('sys','telemetryLedger') if cfg.has_option('sys','telemetryLedger') else os.path.join(tracedir,'ledger.db')
+    ## 共享基因型存储: 由 vcf2peddataset 构建一次 ##
+    genotypedir = os.path.join(odir,'genotype') if cfg.has_option('sys','genotypeStore') and cfg.getboolean('sys','genotypeStore') else None
+    memoryModel = None
+    variants,families = 0,0
+    if autoMemory:
+        ## 输入规模只用于内存预测, 只开启 telemetry 时不读取 vcf ##
+        variants,families = dataset_scale(vcf2peddataset,os.path.join(tracedir,'scale.json'))
+        if os.path.isfile(ledger):
+            memoryMargin = cfg.getfloat('sys','autoMemoryMargin') if cfg.has_option('sys','autoMemoryMargin') else 0.2
+            memoryModel = MemoryModel(ledger,variants,families,memoryMargin)
 
     ## Analysis Module Part ##
     ## Intervar Module ##
@@ -154,18 +272,18 @@ def main():
         InterVar_cfg.set('software','monitor',cfg.get('software','monitor'))
         InterVar_cfg.set('database','database_intervar',cfg.get('database','database_intervar'))
         InterVar_cfg.set('database','database_locat',cfg.get('database','database_locat'))
-        InterVar_cfg.set('memory','Intervar_run',cfg.get('InterVar_memory','Intervar_run'))
-        InterVar_cfg.set('memory','family_integrate',cfg.get('InterVar_memory','family_integrate'))
-        InterVar_cfg.set('memory','add_genotype',cfg.get('InterVar_memory','add_genotype'))
-        InterVar_cfg.set('memory','all_intergrate',cfg.get('InterVar_memory','all_intergrate'))
-        InterVar_cfg.set('memory','upload',cfg.get('InterVar_memory','upload'))
+        InterVar_cfg.set('memory','Intervar_run',step_memory(cfg,memoryModel,'InterVar','Intervar_run'))
+        InterVar_cfg.set('memory','family_integrate',step_memory(cfg,memoryModel,'InterVar','family_integrate'))
+        InterVar_cfg.set('memory','add_genotype',step_memory(cfg,memoryModel,'InterVar','add_genotype'))
+        InterVar_cfg.set('memory','all_intergrate',step_memory(cfg,memoryModel,'InterVar','all_intergrate'))
+        InterVar_cfg.set('memory','upload',step_memory(cfg,memoryModel,'InterVar','upload'))
         InterVar_cfg.set('genomeedition','gedition',cfg.get('sys','gedition'))
         InterVar_cfg.write(open('{0}/InterVar.ini'.format(configdir), "w"))
 
         shell = os.path.join(tasklog,'InterVar.sh')
-        cmd = '{0} {1}/InterVar/bin/InterVar_pipeline.py -ds {2} -conf {3}/InterVar.ini -moption "taskmonitor -q {4}" -md InterVar -o {5}'.format(cfg.get('software','python3'),moduledir,vcf2peddataset,configdir,cfg.get('sys','queue'),odir)
-        generateShell_exe(shell,cmd,'InterVar')
-        dependent_list.append('%s/InterVar_dependence.txt' %(listdir))
+        cmd = '{0} {1}/InterVar/bin/InterVar_pipeline.py -ds {2} -conf {3}/InterVar.ini -moption "taskmonitor -q {4}" -md InterVar -o {5}'.format(cfg.get('software','python3'),moduledir,'{ds}',configdir,cfg.get('sys','queue'),'{o}')
+        tasks['InterVar'] = (shell,cmd)
+        dependent_list['InterVar'] = '%s/InterVar_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('InterVar'))
         exit(1)
@@ -186,12 +304,12 @@ def main():
         cmsc_cfg.set('software','python3',cfg.get('software','python3'))
         cmsc_cfg.set('software','perl',cfg.get('software','perl'))
         cmsc_cfg.set('software','monitor',cfg.get('software','monitor'))
-        cmsc_cfg.set('memory','rarebasic',cfg.get('CMsiteOnly_Case_memory','rarebasic'))
-        cmsc_cfg.set('memory','familyscreen',cfg.get('CMsiteOnly_Case_memory','familyscreen'))
-        cmsc_cfg.set('memory','pathogenityscreen',cfg.get('CMsiteOnly_Case_memory','pathogenityscreen'))
-        cmsc_cfg.set('memory','gnomADscreen',cfg.get('CMsiteOnly_Case_memory','gnomADscreen'))
-        cmsc_cfg.set('memory','stat',cfg.get('CMsiteOnly_Case_memory','stat'))
-        cmsc_cfg.set('memory','upload',cfg.get('CMsiteOnly_Case_memory','upload'))
+        cmsc_cfg.set('memory','rarebasic',step_memory(cfg,memoryModel,'CMsiteOnly_Case','rarebasic'))
+        cmsc_cfg.set('memory','familyscreen',step_memory(cfg,memoryModel,'CMsiteOnly_Case','familyscreen'))
+        cmsc_cfg.set('memory','pathogenityscreen',step_memory(cfg,memoryModel,'CMsiteOnly_Case','pathogenityscreen'))
+        cmsc_cfg.set('memory','gnomADscreen',step_memory(cfg,memoryModel,'CMsiteOnly_Case','gnomADscreen'))
+        cmsc_cfg.set('memory','stat',step_memory(cfg,memoryModel,'CMsiteOnly_Case','stat'))
+        cmsc_cfg.set('memory','upload',step_memory(cfg,memoryModel,'CMsiteOnly_Case','upload'))
         cmsc_cfg.set('genomeedition','gedition',cfg.get('sys','gedition')) 
         cmsc_cfg.set('para','1000g',cfg.get('CMsiteOnly_Case_para','1000g'))
         cmsc_cfg.set('para','gnomAD',cfg.get('CMsiteOnly_Case_para','gnomAD'))
@@ -199,9 +317,9 @@ def main():
         cmsc_cfg.write(open('{0}/CMsiteOnly_Case.ini'.format(configdir), "w"))
 
         shell = os.path.join(tasklog,'CMsiteOnly_Case.sh')
-        cmd = '{0} {1}/CMsiteOnly_Case/bin/CMsiteOnly_Case.pipeline.py -ds {2} -conf {3}/CMsiteOnly_Case.ini -il {4}/{5}.list -moption "taskmonitor -q {6}" -md CMsiteOnly_Case -o {7}'.format(cfg.get('software','python3'),moduledir,vcf2peddataset,configdir,listdir,'InterVar',cfg.get('sys','queue'),odir)
-        generateShell_exe(shell,cmd,'CMsiteOnly_Case')
-        dependent_list.append('%s/CMsiteOnly_Case_dependence.txt' %(listdir))
+        cmd = '{0} {1}/CMsiteOnly_Case/bin/CMsiteOnly_Case.pipeline.py -ds {2} -conf {3}/CMsiteOnly_Case.ini -il {4}/{5}.list -moption "taskmonitor -q {6}" -md CMsiteOnly_Case -o {7}'.format(cfg.get('software','python3'),moduledir,'{ds}',configdir,'{ldir}','InterVar',cfg.get('sys','queue'),'{o}')
+        tasks['CMsiteOnly_Case'] = (shell,cmd)
+        dependent_list['CMsiteOnly_Case'] = '%s/CMsiteOnly_Case_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('CMsiteOnly_Case'))
         exit(1)
@@ -223,11 +341,11 @@ def main():
         Exomiser_cfg.set('software','java',cfg.get('software','java'))
         Exomiser_cfg.set('software','monitor',cfg.get('software','monitor'))
         Exomiser_cfg.set('software','exomiser',cfg.get('software','exomiser'))
-        Exomiser_cfg.set('memory','exomconfig',cfg.get('Exomiser_memory','exomconfig'))
-        Exomiser_cfg.set('memory','exomrun',cfg.get('Exomiser_memory','exomrun'))
-        Exomiser_cfg.set('memory','exomfilter',cfg.get('Exomiser_memory','exomfilter'))
-        Exomiser_cfg.set('memory','stat',cfg.get('Exomiser_memory','stat'))
-        Exomiser_cfg.set('memory','upload',cfg.get('Exomiser_memory','upload'))
+        Exomiser_cfg.set('memory','exomconfig',step_memory(cfg,memoryModel,'Exomiser','exomconfig'))
+        Exomiser_cfg.set('memory','exomrun',step_memory(cfg,memoryModel,'Exomiser','exomrun'))
+        Exomiser_cfg.set('memory','exomfilter',step_memory(cfg,memoryModel,'Exomiser','exomfilter'))
+        Exomiser_cfg.set('memory','stat',step_memory(cfg,memoryModel,'Exomiser','stat'))
+        Exomiser_cfg.set('memory','upload',step_memory(cfg,memoryModel,'Exomiser','upload'))
         Exomiser_cfg.set('genomeedition','gedition',cfg.get('sys','gedition'))
         Exomiser_cfg.set('database','exomiser_data',cfg.get('database','exomiser_data'))
         Exomiser_cfg.set('database','version',cfg.get('database','version'))
@@ -235,9 +353,9 @@ def main():
         Exomiser_cfg.write(open('{0}/Exomiser.ini'.format(configdir), "w"))
 
         shell = os.path.join(tasklog,'Exomiser.sh')
-        cmd = '{0} {1}/Exomiser/bin/Exomiser.pipeline.py -ds {2} -conf {3}/Exomiser.ini -fhpo {4} -ih {5} -moption "taskmonitor -q {6}" -md Exomiser -o {7}'.format(cfg.get('software','python3'),moduledir,vcf2peddataset,configdir,cfg.get('sys','familyhpo'),cfg.get('Exomiser_para','inheritance'),cfg.get('sys','queue'),odir)
-        generateShell_exe(shell,cmd,'Exomiser')
-        dependent_list.append('%s/Exomiser_dependence.txt' %(listdir))
+        cmd = '{0} {1}/Exomiser/bin/Exomiser.pipeline.py -ds {2} -conf {3}/Exomiser.ini -fhpo {4} -ih {5} -moption "taskmonitor -q {6}" -md Exomiser -o {7}'.format(cfg.get('software','python3'),moduledir,'{ds}',configdir,'{fhpo}',cfg.get('Exomiser_para','inheritance'),cfg.get('sys','queue'),'{o}')
+        tasks['Exomiser'] = (shell,cmd)
+        dependent_list['Exomiser'] = '%s/Exomiser_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('Exomiser'))
         exit(1)
@@ -260,11 +378,11 @@ def main():
         FARVAT_cfg.set('software','tabix',cfg.get('software','tabix'))
         FARVAT_cfg.set('software','vcftools',cfg.get('software','vcftools'))
         FARVAT_cfg.set('software','vcfmerge',cfg.get('software','vcfmerge'))
-        FARVAT_cfg.set('memory','prepedvcf',cfg.get('FARVAT_memory','prepedvcf'))
-        FARVAT_cfg.set('memory','snpvcfmerge',cfg.get('FARVAT_memory','snpvcfmerge'))
-        FARVAT_cfg.set('memory','farvat',cfg.get('FARVAT_memory','farvat'))
-        FARVAT_cfg.set('memory','stat',cfg.get('FARVAT_memory','stat'))
-        FARVAT_cfg.set('memory','upload',cfg.get('FARVAT_memory','upload'))
+        FARVAT_cfg.set('memory','prepedvcf',step_memory(cfg,memoryModel,'FARVAT','prepedvcf'))
+        FARVAT_cfg.set('memory','snpvcfmerge',step_memory(cfg,memoryModel,'FARVAT','snpvcfmerge'))
+        FARVAT_cfg.set('memory','farvat',step_memory(cfg,memoryModel,'FARVAT','farvat'))
+        FARVAT_cfg.set('memory','stat',step_memory(cfg,memoryModel,'FARVAT','stat'))
+        FARVAT_cfg.set('memory','upload',step_memory(cfg,memoryModel,'FARVAT','upload'))
         FARVAT_cfg.set('genomeedition','gedition',cfg.get('sys','gedition'))
         FARVAT_cfg.set('database','1000g',cfg.get('database','1000g'))
         FARVAT_cfg.set('database','geneinfo',cfg.get('database','geneinfo'))
@@ -274,9 +392,9 @@ def main():
         FARVAT_cfg.write(open('{0}/FARVAT.ini'.format(configdir), "w"))
 
         shell = os.path.join(tasklog,'FARVAT.sh')
-        cmd = '{0} {1}/FARVAT/bin/FARVAT.pipeline.py -ds {2} -conf {3}/FARVAT.ini -moption "taskmonitor -q {4}" -md FARVAT -o {5}'.format(cfg.get('software','python3'),moduledir,vcf2peddataset,configdir,cfg.get('sys','queue'),odir)
-        generateShell_exe(shell,cmd,'FARVAT')
-        dependent_list.append('%s/FARVAT_dependence.txt' %(listdir))
+        cmd = '{0} {1}/FARVAT/bin/FARVAT.pipeline.py -ds {2} -conf {3}/FARVAT.ini -moption "taskmonitor -q {4}" -md FARVAT -o {5}'.format(cfg.get('software','python3'),moduledir,'{ds}',configdir,cfg.get('sys','queue'),'{o}')
+        tasks['FARVAT'] = (shell,cmd)
+        dependent_list['FARVAT'] = '%s/FARVAT_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('FARVAT'))
         exit(1)
@@ -298,13 +416,13 @@ def main():
         pVAAST_cfg.set('software','perl',cfg.get('software','perl'))
         pVAAST_cfg.set('software','vcf2cdr',cfg.get('software','vcf2cdr'))
         pVAAST_cfg.set('software','VAAST',cfg.get('software','VAAST'))
-        pVAAST_cfg.set('memory','vcftocdr',cfg.get('pVAAST_memory','vcftocdr'))
-        pVAAST_cfg.set('memory','pVAASTConfig',cfg.get('pVAAST_memory','pVAASTConfig'))
-        pVAAST_cfg.set('memory','pVAAST1',cfg.get('pVAAST_memory','pVAAST1'))
-        pVAAST_cfg.set('memory','genefocus',cfg.get('pVAAST_memory','genefocus'))
-        pVAAST_cfg.set('memory','pVAAST2',cfg.get('pVAAST_memory','pVAAST2'))
-        pVAAST_cfg.set('memory','stat',cfg.get('pVAAST_memory','stat'))
-        pVAAST_cfg.set('memory','upload',cfg.get('pVAAST_memory','upload'))
+        pVAAST_cfg.set('memory','vcftocdr',step_memory(cfg,memoryModel,'pVAAST','vcftocdr'))
+        pVAAST_cfg.set('memory','pVAASTConfig',step_memory(cfg,memoryModel,'pVAAST','pVAASTConfig'))
+        pVAAST_cfg.set('memory','pVAAST1',step_memory(cfg,memoryModel,'pVAAST','pVAAST1'))
+        pVAAST_cfg.set('memory','genefocus',step_memory(cfg,memoryModel,'pVAAST','genefocus'))
+        pVAAST_cfg.set('memory','pVAAST2',step_memory(cfg,memoryModel,'pVAAST','pVAAST2'))
+        pVAAST_cfg.set('memory','stat',step_memory(cfg,memoryModel,'pVAAST','stat'))
+        pVAAST_cfg.set('memory','upload',step_memory(cfg,memoryModel,'pVAAST','upload'))
         pVAAST_cfg.set('genomeedition','gedition',cfg.get('sys','gedition'))
         pVAAST_cfg.set('database','genomefa',cfg.get('database','genomefa'))
         pVAAST_cfg.set('database','gff3',cfg.get('database','gff3'))
@@ -315,9 +433,9 @@ def main():
         pVAAST_cfg.write(open('{0}/pVAAST.ini'.format(configdir), "w"))
 
         shell = os.path.join(tasklog,'pVAAST.sh')
-        cmd = '{0} {1}/pVAAST/bin/pVAAST.pipeline.py -ds {2} -conf {3}/pVAAST.ini -moption "taskmonitor -q {4}" -ih {5} -md pVAAST -o {6}'.format(cfg.get('software','python3'),moduledir,vcf2peddataset,configdir,cfg.get('sys','queue'),cfg.get('pVAAST_para','inheritance'),odir)
-        generateShell_exe(shell,cmd,'pVAAST')
-        dependent_list.append('%s/pVAAST_dependence.txt' %(listdir))
+        cmd = '{0} {1}/pVAAST/bin/pVAAST.pipeline.py -ds {2} -conf {3}/pVAAST.ini -moption "taskmonitor -q {4}" -ih {5} -md pVAAST -o {6}'.format(cfg.get('software','python3'),moduledir,'{ds}',configdir,cfg.get('sys','queue'),cfg.get('pVAAST_para','inheritance'),'{o}')
+        tasks['pVAAST'] = (shell,cmd)
+        dependent_list['pVAAST'] = '%s/pVAAST_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('pVAAST'))
         exit(1)
@@ -336,10 +454,10 @@ def main():
         cdi_cfg.readfp(open(cdi_config))
         cdi_cfg.set('software','python3',cfg.get('software','python3'))
         cdi_cfg.set('software','monitor',cfg.get('software','monitor'))
-        cdi_cfg.set('memory','candigenescreen',cfg.get('Candigene_integration_memory','candigenescreen'))
-        cdi_cfg.set('memory','gene2entrezid-intervar',cfg.get('Candigene_integration_memory','gene2entrezid-intervar'))
-        cdi_cfg.set('memory','digGenetanno',cfg.get('Candigene_integration_memory','digGenetanno'))
-        cdi_cfg.set('memory','upload',cfg.get('Candigene_integration_memory','upload'))
+        cdi_cfg.set('memory','candigenescreen',step_memory(cfg,memoryModel,'Candigene_integration','candigenescreen'))
+        cdi_cfg.set('memory','gene2entrezid-intervar',step_memory(cfg,memoryModel,'Candigene_integration','gene2entrezid-intervar'))
+        cdi_cfg.set('memory','digGenetanno',step_memory(cfg,memoryModel,'Candigene_integration','digGenetanno'))
+        cdi_cfg.set('memory','upload',step_memory(cfg,memoryModel,'Candigene_integration','upload'))
         cdi_cfg.set('genomeedition','gedition',cfg.get('sys','gedition'))
         cdi_cfg.set('database','diGenent',cfg.get('database','diGenent'))
         cdi_cfg.set('database','gene2ensembl',cfg.get('database','gene2ensembl'))
@@ -360,22 +478,304 @@ def main():
             ON.writelines('FARVAT\t%s\n' %(FARVAT_list))
             ON.writelines('pVAAST\t%s\n' %(pVAAST_list))
 
-        shell = os.path.join(tasklog,'Candigene_integration.sh')
-        cmd = '{0} {1}/Candigene_integration/bin/Candigene_integration.pipeline.py -mm {2}/allmethods.list -iv {3} -conf {4}/Candigene_integration.ini -moption "taskmonitor -q {5}" -md Candigene_integration -o {6}'.format(cfg.get('software','python3'),moduledir,listdir,intervar_list,configdir,cfg.get('sys','queue'),odir)
-        generateShell_exe(shell,cmd,'Candigene_integration')
-        dependent_list.append('%s/Candigene_integration_dependence.txt' %(listdir))
+        ## engine = native: 由 candigene.py 在本流程内整合, 不再启动 Candigene_integration 模块 ##
+        if cfg.has_option('Candigene_integration_para','engine') and cfg.get('Candigene_integration_para','engine') == 'native':
+            native_candigene = os.path.join(shelldir,'Candigene_integration.candigenescreen.sh')
+            with open(native_candigene,'w') as OUT:
+                OUT.write('{0} {1}/candigene.py -mm {2}/allmethods.list -iv {3} -n {4} -k {5} -a {6} -o {2}/Candigene_integration.candidate.list\n'.format(cfg.get('software','python3'),Bin,listdir,intervar_list,cfg.get('Candigene_integration_para','minmethod'),cfg.get('Candigene_integration_para','1000g'),cfg.get('Candigene_integration_para','gnomAD')))
+            ## DisGeNET/gene2ensembl 注释使用预编译索引 ##
+            native_anno = os.path.join(shelldir,'Candigene_integration.digGenetanno.sh')
+            geneindexdir = cfg.get('database','geneindexdir') if cfg.has_option('database','geneindexdir') else os.path.join(odir,'geneindex')
+            with open(native_anno,'w') as OUT:
+                OUT.write('{0} {1}/geneindex.py -x {2} -d {3} -e {4} annotate -i {5}/Candigene_integration.candidate.list -o {5}/Candigene_integration.final.list\n'.format(cfg.get('software','python3'),Bin,geneindexdir,cfg.get('database','diGenent'),cfg.get('database','gene2ensembl'),listdir))
+        else:
+            shell = os.path.join(tasklog,'Candigene_integration.sh')
+            cmd = '{0} {1}/Candigene_integration/bin/Candigene_integration.pipeline.py -mm {2}/allmethods.list -iv {3} -conf {4}/Candigene_integration.ini -moption "taskmonitor -q {5}" -md Candigene_integration -o {6}'.format(cfg.get('software','python3'),moduledir,listdir,intervar_list,configdir,cfg.get('sys','queue'),'{o}')
+            tasks['Candigene_integration'] = (shell,cmd)
+        dependent_list['Candigene_integration'] = '%s/Candigene_integration_dependence.txt' %(listdir)
     else:
         print ("\033[1;34;47mPlease check pipeline config carefully! You must proceed {} module\033[0m".format('Candigene_integration'))
         exit(1)
 
+    ## 增量运行: 跳过指纹未变化且已完成的模块 ##
+    if cfg.has_option('sys','incremental') and cfg.getboolean('sys','incremental'):
+        cachedir = cfg.get('sys','cachedir') if cfg.has_option('sys','cachedir') else os.path.join(odir,'cache')
+        cache = BuildCache(cachedir)
+        module_inputs = {'InterVar':[vcf2peddataset],
+                         'CMsiteOnly_Case':[vcf2peddataset],
+                         'Exomiser':[vcf2peddataset,familyhpo],
+                         'FARVAT':[vcf2peddataset],
+                         'pVAAST':[vcf2peddataset],
+                         'Candigene_integration':[]}
+        fingerprint = {}
+        for module in toposort(dependent,list(tasks)):
+            fingerprint[module] = module_fingerprint(module_inputs[module],'{0}/{1}.ini'.format(configdir,module),os.path.join(moduledir,module),[fingerprint[i] for i in dependent[module]])
+            upstreamlists = ['{0}/{1}.final.list'.format(listdir,i) for i in dependent[module]]
+            if all(i not in tasks for i in dependent[module]) and cache.uptodate(module,fingerprint[module],'{0}/{1}.final.list'.format(listdir,module),upstreamlists):
+                print ('\033[1;34;47m{} is up to date, skipped\033[0m'.format(module))
+                del tasks[module]
+                del dependent_list[module]
+            else:
+                cache.submit(module,fingerprint[module])
+        if not tasks and not native_candigene:
+            print ('\033[1;34;47mAll modules are up to date!\033[0m')
+            return None
+
+    ## InterVar 注释缓存: 只把缓存未命中的变异交给 Intervar_run, 命中的注释在 Intervar_run 之后补回 ##
+    module_dataset = {i:vcf2peddataset for i in tasks}
+    if 'InterVar' in tasks and cfg.has_option('sys','annotationCache'):
+        annodir = os.path.join(odir,'annocache')
+        mkdir([annodir])
+        annoRows = cfg.get('sys','annotationCacheRows') if cfg.has_option('sys','annotationCacheRows') else '50000000'
+        annoOptions = '-c {0} -g {1} -d {2} {3} -n {4}'.format(cfg.get('sys','annotationCache'),gedition,cfg.get('database','database_intervar'),cfg.get('database','database_locat'),annoRows)
+        module_dataset['InterVar'],vcfs = cache_dataset(vcf2peddataset,annodir)
+        with open(os.path.join(annodir,'split.sh'),'w') as OUT:
+            OUT.write('{0} {1}/annocache.py {2} split -o {3} -i {4}\n'.format(cfg.get('software','python3'),Bin,annoOptions,annodir,' '.join(vcfs)))
+
+    ## 人群频率预过滤: 每个家系 vcf 只读一遍, 按 CMsiteOnly_Case / FARVAT 各自的阈值输出缩减后的 vcf ##
+    prefilter = {}
+    if cfg.has_option('sys','prefilter') and cfg.getboolean('sys','prefilter'):
+        thresholds = {}
+        if 'CMsiteOnly_Case' in tasks:
+            thresholds['CMsiteOnly_Case'] = (cfg.get('CMsiteOnly_Case_para','1000g'),cfg.get('CMsiteOnly_Case_para','gnomAD'))
+        if 'FARVAT' in tasks:
+            thresholds['FARVAT'] = (str(max(cfg.getfloat('FARVAT_para','rare'),cfg.getfloat('FARVAT_para','common'))),'-')
+        sources = ['{0}:{1}'.format(i,cfg.get('database',i)) for i in ('1000g','gnomAD') if cfg.has_option('database',i) and os.path.isfile(cfg.get('database',i))]
+        if thresholds and sources:
+            prefilterdir = os.path.join(odir,'prefilter')
+            mkdir([prefilterdir])
+            afindexdir = cfg.get('database','afindexdir') if cfg.has_option('database','afindexdir') else os.path.join(odir,'afindex')
+            prefilter,vcfs = prefilter_dataset(vcf2peddataset,thresholds,prefilterdir)
+            module_dataset.update(prefilter)
+            with open(os.path.join(prefilterdir,'prefilter.sh'),'w') as OUT:
+                OUT.write('{0} {1}/afprefilter.py -x {2} -g {3} {4} filter -o {5} {6} -i {7}\n'.format(cfg.get('software','python3'),Bin,afindexdir,gedition,' '.join('-s {0}'.format(i) for i in sources),prefilterdir,' '.join('-t {0}:{1}:{2}'.format(i,*thresholds[i]) for i in thresholds),' '.join(vcfs)))
+        else:
+            print ('\033[1;31;40mWarning: no 1000g/gnomAD frequency file or no module to prefilter, prefilter skipped\033[0m')
+
+    ## 按家系分片: 分片模块对每个分片分别生成任务, 由 gather 步骤按分片顺序合并 *.final.list ##
+    shardFamilies = cfg.getint('sys','shardFamilies') if cfg.has_option('sys','shardFamilies') else 0
+    shardModules = cfg.get('sys','shardModules').split(',') if cfg.has_option('sys','shardModules') else ['InterVar']
+    shardModules = [i for i in shardModules if i in tasks and i != 'Candigene_integration'] if shardFamilies > 0 else []
+    shards = {}
+    if shardModules:
+        sharddir = os.path.join(odir,'shard')
+        shards = split_dataset(vcf2peddataset,familyhpo,sharddir,shardFamilies)
+        for shard in shards:
+            mkdir([os.path.join(sharddir,shard,i) for i in ('shell','process','list','config')])
+        shard_datasets = {i:split_dataset(module_dataset[i],familyhpo,sharddir,shardFamilies,'{0}.vcf2peddataset'.format(i)) for i in shardModules if module_dataset[i] != vcf2peddataset}
+        rerun = cfg.get('sys','shardRerun').split(',') if cfg.has_option('sys','shardRerun') else list(shards)
+        rerun = [i for i in shards if i in rerun]
+    ## FARVAT/pVAAST 按基因组区段分片: 区段边界落在基因之间, 区段结果合并后与全基因组运行一致 ##
+    regionModules = {}
+    for module in ('FARVAT','pVAAST'):
+        para = '{0}_para'.format(module)
+        if module in tasks and cfg.has_option(para,'regionScatter') and cfg.get(para,'regionScatter') in ('chrom','window'):
+            ## 不分区段运行时给出模块及原因: 按家系分片的模块, 或多重检验校正选项开启 (分区段会改变校正后的 p 值) ##
+            if module in shardModules:
+                sys.stderr.write('\033[1;31;40mmultifamily-based.disease.screen pipeline - WARNING - {0} not scattered by region: it is sharded by family (shardModules)\033[0m\n'.format(module))
+                continue
+            genomeWide = genome_wide_options(cfg.items(para))
+            if genomeWide:
+                sys.stderr.write('\033[1;31;40mmultifamily-based.disease.screen pipeline - WARNING - {0} not scattered by region: multiple testing correction {1} needs all genes in one run\033[0m\n'.format(module,','.join('{0}={1}'.format(i,cfg.get(para,i)) for i in genomeWide)))
+                continue
+            genes = cfg.get('database','gff3') if cfg.has_option('database','gff3') else cfg.get('database','geneinfo')
+            regionSize = cfg.getint(para,'regionSize') if cfg.has_option(para,'regionSize') else 10000000
+            regions = make_regions(gene_blocks(genes),cfg.get(para,'regionScatter'),regionSize)
+            outside = '{0} {1}/regionscatter.py -g {2} -m {3} -s {4}'.format(cfg.get('software','python3'),Bin,genes,cfg.get(para,'regionScatter'),regionSize)
+            regionModules[module] = scatter_dataset(module_dataset[module],regions,os.path.join(odir,'region',module),cfg.get('software','bgzip'),cfg.get('software','tabix'),outside)
+            for region in regionModules[module][0]:
+                mkdir([os.path.join(odir,'region',module,region,i) for i in ('shell','process','list','config')])
+            print ('\033[1;34;47m{0}: scattered into {1} regions ({2})\033[0m'.format(module,len(regionModules[module][0]),cfg.get(para,'regionScatter')))
+
+    for module in list(tasks):
+        shell,cmd = tasks[module]
+        if module in regionModules:
+            tasks[module] = []
+            scattered = regionModules[module][0]
+            for region,(dataset,slice_shell) in scattered.items():
+                regiondir = os.path.join(odir,'region',module,region)
+                tasks[module].append((os.path.join(tasklog,'{0}.{1}.sh'.format(module,region)),cmd.format(ds=dataset,fhpo=familyhpo,ldir=listdir,o=regiondir)))
+            tasks[module].append((os.path.join(tasklog,'{0}.gather.sh'.format(module)),'{0} {1}/shardjob.py gather -o {2}/{3}.list {4}'.format(cfg.get('software','python3'),Bin,listdir,module,' '.join('{0}/region/{1}/{2}/list/{1}.list'.format(odir,module,i) for i in scattered))))
+        elif module in shardModules:
+            ## 上游模块同样分片时使用分片内的上游结果 ##
+            shardlist = all(i in shardModules for i in dependent[module])
+            tasks[module] = []
+            for shard in rerun:
+                dataset,shardhpo = shard_datasets.get(module,shards)[shard]
+                shardodir = os.path.join(sharddir,shard)
+                tasks[module].append((os.path.join(tasklog,'{0}.{1}.sh'.format(module,shard)),cmd.format(ds=dataset,fhpo=shardhpo,ldir=os.path.join(shardodir,'list') if shardlist else listdir,o=shardodir)))
+            tasks[module].append((os.path.join(tasklog,'{0}.gather.sh'.format(module)),'{0} {1}/shardjob.py gather -o {2}/{3}.list {4}'.format(cfg.get('software','python3'),Bin,listdir,module,' '.join('{0}/{1}/list/{2}.list'.format(sharddir,i,module) for i in shards))))
+        else:
+            tasks[module] = [(shell,cmd.format(ds=module_dataset[module],fhpo=familyhpo,ldir=listdir,o=odir))]
+
+    ## 按模块依赖关系并行运行各模块 ##
+    if cfg.has_option('sys','maxModuleJobs'):
+        maxModuleJobs = cfg.getint('sys','maxModuleJobs')
+    else:
+        maxModuleJobs = len(tasks)
+    run_module_dag(tasks,dependent,max(1,maxModuleJobs))
+
+    gather_jobs = {}
+    for module in shardModules:
+        gather_jobs[module] = gather_dependence(module,['{0}/{1}/list/{2}_dependence.txt'.format(sharddir,i,module) for i in rerun],[os.path.join(sharddir,i) for i in shards],listdir,shelldir,cfg.get('software','python3'),dependent_list[module])
+    for module,(scattered,prepare_shell) in regionModules.items():
+        regiondeps = OrderedDict((i,'{0}/region/{1}/{2}/list/{1}_dependence.txt'.format(odir,module,i)) for i in scattered)
+        gather_jobs[module] = gather_dependence(module,list(regiondeps.values()),[os.path.join(odir,'region',module,i) for i in scattered],listdir,shelldir,cfg.get('software','python3'),dependent_list[module])
+        slice_dependence(dependent_list[module],prepare_shell,scattered,regiondeps)
+    prefilterMemory = cfg.get('sys','prefilterMemory') if cfg.has_option('sys','prefilterMemory') else '4G'
+    for module in prefilter:
+        prefilter_dependence(dependent_list[module],'{0}/prefilter.sh:{1}'.format(prefilterdir,prefilterMemory))
+    if genotypedir:
+        mkdir([genotypedir])
+        with open(os.path.join(genotypedir,'build.sh'),'w') as OUT:
+            OUT.write('{0} {1}/genostore.py -x {2} build -ds {3}\n'.format(cfg.get('software','python3'),Bin,genotypedir,vcf2peddataset))
+        genotypeMemory = cfg.get('sys','genotypeStoreMemory') if cfg.has_option('sys','genotypeStoreMemory') else '4G'
+    if module_dataset.get('InterVar',vcf2peddataset) != vcf2peddataset:
+        splice_dependence(dependent_list['InterVar'],'{0}/split.sh:{1}'.format(annodir,cfg.get('InterVar_memory','Intervar_run')),'{0} {1}/annocache.py {2}'.format(cfg.get('software','python3'),Bin,annoOptions),annodir)
+
+    if native_candigene:
+        with open(dependent_list['Candigene_integration'],'w') as OUT:
+            native_job = '{0}:{1}'.format(native_candigene,step_memory(cfg,memoryModel,'Candigene_integration','candigenescreen'))
+            sinks = [j for i in dependent['Candigene_integration'] if i in dependent_list for j in dependence_ends(dependent_list[i])[1]]
+            for sink in sinks:
+                OUT.write('{0}\t{1}\n'.format(sink,native_job))
+            OUT.write('{0}\t{1}:{2}\n'.format(native_job,native_anno,step_memory(cfg,memoryModel,'Candigene_integration','digGenetanno')))
+
     ## qsub shell ##
-    for i in dependent_list:
-        os.system('cat {0} >> {1}/all_dependence.txt'.format(i,listdir))
+    with open('{0}/all_dependence.txt'.format(listdir),'w') as all_dependence:
+        for module in dependent_list:
+            with open(dependent_list[module]) as IN:
+                all_dependence.write(IN.read())
+            ## 下游模块在上游分片结果合并之后运行 ##
+            for upstream in dependent[module]:
+                if upstream in gather_jobs and module not in shardModules and not (native_candigene and module == 'Candigene_integration'):
+                    for source in dependence_ends(dependent_list[module])[0]:
+                        all_dependence.write('{0}\t{1}\n'.format(gather_jobs[upstream],source))
+        ## 基因型存储目前没有模块读取, 作为独立步骤与各模块并行构建, 不进入模块的关键路径 ##
+        if genotypedir:
+            all_dependence.write('{0}/build.sh:{1}\n'.format(genotypedir,genotypeMemory))
+
+    ## 各步骤所属模块, 以及用于由 shell 名得到步骤名的家系/分片/区段名 ##
+    jobModules = {}
+    for module in dependent_list:
+        with open(dependent_list[module]) as IN:
+            for line in IN:
+                for item in line.split():
+                    jobModules.setdefault(split_job(item)[0],module)
+    with open(vcf2peddataset) as IN:
+        labels = set(line.split()[0] for line in IN if line.strip() and not line.startswith('#'))
+    labels |= set(shards) | set(j for i in regionModules.values() for j in i[0])
+    return {'cfg':cfg,'odir':odir,'dependence':'{0}/all_dependence.txt'.format(listdir),'jobModules':jobModules,'labels':labels,
+            'telemetry':telemetry,'tracedir':tracedir,'ledger':ledger,'variants':variants,'families':families}
+
+def pool_exomiser(projects,pooldir):
+    """run the exomrun steps of projects with [Exomiser_para] batchFamilies in batch Exomiser JVMs"""
+    pooled = [i for i in projects if i['cfg'].has_option('Exomiser_para','batchFamilies') and i['cfg'].getint('Exomiser_para','batchFamilies') > 0]
+    if not pooled:
+        return
+    size = min(i['cfg'].getint('Exomiser_para','batchFamilies') for i in pooled)
+    option = pooled[0]['cfg'].get('Exomiser_para','batchOption') if pooled[0]['cfg'].has_option('Exomiser_para','batchOption') else '--batch'
+    members = set(shell for i in pooled for shell,module in i['jobModules'].items() if module == 'Exomiser' and match_step(step_name(shell,i['labels']),'exomrun'))
+    assign = pool_dependence([i['dependence'] for i in pooled],members,size,pooldir,option)
+    for i in pooled:
+        for jobs in assign.values():
+            for job in jobs:
+                i['jobModules'][split_job(job)[0]] = 'Exomiser'
+    print ('\033[1;34;47mExomiser: {0} exomrun steps pooled into {1} workers\033[0m'.format(len(assign),len(set(i[0] for i in assign.values()))))
+
+def write_qsub(qsub,cfg,dependence,trace=None,jobModules=None):
+    """trace: (ledger,tracedir,run) to collect the step records and write the run report after the monitor exits
+       jobModules: {shell:module} for the per module progress of the supervisor
+    """
+    ## 调度方式: taskmonitor (集群队列, 默认), local (本机进程池) 或 supervisor (事件驱动监控) ##
+    scheduler = cfg.get('sys','scheduler') if cfg.has_option('sys','scheduler') else 'taskmonitor'
+    with open(qsub,'w') as qsub_sh:
+        if scheduler == 'supervisor':
+            modules = '{0}.modules'.format(os.path.splitext(dependence)[0])
+            with open(modules,'w') as OUT:
+                OUT.writelines('{0}\t{1}\n'.format(shell,module) for shell,module in (jobModules or {}).items())
+            supervisorOptions = ''
+            for key,option in (('supervisorMemory','-m'),('supervisorJobs','-p'),('supervisorRetry','-r')):
+                if cfg.has_option('sys',key):
+                    supervisorOptions += ' {0} {1}'.format(option,cfg.get('sys',key))
+            if cfg.has_option('sys','supervisorSubmit'):
+                supervisorOptions += ' -s "{0}"'.format(cfg.get('sys','supervisorSubmit').replace('"','\\"'))
+            if cfg.has_option('sys','supervisorFailfast') and cfg.getboolean('sys','supervisorFailfast'):
+                supervisorOptions += ' -f'
+            ## 主流程每次重新生成 shell, 监控不续跑 (清空状态目录), 需要续跑时手动以 supervisor.py -R 运行 ##
+            qsub_sh.writelines('{0} {1}/supervisor.py -o {2}/supervisor run -i {3} -M {4}{5}\n'.format(cfg.get('software','python3'),Bin,os.path.dirname(qsub),dependence,modules,supervisorOptions))
+        elif scheduler == 'local':
+            localOptions = ''
+            for key,option in (('localMemory','-m'),('localJobs','-p'),('localRetry','-r')):
+                if cfg.has_option('sys',key):
+                    localOptions += ' {0} {1}'.format(option,cfg.get('sys',key))
+            qsub_sh.writelines('{0} {1}/localmonitor.py -i {2}{3}\n'.format(cfg.get('software','python3'),Bin,dependence,localOptions))
+        else:
+            qsub_sh.writelines('{0} taskmonitor {1} -i {2}\n'.format(cfg.get('software','monitor'),cfg.get('sys','monitorOptions'),dependence))
+        if trace:
+            ledger,tracedir,traceRun = trace
+            qsub_sh.writelines('status=$?\n')
+            qsub_sh.writelines('{0} {1}/steptrace.py -l {2} -t {3} collect -r {4}\n'.format(cfg.get('software','python3'),Bin,ledger,tracedir,traceRun))
+            qsub_sh.writelines('{0} {1}/steptrace.py -l {2} report -r {3} > {4}/{3}.report.txt\n'.format(cfg.get('software','python3'),Bin,ledger,traceRun,tracedir))
+            qsub_sh.writelines('exit $status\n')
+
+def main():
+    '''参数设定'''
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-c','--config',help="multifamily-based.disease.screen pipeline configuration file(s): eg: multifamily-based.disease.screen.config.example.ini. several configs are run as one batch",dest='config',type=str,nargs='+',required=True)
+    parser.add_argument('-b','--batchdir',help="batch output directory, required with several configs",dest='batchdir',type=str)
+    argv = vars(parser.parse_args())
 
-    with open('{}/multifamily-based.disease.screen_qsub.sh'.format(odir),'w') as qsub_sh:
-        qsub_sh.writelines('{0} taskmonitor {1} -i {2}/all_dependence.txt'.format(cfg.get('software','monitor'),cfg.get('sys','monitorOptions'),listdir,listdir))
+    configs = [i.strip() for i in argv['config']]
+    if len(configs) > 1 and not argv['batchdir']:
+        sys.stderr.write('\033[1;31;40mmultifamily-based.disease.screen pipeline - ERROR - -b batchdir is required with several configs\033[0m\n')
+        exit(1)
+    projects = [i for i in (screen(config) for config in configs) if i]
+    if not projects:
+        return
+
+    ## 批量模式: 各项目依赖合并为一个依赖文件, 由一个 monitor 调度 ##
+    if len(configs) > 1:
+        workdir = os.path.abspath(argv['batchdir'])
+        check_path(workdir,'new')
+        dependence = os.path.join(workdir,'all_dependence.txt')
+    else:
+        workdir = projects[0]['odir']
+        dependence = projects[0]['dependence']
+    pool_exomiser(projects,os.path.join(workdir,'exomiser_pool'))
+    if len(configs) > 1:
+        with open(dependence,'w') as OUT:
+            for project in projects:
+                with open(project['dependence']) as IN:
+                    OUT.write(IN.read())
+
+    jobModules,labels = {},set()
+    for project in projects:
+        jobModules.update(project['jobModules'])
+        labels |= project['labels']
+
+    ## 步骤级运行记录: 每个步骤经 steptrace.py 包装运行, 结束后导入台账并输出运行报告 ##
+    trace = None
+    traced = [i for i in projects if i['telemetry']]
+    if traced:
+        tracedir = traced[0]['tracedir'] if len(configs) == 1 else os.path.join(workdir,'telemetry')
+        traceRun = '{0}.{1}'.format(time.strftime('%Y%m%d%H%M%S'),os.getpid())
+        instrument(dependence,jobModules,labels,tracedir,traceRun,traced[0]['cfg'].get('software','python3'),sum(i['variants'] for i in traced),sum(i['families'] for i in traced))
+        trace = (traced[0]['ledger'],tracedir,traceRun)
+        jobModules.update((trace_shell(shell),module) for shell,module in list(jobModules.items()))
+
+    cfg = projects[0]['cfg']
+    write_qsub('{0}/multifamily-based.disease.screen_qsub.sh'.format(workdir),cfg,dependence,trace,jobModules)
     print ('\033[1;34;47m\nIf you have any questions, please contact shouweizhang@genome.cn! Have a happy cooperation!\n')
-    os.system('cd {0} && sh multifamily-based.disease.screen_qsub.sh'.format(odir))
+    if cfg.has_option('sys','scheduler') and cfg.get('sys','scheduler') == 'supervisor' and cfg.has_option('sys','supervisorDetach') and cfg.getboolean('sys','supervisorDetach'):
+        ## 后台运行, 可随时 attach 查看进度 ##
+        os.system('cd {0} && setsid nohup sh multifamily-based.disease.screen_qsub.sh > multifamily-based.disease.screen_qsub.log 2>&1 &'.format(workdir))
+        print ('\033[1;34;47mrunning in background, progress: {0} {1}/supervisor.py -o {2}/supervisor attach\033[0m'.format(cfg.get('software','python3'),Bin,workdir))
+        return
+    status = os.system('cd {0} && sh multifamily-based.disease.screen_qsub.sh'.format(workdir))
+    if status != 0:
+        sys.stderr.write('\033[1;31;40mmultifamily-based.disease.screen pipeline - ERROR - monitor exited with status {0}, see {1}\033[0m\n'.format(status >> 8 if status & 0xff == 0 else status,workdir))
+        exit(1)
 
 if __name__ == '__main__':
     main()
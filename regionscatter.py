@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 基因组区段分片 (FARVAT / pVAAST)
+                   从 gff3 (gene 行) 或 geneinfo (染色体 起始 终止 [基因] 表格) 读取基因区间, 合并重叠基因为基因块,
+                   按染色体 (chrom) 或固定窗口 (window) 划分区段, 区段边界只落在基因块之间, 每个基因只属于一个区段,
+                   因此各区段基因水平结果直接合并即与全基因组运行一致
+                   每个区段用 tabix 截取 vcf2peddataset 中的 vcf 并 bgzip 压缩, 生成该区段的 vcf2peddataset; 每条记录只按 POS 归入一个区段,
+                   跨区段边界的 indel 不会在相邻区段重复计数; 另有一个区段 outside_regions 收集 POS 不在任何区段内的变异 (基因间区, gff3 中没有的染色体), 不丢失变异
+                   多重检验校正选项 (GENOME_WIDE 中的选项名) 开启时不能分区段运行, 主流程对该模块不分片并给出提示
+      To run : python3 regionscatter.py [options]
+      options: -g gff3 or geneinfo [required]
+               -m chrom|window [default: chrom]
+               -s window size (bp) [default: 10000000]
+               -x vcf: output its records outside every region instead of listing the regions
+      e.g.:
+            python3 regionscatter.py -g genes.gff3 -m window -s 10000000
+            python3 regionscatter.py -g genes.gff3 -m window -s 10000000 -x input.vcf.gz | bgzip -c > outside.vcf.gz\033[0m
+'''
+
+import os
+import sys
+import re
+import gzip
+import bisect
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from shardjob import dependence_ends
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+def open_text(file):
+    return gzip.open(file,'rt') if file.endswith('.gz') else open(file)
+
+def read_genes(file):
+    """yield (chrom,start,end) of genes from gff3 or a chrom/start/end table, 1-based inclusive"""
+    with open_text(file) as IN:
+        for line in IN:
+            if not line.strip() or line.startswith('#'):
+                continue
+            items = line.rstrip('\n').split('\t')
+            if len(items) >= 9 and items[3].isdigit() and items[4].isdigit():
+                if items[2] == 'gene':
+                    yield items[0],int(items[3]),int(items[4])
+            elif len(items) >= 3 and items[1].isdigit() and items[2].isdigit():
+                yield items[0],int(items[1]),int(items[2])
+
+def gene_blocks(file):
+    """OrderedDict chrom:[(start,end)] of merged, sorted gene intervals"""
+    genes = OrderedDict()
+    for chrom,start,end in read_genes(file):
+        genes.setdefault(chrom,[]).append((min(start,end),max(start,end)))
+    blocks = OrderedDict()
+    for chrom,intervals in genes.items():
+        merged = []
+        for start,end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0],max(merged[-1][1],end))
+            else:
+                merged.append((start,end))
+        blocks[chrom] = merged
+    return blocks
+
+def make_regions(blocks,mode='chrom',size=10000000):
+    """[(name,tabix region)]; window regions pack whole gene blocks up to size bp"""
+    regions = []
+    for chrom,merged in blocks.items():
+        label = re.sub(r'[^\w.-]','_',chrom)
+        if mode == 'chrom':
+            regions.append((label,chrom))
+            continue
+        windows,current = [],[]
+        for start,end in merged:
+            if current and end - current[0][0] + 1 > size:
+                windows.append(current)
+                current = []
+            current.append((start,end))
+        if current:
+            windows.append(current)
+        for window in windows:
+            start,end = window[0][0],window[-1][1]
+            regions.append(('{0}_{1}_{2}'.format(label,start,end),'{0}:{1}-{2}'.format(chrom,start,end)))
+    return regions
+
+OUTSIDE = 'outside_regions'
+## 多重检验校正需要全部基因一起计算, 分区段运行会改变校正后的 p 值; 其他选项 (如 pVAASTgw) 不影响分区段 ##
+GENOME_WIDE = ('correction','multipleTesting','fdr','bonferroni','padjust','qvalue')
+
+def genome_wide_options(options):
+    """keys of enabled (key,value) options that need the whole genome in one run"""
+    names = set(i.lower() for i in GENOME_WIDE)
+    return [key for key,value in options if key.lower() in names and value.strip().lower() not in ('','0','false','no','none','.')]
+
+def region_bounds(region):
+    """(chrom,start,end) of chrom:start-end, None for a whole chrom"""
+    match = re.match(r'^(.+):(\d+)-(\d+)$',region)
+    return (match.group(1),int(match.group(2)),int(match.group(3))) if match else None
+
+def region_intervals(regions):
+    """({chrom:[(start,end)]} sorted, set of whole chroms) of tabix regions; windows of one chrom do not overlap"""
+    intervals,whole = {},set()
+    for name,region in regions:
+        bounds = region_bounds(region)
+        if bounds:
+            intervals.setdefault(bounds[0],[]).append(bounds[1:])
+        else:
+            whole.add(region)
+    return {i:sorted(j) for i,j in intervals.items()},whole
+
+def outside_records(vcf,regions,OUT):
+    """write header and records of vcf whose POS is in no region to OUT"""
+    intervals,whole = region_intervals(regions)
+    starts = {i:[j[0] for j in k] for i,k in intervals.items()}
+    with open_text(vcf) as IN:
+        for line in IN:
+            if line.startswith('#'):
+                OUT.write(line)
+                continue
+            items = line.split('\t',2)
+            chrom,pos = items[0],int(items[1])
+            if chrom in whole:
+                continue
+            if chrom in intervals:
+                index = bisect.bisect_right(starts[chrom],pos)
+                if index and intervals[chrom][index - 1][1] >= pos:
+                    continue
+            OUT.write(line)
+
+def is_vcf(item):
+    return item.endswith(('.vcf','.vcf.gz'))
+
+def scatter_dataset(vcf2peddataset,regions,outdir,bgzip,tabix,outside=None):
+    """write outdir/input.sh (bgzip/index inputs) and outdir/<region>/{vcf2peddataset,slice.sh}
+       outside: regionscatter.py command with the same -g/-m/-s, adds region outside_regions for the variants outside every region
+       return OrderedDict region:(dataset,slice shell), prepare shell
+    """
+    inputdir = os.path.join(outdir,'input')
+    if not os.path.exists(inputdir):
+        os.makedirs(inputdir)
+    with open(vcf2peddataset) as IN:
+        lines = IN.readlines()
+    ## 未压缩或未建索引的 vcf 先 bgzip/tabix ##
+    indexed,prepare = {},[]
+    for line in lines:
+        for item in line.split():
+            if is_vcf(item) and item not in indexed:
+                if item.endswith('.vcf'):
+                    indexed[item] = os.path.join(inputdir,'{0}.{1}.gz'.format(len(indexed),os.path.basename(item)))
+                    prepare.append('{0} -c {1} > {2} && {3} -f -p vcf {2}'.format(bgzip,item,indexed[item],tabix))
+                else:
+                    indexed[item] = item
+                    prepare.append('[ -e {0}.tbi ] || {1} -p vcf {0}'.format(item,tabix))
+    prepare_shell = os.path.join(outdir,'input.sh')
+    with open(prepare_shell,'w') as OUT:
+        OUT.write('set -e\n')
+        OUT.writelines('{0}\n'.format(i) for i in prepare)
+    scattered = OrderedDict()
+    for name,region in regions + ([(OUTSIDE,None)] if outside else []):
+        regiondir = os.path.join(outdir,name)
+        if not os.path.exists(regiondir):
+            os.makedirs(regiondir)
+        sliced,cmds = {},['set -e']
+        for vcf in indexed:
+            sliced[vcf] = os.path.join(regiondir,'{0}.{1}.vcf.gz'.format(len(sliced),name))
+            if region is None:
+                cmds.append('{0} -x {1} | {2} -c > {3} && {4} -f -p vcf {3}'.format(outside,indexed[vcf],bgzip,sliced[vcf],tabix))
+            elif region_bounds(region):
+                ## tabix 返回与窗口重叠的记录, 只保留 POS 在窗口内的, 跨边界的 indel 只属于一个窗口 ##
+                chrom,start,end = region_bounds(region)
+                cmds.append('{0} -h {1} {2} | awk -F \'\\t\' \'/^#/ || ($2 >= {3} && $2 <= {4})\' | {5} -c > {6} && {0} -f -p vcf {6}'.format(tabix,indexed[vcf],region,start,end,bgzip,sliced[vcf]))
+            else:
+                cmds.append('{0} -h {1} {2} | {3} -c > {4} && {5} -f -p vcf {4}'.format(tabix,indexed[vcf],region,bgzip,sliced[vcf],tabix))
+        slice_shell = os.path.join(regiondir,'slice.sh')
+        with open(slice_shell,'w') as OUT:
+            OUT.writelines('{0}\n'.format(i) for i in cmds)
+        dataset = os.path.join(regiondir,'vcf2peddataset')
+        with open(dataset,'w') as OUT:
+            for line in lines:
+                OUT.write(re.sub(r'\S+',lambda m: sliced.get(m.group(0),m.group(0)),line))
+        scattered[name] = (dataset,slice_shell)
+    return scattered,prepare_shell
+
+def slice_dependence(output,prepare_shell,scattered,regiondeps,memory='1G'):
+    """append input -> slice -> first module steps of every region to a merged dependence file"""
+    prepare_job = '{0}:{1}'.format(prepare_shell,memory)
+    with open(output,'a') as OUT:
+        for name,(dataset,slice_shell) in scattered.items():
+            slice_job = '{0}:{1}'.format(slice_shell,memory)
+            OUT.write('{0}\t{1}\n'.format(prepare_job,slice_job))
+            for source in dependence_ends(regiondeps[name])[0]:
+                OUT.write('{0}\t{1}\n'.format(slice_job,source))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-g','--genes',help="gff3 or geneinfo",dest='genes',type=str,required=True)
+    parser.add_argument('-m','--mode',help="chrom|window [default: chrom]",dest='mode',type=str,choices=['chrom','window'],default='chrom')
+    parser.add_argument('-s','--size',help="window size (bp) [default: 10000000]",dest='size',type=int,default=10000000)
+    parser.add_argument('-x','--outside',help="vcf: output its records outside every region",dest='outside',type=str)
+    argv = vars(parser.parse_args())
+
+    regions = make_regions(gene_blocks(argv['genes']),argv['mode'],argv['size'])
+    if argv['outside']:
+        outside_records(argv['outside'],regions,sys.stdout)
+        return
+    for name,region in regions:
+        print ('{0}\t{1}'.format(name,region))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 按家系分片 (scatter) 与结果合并 (gather)
+                   split: 按第一列家系ID把 vcf2peddataset 和 familyhpo 拆分为每个家系(或每N个家系)一个分片, 家系ID中的特殊字符替换为 _ 后重名的分片加序号后缀
+                   gather: 按分片顺序合并各分片的 *.final.list, 重复的表头行只保留一次 (空结果不参与表头判断), 结果与分片完成顺序无关; 任一分片结果缺失时列出缺失文件并以非0退出
+      To run : python3 shardjob.py split|gather [options]
+      e.g.:
+            python3 shardjob.py split -ds vcf2peddataset -fhpo familyhpo -n 1 -o odir/shard
+            python3 shardjob.py gather -o odir/list/InterVar.final.list odir/shard/*/list/InterVar.final.list\033[0m
+'''
+
+import os
+import sys
+import re
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import read_dependence,downstream_of
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+def read_families(file):
+    """return (header lines, OrderedDict family:[lines]) keyed by the first column"""
+    header,families = [],OrderedDict()
+    with open(file) as IN:
+        for line in IN:
+            if not line.strip():
+                continue
+            if line.startswith('#'):
+                header.append(line)
+                continue
+            families.setdefault(line.split()[0],[]).append(line)
+    return header,families
+
+def shard_name(families,batch,index):
+    if batch == 1:
+        return re.sub(r'[^\w.-]','_',families[0])
+    return 'batch{0:04d}'.format(index + 1)
+
+def split_dataset(vcf2peddataset,familyhpo,sharddir,batch=1,name='vcf2peddataset'):
+    """write sharddir/<shard>/{<name>,familyhpo}; return OrderedDict shard:(dataset,familyhpo)"""
+    header,families = read_families(vcf2peddataset)
+    hpoheader,hpo = read_families(familyhpo) if familyhpo else ([],{})
+    names = list(families)
+    shards = OrderedDict()
+    for index,start in enumerate(range(0,len(names),batch)):
+        members = names[start:start + batch]
+        shard = shard_name(members,batch,index)
+        ## 替换字符后不同家系ID可能同名 (如 F/1 与 F_1), 按出现顺序加后缀区分 ##
+        base,suffix = shard,1
+        while shard in shards:
+            suffix += 1
+            shard = '{0}_{1}'.format(base,suffix)
+        outdir = os.path.join(sharddir,shard)
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
+        dataset = os.path.join(outdir,name)
+        with open(dataset,'w') as OUT:
+            OUT.writelines(header)
+            for family in members:
+                OUT.writelines(families[family])
+        shardhpo = os.path.join(outdir,'familyhpo')
+        with open(shardhpo,'w') as OUT:
+            OUT.writelines(hpoheader)
+            for family in members:
+                OUT.writelines(hpo.get(family,[]))
+        shards[shard] = (dataset,shardhpo)
+    return shards
+
+def gather(inputs,output):
+    """concatenate inputs in the given order; a first line shared by every non-empty input is a header and kept once
+       every input must exist, a missing shard result would give a truncated list; an empty input (no passing variants) is allowed
+    """
+    missing = [i for i in inputs if not os.path.isfile(i)]
+    if missing:
+        sys.stderr.write('\033[1;31;40mshardjob - ERROR - {0} of {1} shard results missing:\n{2}\033[0m\n'.format(len(missing),len(inputs),'\n'.join(missing)))
+        exit(1)
+    firsts = []
+    for file in inputs:
+        with open(file) as IN:
+            firsts.append(IN.readline())
+    firsts = [i for i in firsts if i]
+    header = firsts[0] if firsts and (firsts[0].startswith('#') or (len(firsts) > 1 and len(set(firsts)) == 1)) else None
+    tmp = output + '.tmp'
+    with open(tmp,'w') as OUT:
+        if header:
+            OUT.write(header)
+        for file in inputs:
+            with open(file) as IN:
+                for index,line in enumerate(IN):
+                    if index == 0 and line == header:
+                        continue
+                    OUT.write(line)
+    os.rename(tmp,output)
+
+def dependence_ends(file):
+    """return (sources,sinks) as ['shell:memory'] of one dependence file"""
+    if not os.path.isfile(file):
+        return [],[]
+    jobs,upstream = read_dependence([file])
+    downstream = downstream_of(upstream)
+    sources = ['{0}:{1}'.format(i,jobs[i]) for i in jobs if not upstream[i]]
+    sinks = ['{0}:{1}'.format(i,jobs[i]) for i in jobs if not downstream[i]]
+    return sources,sinks
+
+def gather_dependence(module,sharddeps,sharddirs,listdir,shelldir,python3,output,memory='1G'):
+    """merge the shard dependence files of one module and hang a gather step of *.final.list on their sinks"""
+    gather_shell = os.path.join(shelldir,'{0}_gather.sh'.format(module))
+    finallists = ['{0}/list/{1}.final.list'.format(i,module) for i in sharddirs]
+    with open(gather_shell,'w') as OUT:
+        OUT.write('{0} {1}/shardjob.py gather -o {2}/{3}.final.list {4}\n'.format(python3,Bin,listdir,module,' '.join(finallists)))
+    gather_job = '{0}:{1}'.format(gather_shell,memory)
+    with open(output,'w') as OUT:
+        sinks = []
+        for file in sharddeps:
+            if os.path.isfile(file):
+                with open(file) as IN:
+                    OUT.write(IN.read())
+                sinks.extend(dependence_ends(file)[1])
+        for sink in sinks:
+            OUT.write('{0}\t{1}\n'.format(sink,gather_job))
+        if not sinks:
+            OUT.write('{0}\n'.format(gather_job))
+    return gather_job
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    subparsers = parser.add_subparsers(dest='command')
+    split_parser = subparsers.add_parser('split',help='split vcf2peddataset/familyhpo by family')
+    split_parser.add_argument('-ds','--dataset',help="vcf2peddataset",dest='dataset',type=str,required=True)
+    split_parser.add_argument('-fhpo','--familyhpo',help="familyhpo",dest='familyhpo',type=str,default=None)
+    split_parser.add_argument('-n','--batch',help="families per shard [default: 1]",dest='batch',type=int,default=1)
+    split_parser.add_argument('-o','--outdir',help="shard directory",dest='outdir',type=str,required=True)
+    gather_parser = subparsers.add_parser('gather',help='merge shard *.final.list in order')
+    gather_parser.add_argument('-o','--output',help="merged list",dest='output',type=str,required=True)
+    gather_parser.add_argument('inputs',help="shard lists",nargs='+')
+    argv = vars(parser.parse_args())
+
+    if argv['command'] == 'split':
+        for shard,(dataset,familyhpo) in split_dataset(argv['dataset'],argv['familyhpo'],argv['outdir'],max(1,argv['batch'])).items():
+            print ('{0}\t{1}\t{2}'.format(shard,dataset,familyhpo))
+    elif argv['command'] == 'gather':
+        gather(argv['inputs'],argv['output'])
+    else:
+        parser.print_help()
+        exit(1)
+
+if __name__ == '__main__':
+    main()
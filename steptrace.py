@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 步骤级运行记录 (时间线/CPU/峰值内存/IO) 及运行报告
+                   instrument: 主流程为 all_dependence.txt 中每个步骤生成 <shell>.trace.sh 包装脚本并改写依赖文件, 同时记录本批次的依赖图 (graph.json)
+                   run: 包装脚本调用, 运行原步骤并以 os.wait4 取得 CPU 时间与峰值内存, 以 /proc/self/io 取得读写字节数,
+                        每个步骤 (每次重试) 原子写出一个 json 记录, 集群各节点之间不共享数据库锁
+                   collect: 将某批次的依赖图与 json 记录导入 sqlite 台账 (按 批次/模块/步骤 保存, 可跨批次比较)
+                   report: 按模块汇总耗时/排队等待/资源使用, 输出关键路径与最耗时步骤; -b 与基线批次逐步骤比较
+                   步骤名为 模块/步骤 (如 Exomiser/exomrun, pVAAST/pVAAST2), 由 shell 名去掉家系/分片/区段名得到
+                   排队等待 = 步骤开始时间 - 上游全部结束的时间 (无上游时为批次开始时间)
+      To run : python3 steptrace.py -l ledger.db [-t tracedir] collect|report [options]
+      e.g.:
+            python3 steptrace.py -l odir/telemetry/ledger.db -t odir/telemetry collect -r 20240101120000.1234
+            python3 steptrace.py -l odir/telemetry/ledger.db report -n 10 -b 20231201090000.4321\033[0m
+'''
+
+import os
+import sys
+import re
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import subprocess
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, created REAL, odir TEXT, variants INTEGER, families INTEGER);
+CREATE TABLE IF NOT EXISTS jobs (run TEXT, shell TEXT, module TEXT, step TEXT, memory TEXT, PRIMARY KEY (run,shell));
+CREATE TABLE IF NOT EXISTS edges (run TEXT, upstream TEXT, downstream TEXT, PRIMARY KEY (run,upstream,downstream));
+CREATE TABLE IF NOT EXISTS steps (run TEXT, shell TEXT, module TEXT, step TEXT, memory TEXT, host TEXT,
+                                  start REAL, end REAL, wall REAL, cpu REAL, maxrss INTEGER, rbytes INTEGER, wbytes INTEGER, status INTEGER,
+                                  PRIMARY KEY (run,shell,start));
+'''
+
+def split_job(job):
+    """'shell:mem' -> (shell,mem)"""
+    return tuple(job.rsplit(':',1)) if ':' in job else (job,'1G')
+
+def step_name(shell,labels):
+    """basename of shell without family/shard/region labels; parent directory name when nothing is left"""
+    name = re.sub(r'\.sh$','',os.path.basename(shell))
+    for label in sorted(labels,key=len,reverse=True):
+        name = re.sub(r'(^|[._-]){0}(?=$|[._-])'.format(re.escape(label)),r'\1',name)
+    name = re.sub(r'[._-]{2,}','_',name).strip('._-')
+    return name or os.path.basename(os.path.dirname(shell))
+
+def trace_shell(shell):
+    return '{0}.trace.sh'.format(re.sub(r'\.sh$','',shell))
+
+def instrument(depfile,modules,labels,tracedir,run,python3,variants=0,families=0):
+    """rewrite depfile so that every job runs through its <shell>.trace.sh wrapper
+       modules: {shell:module} of the jobs; jobs not listed belong to 'pipeline'
+       write tracedir/<run>/graph.json for collect
+    """
+    rundir = os.path.join(tracedir,run)
+    if not os.path.exists(os.path.join(rundir,'records')):
+        os.makedirs(os.path.join(rundir,'records'))
+    jobs,edges,lines = {},[],[]
+    with open(depfile) as IN:
+        for line in IN:
+            items = line.split()
+            if not items or items[0].startswith('#'):
+                lines.append(line)
+                continue
+            nodes,previous = [],None
+            for item in items:
+                shell,mem = split_job(item)
+                if shell not in jobs:
+                    module = modules.get(shell,'pipeline')
+                    jobs[shell] = {'module':module,'step':step_name(shell,labels),'memory':mem}
+                    with open(trace_shell(shell),'w') as OUT:
+                        OUT.write('{0} {1} -t {2} run -r {3} -m {4} -n {5} -q {6} -s {7}\n'.format(python3,os.path.abspath(__file__),os.path.abspath(tracedir),run,module,jobs[shell]['step'],mem,shell))
+                nodes.append('{0}:{1}'.format(trace_shell(shell),mem))
+                if previous:
+                    edges.append((previous,shell))
+                previous = shell
+            lines.append('\t'.join(nodes) + '\n')
+    with open(depfile,'w') as OUT:
+        OUT.writelines(lines)
+    with open(os.path.join(rundir,'graph.json'),'w') as OUT:
+        json.dump({'run':run,'created':time.time(),'odir':os.path.dirname(os.path.abspath(tracedir)),'variants':variants,'families':families,'jobs':jobs,'edges':edges},OUT)
+    return rundir
+
+def io_counters():
+    """(rchar,wchar) of this process and its reaped children, None if /proc is unavailable"""
+    try:
+        with open('/proc/self/io') as IN:
+            counters = dict(line.split(': ') for line in IN.read().splitlines())
+        return int(counters['rchar']),int(counters['wchar'])
+    except (IOError,OSError,KeyError,ValueError):
+        return None
+
+def run_step(tracedir,run,module,step,memory,shell):
+    """run sh shell, write one json record and return the exit status"""
+    before = io_counters()
+    start = time.time()
+    child = subprocess.Popen(['sh',shell])
+    _,status,usage = os.wait4(child.pid,0)
+    child.returncode = status
+    end = time.time()
+    after = io_counters()
+    if before and after:
+        rbytes,wbytes = after[0] - before[0],after[1] - before[1]
+    else:
+        rbytes,wbytes = usage.ru_inblock * 512,usage.ru_oublock * 512
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 128 + os.WTERMSIG(status)
+    record = {'run':run,'shell':shell,'module':module,'step':step,'memory':memory,'host':socket.gethostname(),
+              'start':start,'end':end,'wall':end - start,'cpu':usage.ru_utime + usage.ru_stime,
+              'maxrss':usage.ru_maxrss * 1024,'rbytes':rbytes,'wbytes':wbytes,'status':code}
+    recorddir = os.path.join(tracedir,run,'records')
+    if not os.path.exists(recorddir):
+        os.makedirs(recorddir)
+    name = '{0}.{1:.6f}'.format(hashlib.md5(shell.encode()).hexdigest(),start)
+    with open(os.path.join(recorddir,name + '.tmp'),'w') as OUT:
+        json.dump(record,OUT)
+    os.rename(os.path.join(recorddir,name + '.tmp'),os.path.join(recorddir,name + '.json'))
+    return code
+
+class Ledger(object):
+    """sqlite ledger of all collected runs"""
+    def __init__(self,dbfile):
+        if os.path.dirname(dbfile) and not os.path.exists(os.path.dirname(dbfile)):
+            os.makedirs(os.path.dirname(dbfile))
+        self.db = sqlite3.connect(dbfile,timeout=600)
+        self.db.executescript(SCHEMA)
+
+    def collect(self,rundir):
+        """import graph.json and records of one run directory; return number of step records"""
+        with open(os.path.join(rundir,'graph.json')) as IN:
+            graph = json.load(IN)
+        run = graph['run']
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?)',(run,graph['created'],graph['odir'],graph.get('variants',0),graph.get('families',0)))
+            self.db.executemany('INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?)',[(run,shell,i['module'],i['step'],i['memory']) for shell,i in graph['jobs'].items()])
+            self.db.executemany('INSERT OR REPLACE INTO edges VALUES (?,?,?)',[(run,up,down) for up,down in graph['edges']])
+            records = []
+            recorddir = os.path.join(rundir,'records')
+            for name in os.listdir(recorddir) if os.path.isdir(recorddir) else []:
+                if name.endswith('.json'):
+                    with open(os.path.join(recorddir,name)) as IN:
+                        i = json.load(IN)
+                    records.append((i['run'],i['shell'],i['module'],i['step'],i['memory'],i['host'],i['start'],i['end'],i['wall'],i['cpu'],i['maxrss'],i['rbytes'],i['wbytes'],i['status']))
+            self.db.executemany('INSERT OR REPLACE INTO steps VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)',records)
+        return len(records)
+
+    def runs(self):
+        return [i[0] for i in self.db.execute('SELECT run FROM runs ORDER BY created')]
+
+    def last_attempts(self,run):
+        """{shell:step row as dict} of the last attempt of every step"""
+        cursor = self.db.execute('SELECT * FROM steps WHERE run = ? ORDER BY start',(run,))
+        columns = [i[0] for i in cursor.description]
+        return {row[1]:dict(zip(columns,row)) for row in cursor}
+
+    def timeline(self,run):
+        """steps of run with queue wait; return (steps,created,upstream)"""
+        created = self.db.execute('SELECT created FROM runs WHERE run = ?',(run,)).fetchone()[0]
+        steps = self.last_attempts(run)
+        upstream = {}
+        for up,down in self.db.execute('SELECT upstream,downstream FROM edges WHERE run = ?',(run,)):
+            upstream.setdefault(down,[]).append(up)
+        for shell,step in steps.items():
+            ends = [steps[i]['end'] for i in upstream.get(shell,[]) if i in steps]
+            step['ready'] = max(ends) if ends else created
+            step['queue'] = max(0.0,step['start'] - step['ready'])
+        return steps,created,upstream
+
+def critical_path(steps,upstream):
+    """chain of steps ending at the last finished step, each preceded by its latest finishing upstream"""
+    if not steps:
+        return []
+    path = [max(steps,key=lambda i: steps[i]['end'])]
+    while True:
+        ups = [i for i in upstream.get(path[-1],[]) if i in steps]
+        if not ups:
+            break
+        path.append(max(ups,key=lambda i: steps[i]['end']))
+    return path[::-1]
+
+def module_summary(steps):
+    summary = {}
+    for step in steps.values():
+        i = summary.setdefault(step['module'],{'jobs':0,'failed':0,'start':step['start'],'end':step['end'],'wall':0.0,'cpu':0.0,'queue':0.0,'maxqueue':0.0,'maxrss':0,'rbytes':0,'wbytes':0})
+        i['jobs'] += 1
+        i['failed'] += step['status'] != 0
+        i['start'],i['end'] = min(i['start'],step['start']),max(i['end'],step['end'])
+        for key in ('wall','cpu','queue','rbytes','wbytes'):
+            i[key] += step[key]
+        i['maxqueue'] = max(i['maxqueue'],step['queue'])
+        i['maxrss'] = max(i['maxrss'],step['maxrss'])
+    return summary
+
+def step_summary(steps):
+    """{module/step:(count,total wall,max wall,max rss)}"""
+    summary = {}
+    for step in steps.values():
+        key = '{0}/{1}'.format(step['module'],step['step'])
+        count,wall,maxwall,maxrss = summary.get(key,(0,0.0,0.0,0))
+        summary[key] = (count + 1,wall + step['wall'],max(maxwall,step['wall']),max(maxrss,step['maxrss']))
+    return summary
+
+def human_size(size):
+    for unit in ('T','G','M','K'):
+        if size >= 1024 ** ' KMGT'.index(unit):
+            return '{0:.1f}{1}'.format(size / 1024 ** ' KMGT'.index(unit),unit)
+    return str(int(size))
+
+def human_time(seconds):
+    return '{0:d}:{1:02d}:{2:02d}'.format(int(seconds) // 3600,int(seconds) % 3600 // 60,int(seconds) % 60)
+
+def report(ledger,run,top=10,baseline=None,out=sys.stdout):
+    steps,created,upstream = ledger.timeline(run)
+    out.write('run {0}: {1} steps, {2} failed, elapsed {3}\n\n'.format(run,len(steps),len([i for i in steps.values() if i['status'] != 0]),human_time(max([i['end'] for i in steps.values()] or [created]) - created)))
+    out.write('#Module\tJobs\tFailed\tSpan\tWall\tCPU\tQueueWait\tMaxQueueWait\tMaxRSS\tRead\tWrite\n')
+    for module,i in sorted(module_summary(steps).items(),key=lambda x: x[1]['start']):
+        out.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\t{6}\t{7}\t{8}\t{9}\t{10}\n'.format(module,i['jobs'],i['failed'],human_time(i['end'] - i['start']),human_time(i['wall']),human_time(i['cpu']),human_time(i['queue']),human_time(i['maxqueue']),human_size(i['maxrss']),human_size(i['rbytes']),human_size(i['wbytes'])))
+    out.write('\n#CriticalPath\tQueueWait\tWall\tMaxRSS\tShell\n')
+    for shell in critical_path(steps,upstream):
+        i = steps[shell]
+        out.write('{0}/{1}\t{2}\t{3}\t{4}\t{5}\n'.format(i['module'],i['step'],human_time(i['queue']),human_time(i['wall']),human_size(i['maxrss']),shell))
+    current = step_summary(steps)
+    out.write('\n#HotStep\tCount\tWall\tMaxWall\tMaxRSS\n')
+    for key,(count,wall,maxwall,maxrss) in sorted(current.items(),key=lambda x: -x[1][1])[:top]:
+        out.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(key,count,human_time(wall),human_time(maxwall),human_size(maxrss)))
+    if baseline:
+        base = step_summary(ledger.timeline(baseline)[0])
+        out.write('\n#Step\tMeanWall({0})\tMeanWall({1})\tChange\tMaxRSS({0})\tMaxRSS({1})\n'.format(baseline,run))
+        for key in sorted(set(current) | set(base)):
+            if key in current and key in base:
+                before,after = base[key][1] / base[key][0],current[key][1] / current[key][0]
+                change = '{0:+.1f}%'.format((after - before) / before * 100) if before else '.'
+                out.write('{0}\t{1}\t{2}\t{3}\t{4}\t{5}\n'.format(key,human_time(before),human_time(after),change,human_size(base[key][3]),human_size(current[key][3])))
+            else:
+                out.write('{0}\t{1}\t{2}\t.\t.\t.\n'.format(key,'.' if key not in base else human_time(base[key][1] / base[key][0]),'.' if key not in current else human_time(current[key][1] / current[key][0])))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-l','--ledger',help="sqlite ledger",dest='ledger',type=str)
+    parser.add_argument('-t','--tracedir',help="trace directory of json records",dest='tracedir',type=str)
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run',help='run one step and record it')
+    run_parser.add_argument('-r','--run',help="run id",dest='run',type=str,required=True)
+    run_parser.add_argument('-m','--module',help="module",dest='module',type=str,required=True)
+    run_parser.add_argument('-n','--name',help="step name",dest='name',type=str,required=True)
+    run_parser.add_argument('-q','--memory',help="requested memory",dest='memory',type=str,default='.')
+    run_parser.add_argument('-s','--shell',help="step shell",dest='shell',type=str,required=True)
+    collect_parser = subparsers.add_parser('collect',help='import json records into the ledger')
+    collect_parser.add_argument('-r','--run',help="run id [default: all runs under tracedir]",dest='run',type=str)
+    report_parser = subparsers.add_parser('report',help='module summary, critical path and hot steps')
+    report_parser.add_argument('-r','--run',help="run id [default: latest run]",dest='run',type=str)
+    report_parser.add_argument('-b','--baseline',help="baseline run id to compare with",dest='baseline',type=str)
+    report_parser.add_argument('-n','--top',help="number of hot steps [default: 10]",dest='top',type=int,default=10)
+    argv = vars(parser.parse_args())
+
+    if argv['command'] == 'run':
+        exit(run_step(argv['tracedir'],argv['run'],argv['module'],argv['name'],argv['memory'],argv['shell']))
+    if not argv['ledger']:
+        sys.stderr.write('\033[1;31;40msteptrace - ERROR - -l ledger is required for {0}\033[0m\n'.format(argv['command']))
+        exit(1)
+    ledger = Ledger(argv['ledger'])
+    if argv['command'] == 'collect':
+        runs = [argv['run']] if argv['run'] else [i for i in sorted(os.listdir(argv['tracedir'])) if os.path.isfile(os.path.join(argv['tracedir'],i,'graph.json'))]
+        for run in runs:
+            print ('{0}\t{1} step records'.format(run,ledger.collect(os.path.join(argv['tracedir'],run))))
+    elif argv['command'] == 'report':
+        runs = ledger.runs()
+        run = argv['run'] or (runs[-1] if runs else None)
+        if run not in runs or (argv['baseline'] and argv['baseline'] not in runs):
+            sys.stderr.write('\033[1;31;40msteptrace - ERROR - run not found in ledger: {0}\033[0m\n'.format(run if run not in runs else argv['baseline']))
+            exit(1)
+        report(ledger,run,argv['top'],argv['baseline'])
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
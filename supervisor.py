@@ -0,0 +1,403 @@
+#!/usr/bin/python3
+# -*- coding:utf-8 -*-
+####################################################################
+#
+####################################################################
+'''
+\033[1;34;47mUSAGE:
+      Description: 事件驱动的运行监控 (asyncio), 读取 all_dependence.txt 后每个步骤一个协程, 等待上游结束后运行
+                   run: 本机运行 (sh shell) 或以 -s 给出的阻塞式投递命令 (如 "qsub -sync y -l vf={memory} {shell}") 运行, 以退出状态判断成败;
+                        上游失败时下游立即标记为跳过, -f 时任一步骤失败即终止所有运行中的步骤; 内存不足失败的步骤以两倍内存重试一次 (不计入 -r 次数)
+                        每个步骤的状态写入 <状态目录>/status/<md5>.status (pending/running/done/failed/skipped/cancelled 退出状态 时间 shell内容md5 shell),
+                        按模块实时输出 完成/运行/等待/失败/跳过 数目 (同时写入 progress.txt);
+                        run 默认清空状态目录重新运行全部步骤, -R 时断点续跑: 上次已完成且 shell 内容未变的步骤不再运行; -d 时转入后台运行, 日志写入 supervisor.log
+                   attach: 读取状态目录实时显示各模块进度, 直到全部结束或后台监控退出
+                   stop: 终止后台监控, 运行中的步骤标记为 cancelled
+      To run : python3 supervisor.py -o statusdir run|attach|stop [options]
+      e.g.:
+            python3 supervisor.py -o odir/supervisor run -i odir/list/all_dependence.txt -M odir/list/all_dependence.modules -p 32 -m 120G -d
+            python3 supervisor.py -o odir/supervisor run -i odir/list/all_dependence.txt -M odir/list/all_dependence.modules -R
+            python3 supervisor.py -o odir/supervisor attach\033[0m
+'''
+
+import os
+import sys
+import time
+import signal
+import shutil
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import argparse
+from argparse import RawTextHelpFormatter
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(Bin)
+from localmonitor import read_dependence,downstream_of,parse_memory,format_memory,physical_memory,is_oom,error_size
+
+__author__='zhangshouwei'
+__mail__='shouweizhang@genome.cn'
+
+STATES = ('done','running','pending','failed','skipped','cancelled')
+FINAL = ('done','failed','skipped','cancelled')
+
+def job_id(shell):
+    return hashlib.md5(shell.encode()).hexdigest()
+
+def read_modules(file):
+    """{shell:module} of a shell<TAB>module file"""
+    modules = {}
+    if file and os.path.isfile(file):
+        with open(file) as IN:
+            for line in IN:
+                items = line.rstrip('\n').split('\t')
+                if len(items) >= 2:
+                    modules[items[0]] = items[1]
+    return modules
+
+def shell_digest(shell):
+    """md5 of the shell content, '' if missing"""
+    if not os.path.isfile(shell):
+        return ''
+    with open(shell,'rb') as IN:
+        return hashlib.md5(IN.read()).hexdigest()
+
+def read_status(statusdir):
+    """{shell:(state,exit status,shell digest)} of the status files"""
+    status = {}
+    directory = os.path.join(statusdir,'status')
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name.endswith('.status'):
+            with open(os.path.join(directory,name)) as IN:
+                items = IN.read().rstrip('\n').split('\t',4)
+            if len(items) == 5:
+                status[items[4]] = (items[0],items[1],items[3])
+    return status
+
+def read_jobs(statusdir):
+    """[(shell,module)] registered by run"""
+    jobs = []
+    with open(os.path.join(statusdir,'jobs.tsv')) as IN:
+        for line in IN:
+            shell,module = line.rstrip('\n').split('\t')
+            jobs.append((shell,module))
+    return jobs
+
+def progress(jobs,status):
+    """[(module,{state:count})] in job order"""
+    counts = OrderedDict()
+    for shell,module in jobs:
+        state = status.get(shell,('pending',''))[0]
+        counts.setdefault(module,dict((i,0) for i in STATES))[state if state in STATES else 'pending'] += 1
+    return list(counts.items())
+
+def format_progress(counts):
+    return '  '.join('{0} {1}/{2} done, {3} running, {4} pending{5}'.format(module,i['done'],sum(i.values()),i['running'],i['pending'],''.join(', {0} {1}'.format(i[j],j) for j in ('failed','skipped','cancelled') if i[j])) for module,i in counts)
+
+def alive(pid):
+    try:
+        os.kill(pid,0)
+    except OSError:
+        return False
+    return True
+
+def read_pid(statusdir):
+    try:
+        with open(os.path.join(statusdir,'supervisor.pid')) as IN:
+            return int(IN.read().strip())
+    except (IOError,OSError,ValueError):
+        return None
+
+class Supervisor(object):
+    """one coroutine per job of the merged dependence graph"""
+    def __init__(self,jobs,upstream,modules,statusdir,maxjobs,memory,retry=1,submit=None,failfast=False,resume=False):
+        self.jobs = jobs
+        self.upstream = upstream
+        self.downstream = downstream_of(upstream)
+        self.modules = {i:modules.get(i,'pipeline') for i in jobs}
+        self.statusdir = statusdir
+        self.request = {i:parse_memory(jobs[i]) for i in jobs}
+        self.maxjobs = maxjobs
+        self.memory = memory
+        self.retry = retry
+        self.submit = submit
+        self.failfast = failfast
+        self.state = {i:'pending' for i in jobs}
+        self.processes = {}
+        self.waiters = OrderedDict()
+        self.running = 0
+        self.used = 0
+        self.stopping = False
+        self.written = 0
+        self.digests = {}
+        ## 续跑时仅 shell 内容未变的已完成步骤不再运行 ##
+        previous = read_status(statusdir) if resume else {}
+        for shell in jobs:
+            state,status,digest = previous.get(shell,('','',''))
+            if state == 'done' and digest and digest == shell_digest(shell):
+                self.state[shell] = 'done'
+                self.digests[shell] = digest
+        self.counts = OrderedDict()
+        for shell in jobs:
+            self.counts.setdefault(self.modules[shell],dict((i,0) for i in STATES))[self.state[shell]] += 1
+
+    def log(self,message):
+        sys.stdout.write('[{0}] {1}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'),message))
+        sys.stdout.flush()
+
+    def write_progress(self,force=False):
+        ## progress.txt 每秒至多写一次 ##
+        if not force and time.time() - self.written < 1:
+            return
+        self.written = time.time()
+        with open(os.path.join(self.statusdir,'progress.txt'),'w') as OUT:
+            OUT.writelines('{0}\t{1}\n'.format(module,'\t'.join('{0}:{1}'.format(i,j[i]) for i in STATES)) for module,j in self.counts.items())
+
+    def set_state(self,shell,state,status=''):
+        counts = self.counts[self.modules[shell]]
+        counts[self.state[shell]] -= 1
+        counts[state] += 1
+        self.state[shell] = state
+        directory = os.path.join(self.statusdir,'status')
+        name = os.path.join(directory,job_id(shell) + '.status')
+        with open(name + '.tmp','w') as OUT:
+            OUT.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(state,status,time.strftime('%Y-%m-%d %H:%M:%S'),self.digests.get(shell,''),shell))
+        os.rename(name + '.tmp',name)
+        if state != 'pending':
+            self.write_progress()
+            self.log('{0} {1}{2}'.format(state,shell,' (exit status {0})'.format(status) if status not in ('',0) else ''))
+            self.log(format_progress([(self.modules[shell],counts)]))
+
+    def dispatch(self):
+        ## 按就绪顺序分配运行名额, 单个步骤超过总内存时仅在空闲时独占运行 ##
+        granted = []
+        for shell in self.waiters:
+            if self.running >= self.maxjobs:
+                break
+            if self.used + self.request[shell] > self.memory and self.running:
+                continue
+            self.running += 1
+            self.used += self.request[shell]
+            granted.append(shell)
+        for shell in granted:
+            self.waiters.pop(shell).set_result(True)
+
+    async def acquire(self,shell):
+        """wait for a slot; False when stopping"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[shell] = future
+        self.dispatch()
+        return await future
+
+    def release(self,shell):
+        self.running -= 1
+        self.used -= self.request[shell]
+        if not self.stopping:
+            self.dispatch()
+
+    async def execute(self,shell):
+        """run one attempt of shell; return exit status"""
+        directory = os.path.dirname(os.path.abspath(shell))
+        with open('{0}.o'.format(shell),'a') as out, open('{0}.e'.format(shell),'a') as err:
+            if self.submit:
+                command = self.submit.format(shell=shell,memory=format_memory(self.request[shell]))
+                process = await asyncio.create_subprocess_shell(command,stdout=out,stderr=err,cwd=directory,start_new_session=True)
+            else:
+                process = await asyncio.create_subprocess_exec('sh',shell,stdout=out,stderr=err,cwd=directory,start_new_session=True)
+            self.processes[shell] = process
+            try:
+                return await process.wait()
+            finally:
+                del self.processes[shell]
+
+    def skip(self,shell,events):
+        """mark every pending job downstream of shell skipped at once, without waiting for its other upstreams"""
+        stack = [shell]
+        while stack:
+            for i in self.downstream[stack.pop()]:
+                if self.state[i] == 'pending':
+                    self.set_state(i,'cancelled' if self.stopping else 'skipped')
+                    events[i].set()
+                    stack.append(i)
+
+    async def job(self,shell,events):
+        ## 等待所有上游结束; 上游失败时由 skip 立即标记下游 ##
+        for up in self.upstream[shell]:
+            await events[up].wait()
+        if self.state[shell] in FINAL:
+            events[shell].set()
+            return
+        if self.stopping or any(self.state[up] != 'done' for up in self.upstream[shell]):
+            self.set_state(shell,'cancelled' if self.stopping else 'skipped')
+            events[shell].set()
+            return
+        tries,oomretried,status = 0,False,None
+        while True:
+            if self.stopping or not await self.acquire(shell):
+                break
+            if self.stopping:
+                self.release(shell)
+                break
+            self.digests[shell] = shell_digest(shell)
+            offset = error_size(shell)
+            self.set_state(shell,'running')
+            try:
+                status = await self.execute(shell)
+            except Exception as e:
+                self.log('error {0}: {1}'.format(shell,e))
+                status = -1
+            self.release(shell)
+            if status == 0 or self.stopping:
+                break
+            ## 内存不足的重试不计入 -r 重试次数 ##
+            if not oomretried and is_oom(status,shell,offset):
+                oomretried = True
+                self.request[shell] *= 2
+                self.log('retry {0}: out of memory, request {1}'.format(shell,format_memory(self.request[shell])))
+            elif tries < self.retry:
+                tries += 1
+                self.log('retry {0}: exit status {1}'.format(shell,status))
+            else:
+                break
+        if status == 0:
+            self.set_state(shell,'done',0)
+        elif self.stopping:
+            self.set_state(shell,'cancelled')
+        else:
+            self.set_state(shell,'failed',status)
+            if self.failfast:
+                self.stop()
+        events[shell].set()
+        if self.state[shell] != 'done':
+            self.skip(shell,events)
+
+    def stop(self):
+        """cancel every running job; pending jobs end as cancelled"""
+        if self.stopping:
+            return
+        self.stopping = True
+        self.log('stopping: cancel {0} running jobs'.format(len(self.processes)))
+        for process in list(self.processes.values()):
+            try:
+                os.killpg(process.pid,signal.SIGTERM)
+            except OSError:
+                pass
+        for future in self.waiters.values():
+            future.set_result(False)
+        self.waiters.clear()
+
+    async def run(self):
+        """return number of jobs not done"""
+        if not os.path.exists(os.path.join(self.statusdir,'status')):
+            os.makedirs(os.path.join(self.statusdir,'status'))
+        with open(os.path.join(self.statusdir,'jobs.tsv'),'w') as OUT:
+            OUT.writelines('{0}\t{1}\n'.format(i,self.modules[i]) for i in self.jobs)
+        for shell in self.jobs:
+            self.set_state(shell,self.state[shell],0 if self.state[shell] == 'done' else '')
+        events = {i:asyncio.Event() for i in self.jobs}
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM,signal.SIGINT):
+            loop.add_signal_handler(sig,self.stop)
+        await asyncio.gather(*[self.job(i,events) for i in self.jobs])
+        self.write_progress(True)
+        return len([i for i in self.jobs if self.state[i] != 'done'])
+
+def daemonize(logfile):
+    """detach from the terminal, stdout/stderr go to logfile"""
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    log = open(logfile,'a')
+    os.dup2(log.fileno(),sys.stdout.fileno())
+    os.dup2(log.fileno(),sys.stderr.fileno())
+    devnull = open(os.devnull)
+    os.dup2(devnull.fileno(),sys.stdin.fileno())
+
+def attach(statusdir,interval=10):
+    """print module progress until every job is final or the supervisor exits; return number of jobs not done"""
+    last = None
+    while True:
+        jobs,status,pid = read_jobs(statusdir),read_status(statusdir),read_pid(statusdir)
+        counts = progress(jobs,status)
+        line = format_progress(counts)
+        if line != last:
+            sys.stdout.write('[{0}] {1}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'),line))
+            sys.stdout.flush()
+            last = line
+        unfinished = len([i for i,j in jobs if status.get(i,('pending',''))[0] not in FINAL])
+        if not unfinished or not pid or not alive(pid):
+            if unfinished:
+                sys.stderr.write('\033[1;31;40msupervisor - WARNING - supervisor is not running, {0} jobs unfinished; run again to resume\033[0m\n'.format(unfinished))
+            return len([i for i,j in jobs if status.get(i,('pending',''))[0] != 'done'])
+        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=RawTextHelpFormatter,epilog='author:\t{0}\nmail:\t{1}\n'.format(__author__,__mail__))
+    parser.add_argument('-o','--statusdir',help="status directory, e.g. odir/supervisor",dest='statusdir',type=str,required=True)
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run',help='run the dependence graph')
+    run_parser.add_argument('-i','--input',help="dependence file(s), e.g. all_dependence.txt",dest='input',type=str,nargs='+',required=True)
+    run_parser.add_argument('-M','--modules',help="shell<TAB>module file",dest='modules',type=str)
+    run_parser.add_argument('-s','--submit',help="blocking submit command with {shell} and {memory}, e.g. \"qsub -sync y -l vf={memory} {shell}\" [default: run locally]",dest='submit',type=str)
+    run_parser.add_argument('-m','--memory',help="memory budget, e.g. 120G [default: physical memory, unlimited with -s]",dest='memory',type=str)
+    run_parser.add_argument('-p','--processes',help="max parallel jobs [default: cpu count]",dest='processes',type=int,default=os.cpu_count() or 1)
+    run_parser.add_argument('-r','--retry',help="retry times of failed jobs [default: 1]",dest='retry',type=int,default=1)
+    run_parser.add_argument('-f','--failfast',help="cancel all running jobs when one job fails",dest='failfast',action='store_true')
+    run_parser.add_argument('-R','--resume',help="keep jobs done in a previous run of statusdir whose shell is unchanged [default: rerun all]",dest='resume',action='store_true')
+    run_parser.add_argument('-d','--detach',help="run in background, see progress with attach",dest='detach',action='store_true')
+    attach_parser = subparsers.add_parser('attach',help='show live progress of a running supervisor')
+    attach_parser.add_argument('-t','--interval',help="refresh seconds [default: 10]",dest='interval',type=int,default=10)
+    subparsers.add_parser('stop',help='stop a running supervisor')
+    argv = vars(parser.parse_args())
+
+    statusdir = os.path.abspath(argv['statusdir'])
+    if argv['command'] == 'run':
+        pid = read_pid(statusdir)
+        if pid and pid != os.getpid() and alive(pid):
+            sys.stderr.write('\033[1;31;40msupervisor - ERROR - supervisor {0} is already running on {1}, use attach\033[0m\n'.format(pid,statusdir))
+            exit(1)
+        if not argv['resume'] and os.path.exists(os.path.join(statusdir,'status')):
+            shutil.rmtree(os.path.join(statusdir,'status'))
+        if not os.path.exists(statusdir):
+            os.makedirs(statusdir)
+        jobs,upstream = read_dependence(argv['input'])
+        if argv['memory']:
+            memory = parse_memory(argv['memory'])
+        else:
+            memory = float('inf') if argv['submit'] else physical_memory()
+        supervisor = Supervisor(jobs,upstream,read_modules(argv['modules']),statusdir,max(1,argv['processes']),memory,max(0,argv['retry']),argv['submit'],argv['failfast'],argv['resume'])
+        if argv['detach']:
+            print ('\033[1;34;47msupervisor: running in background, log {0}/supervisor.log, progress: python3 {1} -o {0} attach\033[0m'.format(statusdir,os.path.abspath(__file__)))
+            sys.stdout.flush()
+            daemonize(os.path.join(statusdir,'supervisor.log'))
+        with open(os.path.join(statusdir,'supervisor.pid'),'w') as OUT:
+            OUT.write('{0}\n'.format(os.getpid()))
+        try:
+            failed = asyncio.run(supervisor.run())
+        finally:
+            os.remove(os.path.join(statusdir,'supervisor.pid'))
+        if failed:
+            sys.stderr.write('\033[1;31;40msupervisor - ERROR - {0} of {1} jobs failed, skipped or cancelled\033[0m\n'.format(failed,len(jobs)))
+            exit(1)
+        print ('\033[1;34;47msupervisor: all {0} jobs proceed successfully\033[0m'.format(len(jobs)))
+    elif argv['command'] == 'attach':
+        if not os.path.isfile(os.path.join(statusdir,'jobs.tsv')):
+            sys.stderr.write('\033[1;31;40msupervisor - ERROR - no supervisor run in {0}\033[0m\n'.format(statusdir))
+            exit(1)
+        if attach(statusdir,argv['interval']):
+            exit(1)
+    elif argv['command'] == 'stop':
+        pid = read_pid(statusdir)
+        if not pid or not alive(pid):
+            sys.stderr.write('\033[1;31;40msupervisor - ERROR - no running supervisor in {0}\033[0m\n'.format(statusdir))
+            exit(1)
+        os.kill(pid,signal.SIGTERM)
+        print ('supervisor {0} stopped'.format(pid))
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+import pytest
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from afprefilter import build_index,AFIndex,filter_vcf,passes
+
+@pytest.fixture
+def afindex(tmp_path):
+    kg = tmp_path / '1000g.sites.vcf'
+    kg.write_text('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+                  '1\t100\t.\tA\tG,T\t.\tPASS\tAC=3;AF=0.2,0.001\n'
+                  '1\t200\t.\tAT\tA\t.\tPASS\tAF=0.05\n'
+                  '2\t50\t.\tC\tG\t.\tPASS\tDP=3\n'
+                  'X\t10\t.\tG\tA\t.\tPASS\tAF=0.5\n')
+    gnomad = tmp_path / 'gnomad.tsv'
+    gnomad.write_text('chr1\t100\tA\tG\t0.3\nchr1\t100\tA\tG\t0.1\nchr3\t7\tT\tC\t0.0001\n')
+    index = build_index(str(tmp_path / 'afindex'),'hg19',{'1000g':str(kg),'gnomAD':str(gnomad)})
+    return AFIndex(index)
+
+def test_lookup_merges_populations(afindex):
+    ## 同一变异在来源中重复时取最大值 ##
+    assert afindex.lookup('chr1',100,'A','G') == pytest.approx((0.2,0.3))
+    assert afindex.lookup('1',100,'A','T') == pytest.approx((0.001,-1.0))
+    assert afindex.lookup('3',7,'T','C') == pytest.approx((-1.0,0.0001))
+
+def test_lookup_normalises_alleles(afindex):
+    assert afindex.lookup('chr1',200,'AT','A') == pytest.approx((0.05,-1.0))
+    assert afindex.lookup('1',200,'ATT','AT') == pytest.approx((0.05,-1.0))
+
+def test_lookup_absent(afindex):
+    assert afindex.lookup('1',100,'A','C') == (-1.0,-1.0)
+    assert afindex.lookup('2',50,'C','G') == (-1.0,-1.0)
+    assert afindex.lookup('Y',1,'A','G') == (-1.0,-1.0)
+    assert afindex.lookup('X',11,'G','A') == (-1.0,-1.0)
+
+def test_build_index_reused(tmp_path,afindex):
+    index = os.path.join(str(tmp_path / 'afindex'),'hg19.afidx')
+    mtime = os.path.getmtime(index)
+    build_index(str(tmp_path / 'afindex'),'hg19',{'1000g':str(tmp_path / '1000g.sites.vcf'),'gnomAD':str(tmp_path / 'gnomad.tsv')})
+    assert os.path.getmtime(index) == mtime
+
+def test_passes():
+    assert passes((-1.0,-1.0),(0.01,0.01))
+    assert passes((0.2,0.001),(None,0.01))
+    assert not passes((0.2,0.001),(0.01,0.01))
+
+def test_filter_vcf_any_alt(tmp_path,afindex):
+    vcf = tmp_path / 'F1.vcf'
+    vcf.write_text('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+                   'chr1\t100\t.\tA\tG\t.\t.\t.\n'
+                   'chr1\t100\t.\tA\tG,T\t.\t.\t.\n'
+                   'chrX\t10\t.\tG\tA\t.\t.\t.\n'
+                   'chr5\t1\t.\tG\tA\t.\t.\t.\n')
+    strict,loose = str(tmp_path / 'strict.vcf'),str(tmp_path / 'loose.vcf')
+    kept = filter_vcf(afindex,str(vcf),{strict:(0.01,0.01),loose:(1,1)})
+    assert kept == {strict:2,loose:4}
+    with open(strict) as IN:
+        assert [i.split('\t')[4] for i in IN if not i.startswith('#')] == ['G,T','A']
@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from annocache import annovar_key,normal_chrom,split_vcf,merge_result,load_results,cache_files,AnnotationCache
+
+HEADER = '#Chr\tStart\tEnd\tRef\tAlt\tInterVar\tOtherinfo'
+RECORDS = [
+    ['chr1','100','.','A','G','50','PASS','.','GT','0/1'],
+    ['chr1','200','.','AT','A','50','PASS','.','GT','1/1'],
+    ['chrM','300','.','C','T,CA','50','PASS','.','GT','1/2'],
+]
+
+def annotate(miss,result):
+    """fake Intervar_run: one row per alt allele, ANNOVAR coordinates without chr, vcf columns as Otherinfo"""
+    with open(miss) as IN, open(result,'w') as OUT:
+        OUT.write(HEADER + '\n')
+        for line in IN:
+            if line.startswith('#'):
+                continue
+            record = line.rstrip('\n').split('\t')
+            for alt in record[4].split(','):
+                chrom,start,ref,alt = annovar_key(record[0],record[1],record[3],alt)
+                OUT.write('{0}\t{1}\t{1}\t{2}\t{3}\tpathogenic:{4}\t{5}\n'.format(chrom,start,ref,alt,record[1],'\t'.join(record)))
+
+def run(tmp_path,name,records):
+    """split -> fake Intervar_run -> merge -> load; return (result rows,hit records,miss records)"""
+    outdir = tmp_path / name
+    outdir.mkdir()
+    vcf = str(outdir / 'F1.vcf')
+    with open(vcf,'w') as OUT:
+        OUT.write('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n')
+        OUT.writelines('\t'.join(i) + '\n' for i in records)
+    dbfile = str(tmp_path / 'cache.sqlite')
+    miss,hits,new = cache_files(str(outdir),vcf,0)
+    vcf,nhit,nmiss = split_vcf(dbfile,'hg19','v1',vcf,miss,hits)
+    prefix = str(outdir / 'F1')
+    annotate(miss,'{0}.hg19_multianno.txt.intervar'.format(prefix))
+    shell = str(outdir / 'Intervar_run.sh')
+    with open(shell,'w') as OUT:
+        OUT.write('python Intervar.py -i {0} -o {1} -b hg19\n'.format(miss,prefix))
+    merge_result(shell)
+    load_results(dbfile,'hg19','v1',str(outdir),100)
+    with open('{0}.hg19_multianno.txt.intervar'.format(prefix)) as IN:
+        return IN.read().splitlines(),nhit,nmiss
+
+def test_annovar_key_normalisation():
+    assert annovar_key('chr1',100,'A','G') == ('1',100,'A','G')
+    assert annovar_key('1',100,'AT','A') == ('1',101,'T','-')
+    assert annovar_key('chr1',100,'A','AT') == ('1',100,'-','T')
+    assert annovar_key('chr2',100,'ACGT','AGGT') == ('2',101,'C','G')
+    assert annovar_key('chrM',5,'C','T') == annovar_key('MT',5,'C','T') == ('MT',5,'C','T')
+    assert normal_chrom('CHRX') == 'X'
+
+def test_round_trip_hits_equal_full_run(tmp_path):
+    first,nhit,nmiss = run(tmp_path,'first',RECORDS)
+    assert (nhit,nmiss) == (0,3)
+    assert len(first) == 5
+    second,nhit,nmiss = run(tmp_path,'second',RECORDS)
+    assert (nhit,nmiss) == (3,0)
+    assert second == first
+
+def test_partial_hits_keep_record_order(tmp_path):
+    run(tmp_path,'first',[RECORDS[0],RECORDS[2]])
+    ## 新记录夹在两条命中记录之间, 另一条同位点不同 vcf 记录 (基因型不同) 不命中 ##
+    records = [RECORDS[0],RECORDS[1],RECORDS[2],['chr1','100','.','A','G','50','PASS','.','GT','1/1']]
+    rows,nhit,nmiss = run(tmp_path,'second',records)
+    assert (nhit,nmiss) == (2,2)
+    assert [i.split('\t')[1] for i in rows[1:]] == ['100','201','300','300','100']
+    assert rows[1].endswith('GT\t0/1') and rows[-1].endswith('GT\t1/1')
+    ## 与不使用缓存的运行一致 ##
+    (tmp_path / 'fresh').mkdir()
+    assert run(tmp_path / 'fresh','full',records)[0] == rows
+
+def test_readonly_cache_without_file(tmp_path):
+    cache = AnnotationCache(str(tmp_path / 'absent.sqlite'),'hg19','v1',readonly=True)
+    assert cache.lookup([('1',1,'A','G','x')]) == {}
+    assert cache.header() is None
+    assert not os.path.exists(str(tmp_path / 'absent.sqlite'))
+
+def test_purge_only_other_versions(tmp_path):
+    dbfile = str(tmp_path / 'cache.sqlite')
+    AnnotationCache(dbfile,'hg19','v1').store(HEADER,[(('1',1,'A','G','d'),'row1')])
+    AnnotationCache(dbfile,'hg19','v2').store(HEADER,[(('1',1,'A','G','d'),'row2')])
+    ## 打开其他版本不会删除注释 ##
+    assert AnnotationCache(dbfile,'hg19','v1').lookup([('1',1,'A','G','d')]) == {('1',1,'A','G','d'):'row1'}
+    assert AnnotationCache(dbfile,'hg19','v2').invalidate() == 1
+    assert AnnotationCache(dbfile,'hg19','v1').lookup([('1',1,'A','G','d')]) == {}
@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+import time
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from buildcache import BuildCache,module_fingerprint,ini_digest
+
+def write(file,content):
+    with open(file,'w') as OUT:
+        OUT.write(content)
+    return file
+
+def module_tree(tmp_path):
+    codedir = tmp_path / 'InterVar'
+    (codedir / 'bin').mkdir(parents=True)
+    write(str(codedir / 'bin' / 'InterVar_pipeline.py'),'print(1)\n')
+    vcf = write(str(tmp_path / 'F1.vcf'),'#CHROM\n')
+    dataset = write(str(tmp_path / 'vcf2peddataset'),'F1\t{0}\tF1.ped\n'.format(vcf))
+    ini = write(str(tmp_path / 'InterVar.ini'),'[para]\nbuildver = hg19\n\n[memory]\nIntervar_run = 5G\n')
+    return dataset,ini,str(codedir)
+
+def test_fingerprint_ignores_memory_section(tmp_path):
+    dataset,ini,codedir = module_tree(tmp_path)
+    before = module_fingerprint([dataset],ini,codedir,[])
+    write(ini,'[para]\nbuildver = hg19\n\n[memory]\nIntervar_run = 20G\n')
+    assert module_fingerprint([dataset],ini,codedir,[]) == before
+    write(ini,'[para]\nbuildver = hg38\n\n[memory]\nIntervar_run = 20G\n')
+    assert module_fingerprint([dataset],ini,codedir,[]) != before
+
+def test_fingerprint_follows_code_inputs_and_upstream(tmp_path):
+    dataset,ini,codedir = module_tree(tmp_path)
+    before = module_fingerprint([dataset],ini,codedir,['a'])
+    assert module_fingerprint([dataset],ini,codedir,['b']) != before
+    ## pyc 不影响指纹 ##
+    write(os.path.join(codedir,'bin','InterVar_pipeline.pyc'),'x')
+    assert module_fingerprint([dataset],ini,codedir,['a']) == before
+    write(os.path.join(codedir,'bin','InterVar_pipeline.py'),'print(2)\n')
+    changed = module_fingerprint([dataset],ini,codedir,['a'])
+    assert changed != before
+    ## 数据集中引用的 vcf 被改写 ##
+    vcf = str(tmp_path / 'F1.vcf')
+    os.utime(vcf,(time.time() + 10,time.time() + 10))
+    assert module_fingerprint([dataset],ini,codedir,['a']) != changed
+
+def test_ini_digest_missing_file(tmp_path):
+    assert ini_digest(str(tmp_path / 'absent.ini')) == ''
+
+def test_uptodate_seals_results_after_submit(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    finallist = str(tmp_path / 'InterVar.final.list')
+    upstream = write(str(tmp_path / 'up.final.list'),'u\n')
+    assert not cache.uptodate('InterVar','fp',finallist,[upstream])
+    cache.submit('InterVar','fp')
+    ## 结果尚未生成 ##
+    assert not cache.uptodate('InterVar','fp',finallist,[upstream])
+    write(finallist,'F1\tresult\n')
+    assert not cache.uptodate('InterVar','other',finallist,[upstream])
+    assert cache.uptodate('InterVar','fp',finallist,[upstream])
+    assert 'lists' in cache.load('InterVar')
+    assert cache.uptodate('InterVar','fp',finallist,[upstream])
+    write(upstream,'changed\n')
+    assert not cache.uptodate('InterVar','fp',finallist,[upstream])
+
+def test_uptodate_rejects_results_older_than_submit(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    finallist = write(str(tmp_path / 'InterVar.final.list'),'old\n')
+    os.utime(finallist,(time.time() - 100,time.time() - 100))
+    cache.submit('InterVar','fp')
+    assert not cache.uptodate('InterVar','fp',finallist,[])
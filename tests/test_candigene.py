@@ -0,0 +1,74 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+import pytest
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from candigene import integrate,read_methods
+
+INTERVAR = ('#Chr\tStart\tEnd\tRef\tAlt\tRef.Gene\t1000g2015aug_all\tgnomAD_genome_ALL\n'
+            'chr1\t100\t100\tA\tG\tGENE1\t.\t0.001\n'
+            '1\t201\t201\tT\t-\tGENE2\t0.001\t.\n'
+            '1\t300\t300\tC\tT\tGENE3\t0.2\t.\n'
+            '2\t10\t10\tG\tA\tGENE4;GENE5\t.\t.\n'
+            '2\t20\t20\tG\tA\tGENE6\t.\t0.05\n')
+
+def cohort(tmp_path,methods):
+    intervar = tmp_path / 'InterVar.final.list'
+    intervar.write_text(INTERVAR)
+    allmethods = tmp_path / 'allmethods.list'
+    with open(str(allmethods),'w') as OUT:
+        for name,content in methods:
+            if content is None:
+                OUT.write('{0}\t{1}\n'.format(name,tmp_path / 'absent.list'))
+                continue
+            (tmp_path / '{0}.list'.format(name)).write_text(content)
+            OUT.write('{0}\t{1}\n'.format(name,tmp_path / '{0}.list'.format(name)))
+    return str(allmethods),str(intervar)
+
+METHODS = [
+    ## ANNOVAR 坐标, chr 前缀与 InterVar 不同 ##
+    ('CMsiteOnly_Case','Chr\tStart\tEnd\tRef\tAlt\tGene.refGene\nchr1\t100\t100\tA\tG\tGENE1\n1\t300\t300\tC\tT\tGENE3\n'),
+    ## vcf 坐标, 缺失按 ANNOVAR 规则转换 ##
+    ('Exomiser','#CHROM\tPOS\tREF\tALT\tGENE_SYMBOL\nchr1\t200\tAT\tA\tGENE2\nchr1\t100\tA\tG\tGENE1\n'),
+    ## 基因水平 ##
+    ('pVAAST','Gene\tscore\nGENE5\t3.1\nGENE2\t2.0\nGENE6\t1\n'),
+]
+
+def rows(output):
+    with open(output) as IN:
+        return [i.rstrip('\n').split('\t') for i in IN]
+
+def test_join_orders_by_support(tmp_path):
+    allmethods,intervar = cohort(tmp_path,METHODS)
+    output = str(tmp_path / 'Candigene_integration.final.list')
+    counts = integrate(allmethods,intervar,output,minmethod=1)
+    table = rows(output)
+    assert table[0][-2:] == ['MethodCount','Methods']
+    assert [(i[5],i[-2],i[-1]) for i in table[1:]] == [
+        ('GENE1','2','CMsiteOnly_Case,Exomiser'),
+        ('GENE2','2','Exomiser,pVAAST'),
+        ('GENE4;GENE5','1','pVAAST')]
+    assert counts == {2:2,1:1}
+
+def test_minmethod(tmp_path):
+    allmethods,intervar = cohort(tmp_path,METHODS)
+    output = str(tmp_path / 'out.list')
+    assert integrate(allmethods,intervar,output,minmethod=2) == {2:2}
+    assert integrate(allmethods,intervar,output,minmethod=3) == {}
+    assert len(rows(output)) == 1
+
+def test_frequency_thresholds(tmp_path):
+    allmethods,intervar = cohort(tmp_path,METHODS)
+    output = str(tmp_path / 'out.list')
+    integrate(allmethods,intervar,output,minmethod=1,max1000g=0.5,maxgnomAD=0.1)
+    assert [i[5] for i in rows(output)[1:]] == ['GENE1','GENE2','GENE3','GENE4;GENE5','GENE6']
+
+def test_missing_method_exits(tmp_path,capsys):
+    allmethods,intervar = cohort(tmp_path,METHODS + [('FARVAT',None)])
+    with pytest.raises(SystemExit) as error:
+        read_methods(allmethods)
+    assert error.value.code == 1
+    assert 'FARVAT' in capsys.readouterr().err
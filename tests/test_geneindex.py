@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+import pytest
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from geneindex import build_index,GeneIndex,annotate
+
+DISGENET = ('geneId\tgeneSymbol\tDSI\tdiseaseId\tdiseaseName\tscore\n'
+            '7157\tTP53\t0.3\tC0006142\tBreast Carcinoma\t0.4\n'
+            '7157\tTP53\t0.3\tC0085390\tLi-Fraumeni Syndrome\t0.9\n'
+            '672\tBRCA1\t0.4\tC0006142\tBreast Carcinoma\t0.8\n')
+GENE2ENSEMBL = ('#tax_id\tGeneID\tEnsembl_gene_identifier\n'
+                '9606\t7157\tENSG00000141510\n'
+                '9606\t672\tENSG00000012048\n'
+                '10090\t22059\tENSMUSG00000059552\n'
+                '9606\t1000\tENSG00000170558\n')
+
+@pytest.fixture
+def databases(tmp_path):
+    disgenet,gene2ensembl = tmp_path / 'disgenet.tsv',tmp_path / 'gene2ensembl'
+    disgenet.write_text(DISGENET)
+    gene2ensembl.write_text(GENE2ENSEMBL)
+    return str(tmp_path / 'geneindex'),str(disgenet),str(gene2ensembl)
+
+def test_lookup_by_every_key(databases):
+    geneindex = GeneIndex(build_index(*databases))
+    tp53 = geneindex.gene('TP53')
+    assert tp53[:3] == ('7157','TP53',['ENSG00000141510'])
+    ## 按 score 从高到低 ##
+    assert [i[0] for i in tp53[3]] == ['C0085390','C0006142']
+    assert geneindex.gene('7157') == tp53 == geneindex.gene('ENSG00000141510')
+    assert geneindex.gene('1000') == ('1000','',['ENSG00000170558'],[])
+
+def test_lookup_absent(databases):
+    geneindex = GeneIndex(build_index(*databases))
+    assert geneindex.gene('22059') is None
+    assert geneindex.gene('TP5') is None
+    assert geneindex.gene('') is None
+
+def test_rebuild_on_database_change(databases):
+    indexdir,disgenet,gene2ensembl = databases
+    first = build_index(*databases)
+    assert build_index(*databases) == first
+    with open(disgenet,'a') as OUT:
+        OUT.write('672\tBRCA1\t0.4\tC0029925\tOvarian Carcinoma\t0.7\n')
+    os.utime(disgenet,(os.path.getmtime(disgenet) + 10,) * 2)
+    second = build_index(*databases)
+    assert second != first and not os.path.exists(first)
+    assert len(GeneIndex(second).gene('BRCA1')[3]) == 2
+
+def test_annotate(tmp_path,databases):
+    candidate,output = tmp_path / 'candidate.list',str(tmp_path / 'candidate.anno.list')
+    candidate.write_text('Chr\tStart\tRef.Gene\n17\t7577120\tTP53;BRCA1\n1\t1\tNOPE\n')
+    annotate(build_index(*databases),str(candidate),output,top=1)
+    with open(output) as IN:
+        table = [i.rstrip('\n').split('\t') for i in IN]
+    assert table[0][-3:] == ['EntrezID','Ensembl','DisGeNET']
+    assert table[1][-3:] == ['7157,672','ENSG00000141510,ENSG00000012048','Li-Fraumeni Syndrome(C0085390):0.9;Breast Carcinoma(C0006142):0.8']
+    assert table[2][-3:] == ['.','.','.']
@@ -0,0 +1,69 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+import pytest
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from genostore import genotype_code,build_store,GenotypeStore,export
+
+def test_genotype_code():
+    assert [genotype_code(i,1) for i in ('0/0','0/1','1|0','1/1','./.','.','')] == [0,1,1,2,3,3,3]
+    ## 多等位位点按 alt 拆分 ##
+    assert [genotype_code(i,2) for i in ('1/2','2/2','0/1')] == [1,2,0]
+    ## 单倍体 (如男性 X) ##
+    assert [genotype_code(i,1) for i in ('1','0','.')] == [2,0,3]
+
+def write_family(tmp_path,family,samples,ped,header,records):
+    vcf,pedfile = tmp_path / '{0}.vcf'.format(family),tmp_path / '{0}.ped'.format(family)
+    vcf.write_text('##fileformat=VCFv4.2\n{0}#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{1}\n{2}'.format(
+        header,'\t'.join(samples),''.join('{0}\t{1}\t.\t{2}\t{3}\t.\tPASS\t.\tGT\t{4}\n'.format(*i) for i in records)))
+    pedfile.write_text(''.join('{0}\t{1}\n'.format(family,i) for i in ped))
+    return '{0}\t{1}\t{2}\n'.format(family,vcf,pedfile)
+
+@pytest.fixture
+def store(tmp_path):
+    ## F1: 父母正常, 子代患病; F2 的 vcf 没有 ##contig 且染色体顺序与 F1 不同 ##
+    dataset = tmp_path / 'vcf2peddataset'
+    dataset.write_text(
+        write_family(tmp_path,'F1',['F1_fa','F1_mo','F1_ch'],['F1_fa\t0\t0\t1\t1','F1_mo\t0\t0\t2\t1','F1_ch\tF1_fa\tF1_mo\t1\t2'],
+                     '##contig=<ID=1>\n##contig=<ID=2>\n##contig=<ID=X>\n',
+                     [('1',100,'A','G','0/0\t0/1\t0/1'),('1',200,'C','T,G','0/1\t0/1\t1/2'),('2',50,'T','C','0/0\t0/0\t1/1'),('X',10,'G','A','0\t0/1\t1')]) +
+        write_family(tmp_path,'F2',['F2_a','F2_b'],['F2_a\t0\t0\t1\t2','F2_b\t0\t0\t2\t1'],'',
+                     [('X',10,'G','A','1\t0/0'),('1',100,'A','G','0/1\t0/0')]))
+    storedir = str(tmp_path / 'genotype')
+    assert build_store(str(dataset),storedir) == 5
+    assert not os.path.exists(os.path.join(storedir,'tmp'))
+    reader = GenotypeStore(storedir)
+    yield reader
+    reader.close()
+
+def test_build_merges_vcfs(store):
+    ## 按 F1 的 ##contig 顺序归并, 多等位位点拆分为两个变异, 同一位置按等位基因排序 ##
+    assert [store.variant(i) for i in range(store.nvariants)] == [('1',100,'A','G'),('1',200,'C','G'),('1',200,'C','T'),('2',50,'T','C'),('X',10,'G','A')]
+    assert store.chroms == ['1','2','X']
+    assert list(store.region('1:150-250')) == [1,2]
+
+def test_missing_and_haploid(store):
+    table = {store.variant(i):store.genotypes(i) for i in range(store.nvariants)}
+    assert table[('1',100,'A','G')] == [0,1,1,1,0]
+    ## F2 的 vcf 没有该位点, 其样本为缺失 ##
+    assert table[('1',200,'C','T')] == [1,1,1,None,None]
+    assert table[('1',200,'C','G')] == [0,0,1,None,None]
+    assert table[('X',10,'G','A')] == [0,1,2,2,0]
+    assert [i['affected'] for i in store.samples] == [False,False,True,True,False]
+
+def test_segregate(store):
+    dominant = {store.variant(i)[:2]:families for i,families in store.segregating('dominant')}
+    assert dominant == {('1',100):['F2'],('1',200):['F1'],('2',50):['F1'],('X',10):['F2']}
+    recessive = {store.variant(i)[:2]:families for i,families in store.segregating('recessive')}
+    assert recessive == {('2',50):['F1'],('X',10):['F1','F2']}
+    assert [store.variant(i)[:2] for i,families in store.segregating('recessive',minfamily=2)] == [('X',10)]
+    assert list(store.segregating('recessive',families=['F2'],region='1')) == []
+
+def test_export_table(tmp_path,store):
+    output = str(tmp_path / 'F2.tsv')
+    assert export(store,output,'table',samples=['F2'],region='X:1-100') == 1
+    with open(output) as IN:
+        assert IN.read().splitlines() == ['#Chr\tPos\tRef\tAlt\tF2_a\tF2_b','X\t10\tG\tA\t2\t0']
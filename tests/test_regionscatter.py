@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+import io
+import os
+import sys
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from regionscatter import gene_blocks,make_regions,genome_wide_options,outside_records,scatter_dataset,slice_dependence,OUTSIDE
+from localmonitor import read_dependence
+
+GFF = ''.join('{0}\t.\tgene\t{1}\t{2}\t.\t+\t.\tID={3}\n'.format(*i) for i in [
+    ('chr1',100,500,'A'),('chr1',400,900,'B'),('chr1',5000,6000,'C'),('chr1',20000,21000,'D'),('chr2',10,20,'E')])
+
+def blocks(tmp_path):
+    gff = tmp_path / 'genes.gff3'
+    gff.write_text('##gff-version 3\n' + GFF + 'chr1\t.\tmRNA\t1\t99999\t.\t+\t.\tID=x\n')
+    return gene_blocks(str(gff))
+
+def test_gene_blocks_merge_overlaps(tmp_path):
+    assert blocks(tmp_path) == {'chr1':[(100,900),(5000,6000),(20000,21000)],'chr2':[(10,20)]}
+
+def test_make_regions_chrom(tmp_path):
+    assert make_regions(blocks(tmp_path)) == [('chr1','chr1'),('chr2','chr2')]
+
+def test_make_regions_windows_pack_whole_blocks(tmp_path):
+    regions = make_regions(blocks(tmp_path),'window',10000)
+    assert regions == [('chr1_100_6000','chr1:100-6000'),('chr1_20000_21000','chr1:20000-21000'),('chr2_10_20','chr2:10-20')]
+
+def test_genome_wide_options():
+    options = [('pVAASTgw','1'),('fdr','0.05'),('Bonferroni','yes'),('qvalue','no'),('correction','')]
+    assert genome_wide_options(options) == ['fdr','Bonferroni']
+
+def test_outside_records_by_pos(tmp_path):
+    vcf = tmp_path / 'in.vcf'
+    ## 第一个 indel 起点在区段前, 跨入区段仍属于区段外 ##
+    vcf.write_text('#CHROM\tPOS\tID\tREF\tALT\n'
+                   'chr1\t95\t.\tAAAAAAAAAA\tA\n'
+                   'chr1\t100\t.\tA\tG\n'
+                   'chr1\t3000\t.\tA\tG\n'
+                   'chr2\t5\t.\tA\tG\n'
+                   'chr3\t1\t.\tA\tG\n')
+    OUT = io.StringIO()
+    outside_records(str(vcf),[('chr1_100_900','chr1:100-900'),('chr2','chr2')],OUT)
+    assert [i.split('\t')[1] for i in OUT.getvalue().splitlines()[1:]] == ['95','3000','1']
+
+def test_slice_dependence(tmp_path):
+    regiondeps = {}
+    for name in ('chr1',OUTSIDE):
+        regiondeps[name] = str(tmp_path / '{0}.txt'.format(name))
+        with open(regiondeps[name],'w') as OUT:
+            OUT.write('/{0}/prepedvcf.sh:2G\t/{0}/farvat.sh:4G\n'.format(name))
+    scattered = {i:('{0}/vcf2peddataset'.format(i),'/{0}/slice.sh'.format(i)) for i in regiondeps}
+    output = str(tmp_path / 'FARVAT_dependence.txt')
+    slice_dependence(output,'/input.sh',scattered,regiondeps)
+    jobs,upstream = read_dependence([output])
+    assert upstream['/chr1/slice.sh'] == {'/input.sh'}
+    assert upstream['/chr1/prepedvcf.sh'] == {'/chr1/slice.sh'}
+    assert upstream['/{0}/prepedvcf.sh'.format(OUTSIDE)] == {'/{0}/slice.sh'.format(OUTSIDE)}
+    assert '/chr1/farvat.sh' not in jobs
+
+def test_scatter_dataset_window_slices_filter_pos(tmp_path):
+    dataset = tmp_path / 'vcf2peddataset'
+    dataset.write_text('F1\t/data/F1.vcf.gz\t/data/F1.ped\n')
+    scattered,prepare = scatter_dataset(str(dataset),[('chr1_100_900','chr1:100-900')],str(tmp_path / 'scatter'),'bgzip','tabix',outside='regionscatter -g g')
+    assert list(scattered) == ['chr1_100_900',OUTSIDE]
+    with open(scattered['chr1_100_900'][1]) as IN:
+        assert '($2 >= 100 && $2 <= 900)' in IN.read()
+    with open(scattered['chr1_100_900'][0]) as IN:
+        assert IN.read() == 'F1\t{0}\t/data/F1.ped\n'.format(os.path.join(str(tmp_path / 'scatter'),'chr1_100_900','0.chr1_100_900.vcf.gz'))
+    with open(prepare) as IN:
+        assert '[ -e /data/F1.vcf.gz.tbi ] || tabix -p vcf /data/F1.vcf.gz' in IN.read()
@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+
+import pytest
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from shardjob import gather,split_dataset,dependence_ends,gather_dependence
+
+def lines(file):
+    with open(file) as IN:
+        return IN.read().splitlines()
+
+def test_gather_keeps_shared_header_once(tmp_path):
+    a,b = tmp_path / 'a.list',tmp_path / 'b.list'
+    a.write_text('Chr\tStart\nchr1\t10\n')
+    b.write_text('Chr\tStart\nchr2\t20\n')
+    output = str(tmp_path / 'out.list')
+    gather([str(a),str(b)],output)
+    assert lines(output) == ['Chr\tStart','chr1\t10','chr2\t20']
+
+def test_gather_header_with_empty_shards(tmp_path):
+    ## 没有通过过滤的家系结果为空, 不影响表头判断 ##
+    empty,a,b = tmp_path / 'empty.list',tmp_path / 'a.list',tmp_path / 'b.list'
+    empty.write_text('')
+    a.write_text('Chr\tStart\nchr1\t10\n')
+    b.write_text('Chr\tStart\nchr2\t20\n')
+    output = str(tmp_path / 'out.list')
+    gather([str(empty),str(a),str(empty),str(b)],output)
+    assert lines(output) == ['Chr\tStart','chr1\t10','chr2\t20']
+
+def test_gather_without_header(tmp_path):
+    a,b = tmp_path / 'a.list',tmp_path / 'b.list'
+    a.write_text('F1\tx\n')
+    b.write_text('F2\ty\n')
+    output = str(tmp_path / 'out.list')
+    gather([str(b),str(a)],output)
+    assert lines(output) == ['F2\ty','F1\tx']
+
+def test_gather_missing_shard_exits(tmp_path):
+    a = tmp_path / 'a.list'
+    a.write_text('F1\tx\n')
+    with pytest.raises(SystemExit) as error:
+        gather([str(a),str(tmp_path / 'absent.list')],str(tmp_path / 'out.list'))
+    assert error.value.code == 1
+    assert not os.path.exists(str(tmp_path / 'out.list'))
+
+def test_split_dataset_unique_names(tmp_path):
+    dataset,hpo = tmp_path / 'vcf2peddataset',tmp_path / 'familyhpo'
+    dataset.write_text('#family\tvcf\tped\nF/1\ta.vcf\ta.ped\nF_1\tb.vcf\tb.ped\nF2\tc.vcf\tc.ped\n')
+    hpo.write_text('F_1\tHP:0001250\n')
+    shards = split_dataset(str(dataset),str(hpo),str(tmp_path / 'shard'))
+    assert list(shards) == ['F_1','F_1_2','F2']
+    assert lines(shards['F_1'][0]) == ['#family\tvcf\tped','F/1\ta.vcf\ta.ped']
+    assert lines(shards['F_1_2'][1]) == ['F_1\tHP:0001250']
+    assert lines(shards['F_1'][1]) == []
+
+def test_split_dataset_batches(tmp_path):
+    dataset = tmp_path / 'vcf2peddataset'
+    dataset.write_text(''.join('F{0}\t{0}.vcf\t{0}.ped\n'.format(i) for i in range(5)))
+    shards = split_dataset(str(dataset),None,str(tmp_path / 'shard'),batch=2)
+    assert list(shards) == ['batch0001','batch0002','batch0003']
+    assert [i.split()[0] for i in lines(shards['batch0003'][0])] == ['F4']
+
+def test_gather_dependence_hangs_on_sinks(tmp_path):
+    dep1,dep2 = tmp_path / 's1.txt',tmp_path / 's2.txt'
+    dep1.write_text('/s1/a.sh:1G\t/s1/b.sh:1G\n')
+    dep2.write_text('/s2/a.sh:1G\n')
+    output = str(tmp_path / 'InterVar_dependence.txt')
+    job = gather_dependence('InterVar',[str(dep1),str(dep2)],['/s1','/s2'],str(tmp_path),str(tmp_path),'python3',output)
+    sources,sinks = dependence_ends(output)
+    assert sources == ['/s1/a.sh:1G','/s2/a.sh:1G']
+    assert sinks == [job]
+    assert '/s2/list/InterVar.final.list' in (tmp_path / 'InterVar_gather.sh').read_text()
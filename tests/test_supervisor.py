@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+import os
+import sys
+import asyncio
+
+Bin=os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.dirname(Bin))
+from supervisor import Supervisor,read_status
+from localmonitor import read_dependence
+
+def graph(tmp_path,scripts,edges):
+    """write one shell per step (each appends its name to runs.txt) and the dependence file; return (jobs,upstream,{name:shell})"""
+    shells = {}
+    for name,body in scripts.items():
+        shells[name] = str(tmp_path / '{0}.sh'.format(name))
+        with open(shells[name],'w') as OUT:
+            OUT.write('echo {0} >> {1}\n{2}\n'.format(name,tmp_path / 'runs.txt',body))
+    dependence = tmp_path / 'all_dependence.txt'
+    dependence.write_text(''.join('{0}:1G\t{1}:1G\n'.format(shells[i],shells[j]) for i,j in edges))
+    jobs,upstream = read_dependence([str(dependence)])
+    return jobs,upstream,shells
+
+def supervise(tmp_path,jobs,upstream,resume=False,retry=0,failfast=False):
+    supervisor = Supervisor(jobs,upstream,{},str(tmp_path / 'supervisor'),2,8 * 1024 ** 3,retry=retry,failfast=failfast,resume=resume)
+    remaining = asyncio.run(supervisor.run())
+    states = {os.path.basename(i)[:-3]:j for i,j in supervisor.state.items()}
+    return remaining,states
+
+def runs(tmp_path):
+    with open(str(tmp_path / 'runs.txt')) as IN:
+        runs = IN.read().split()
+    os.remove(str(tmp_path / 'runs.txt'))
+    return sorted(runs)
+
+EDGES = [('a','b'),('b','c'),('c','d'),('a','e')]
+
+def test_failure_skips_downstream(tmp_path):
+    jobs,upstream,shells = graph(tmp_path,{'a':'true','b':'exit 3','c':'true','d':'true','e':'true'},EDGES)
+    remaining,states = supervise(tmp_path,jobs,upstream)
+    assert remaining == 3
+    assert states == {'a':'done','b':'failed','c':'skipped','d':'skipped','e':'done'}
+    assert runs(tmp_path) == ['a','b','e']
+    status = read_status(str(tmp_path / 'supervisor'))
+    assert status[shells['b']][:2] == ('failed','3')
+    assert status[shells['d']][0] == 'skipped'
+
+def test_resume_runs_only_unfinished_and_changed(tmp_path):
+    jobs,upstream,shells = graph(tmp_path,{'a':'true','b':'exit 3','c':'true','d':'true','e':'true'},EDGES)
+    supervise(tmp_path,jobs,upstream)
+    runs(tmp_path)
+    ## 修复 b 后续跑: a/e 不再运行 ##
+    graph(tmp_path,{'a':'true','b':'true','c':'true','d':'true','e':'true'},EDGES)
+    remaining,states = supervise(tmp_path,jobs,upstream,resume=True)
+    assert remaining == 0
+    assert runs(tmp_path) == ['b','c','d']
+    ## shell 内容改变的已完成步骤重新运行 ##
+    with open(shells['e'],'a') as OUT:
+        OUT.write('true\n')
+    remaining,states = supervise(tmp_path,jobs,upstream,resume=True)
+    assert remaining == 0
+    assert runs(tmp_path) == ['e']
+
+def test_without_resume_runs_everything(tmp_path):
+    jobs,upstream,shells = graph(tmp_path,{i:'true' for i in 'abcde'},EDGES)
+    supervise(tmp_path,jobs,upstream)
+    runs(tmp_path)
+    supervise(tmp_path,jobs,upstream)
+    assert runs(tmp_path) == ['a','b','c','d','e']
+
+def test_oom_retry_not_counted(tmp_path):
+    ## 第一次内存不足, 第二次普通失败, 第三次成功: -r 1 足够 ##
+    counter = tmp_path / 'count'
+    body = ('n=$(cat {0} 2>/dev/null || echo 0); echo $((n + 1)) > {0}\n'
+            '[ $n -eq 0 ] && {{ echo "java.lang.OutOfMemoryError: Java heap space" >&2; exit 1; }}\n'
+            '[ $n -eq 1 ] && exit 2\n'
+            'exit 0').format(counter)
+    jobs,upstream,shells = graph(tmp_path,{'a':body,'b':'true'},[('a','b')])
+    remaining,states = supervise(tmp_path,jobs,upstream,retry=1)
+    assert remaining == 0
+    assert counter.read_text().strip() == '3'
+
+def test_failfast_cancels_pending(tmp_path):
+    jobs,upstream,shells = graph(tmp_path,{'a':'exit 1','b':'true','e':'true'},[('a','b'),('e','b')])
+    remaining,states = supervise(tmp_path,jobs,upstream,failfast=True)
+    assert states['a'] == 'failed'
+    assert states['b'] in ('skipped','cancelled')
+    assert remaining >= 2